@@ -0,0 +1,7 @@
+"""Synthetic merchant/edge dataset generator (the dataset_generation.ipynb phases as a package)
+
+    python -m datagen --merchants 1000000 --out data/ --format csv npy
+"""
+from .generator import CHUNK_ROWS, EDGE_COLUMNS, MERCHANT_COLUMNS, generate
+
+__all__ = ['CHUNK_ROWS', 'EDGE_COLUMNS', 'MERCHANT_COLUMNS', 'generate']
@@ -0,0 +1,40 @@
+import argparse
+import json
+import os
+
+from .embeddings import METHODS
+from .generator import CHUNK_ROWS, generate
+from .writers import FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m datagen',
+        description='Generate the synthetic merchants and merchant_edges datasets')
+    parser.add_argument('--merchants', type=int, default=100_000)
+    parser.add_argument('--fraud-rate', type=float, default=0.11)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='.', help='output directory')
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=['csv'], dest='formats',
+                        help='csv: merchant_synthetic_100k_phase6.csv + merchant_edges.csv; '
+                             'npy: one .npy per column under columnar/; parquet: columnar/*.parquet (needs pyarrow)')
+    parser.add_argument('--embeddings', choices=METHODS, default='node2vec',
+                        help="node2vec as in the notebook, 'walks' for the same on the ML service's "
+                             "walk engine, or 'clustered' for a fast stand-in")
+    parser.add_argument('--workers', type=int, help='processes generating chunks (default: all CPUs)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='rows per chunk; part of the dataset definition together with the seed')
+    args = parser.parse_args()
+
+    try:
+        stats = generate(args.out, args.merchants, seed=args.seed, fraud_rate=args.fraud_rate, formats=args.formats,
+                         workers=args.workers, chunk_rows=args.chunk_rows, embedding_method=args.embeddings)
+    except RuntimeError as e:
+        parser.error(str(e))
+    with open(os.path.join(args.out, 'dataset.json'), 'w') as f:
+        json.dump(stats, f, indent=2)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
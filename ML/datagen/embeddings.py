@@ -0,0 +1,98 @@
+"""Phase 6: merchant embeddings (emb_0..emb_15)"""
+import os
+import sys
+
+import numpy as np
+
+from .phases import noise_edges, phase_rng
+
+
+EMBEDDING_DIM = 16
+METHODS = ('node2vec', 'walks', 'clustered')
+
+# The ML service's random-walk engine, used by the 'walks' method
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', '..', 'backend', 'services', 'python-ml-service')
+
+
+def require_method(method):
+    """Fail early if an embedding method is unknown or its optional dependency is missing"""
+    if method not in METHODS:
+        raise ValueError(f"Unknown embedding method: {method}")
+    if method == 'node2vec':
+        try:
+            import networkx  # noqa: F401
+            import node2vec  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError(f"node2vec embeddings need the node2vec package ({e}); "
+                               "use --embeddings walks or clustered instead") from e
+
+
+def node2vec_embeddings(n_merchants, src, dst, weight, seed):
+    """The notebook's node2vec run over ring edges plus noise edges
+
+    Needs the optional node2vec and networkx packages and is single-threaded
+    Python; meant for datasets up to a few hundred thousand merchants.
+    """
+    import networkx as nx
+    from node2vec import Node2Vec
+
+    src, dst, weight = graph_edges(n_merchants, src, dst, weight, seed)
+    graph = nx.Graph()
+    graph.add_nodes_from(f'M_{i}' for i in range(n_merchants))
+    graph.add_weighted_edges_from(
+        (f'M_{a}', f'M_{b}', int(w)) for a, b, w in zip(src.tolist(), dst.tolist(), weight.tolist()))
+
+    node2vec = Node2Vec(graph, dimensions=EMBEDDING_DIM, walk_length=10, num_walks=5,
+                        p=1.0, q=1.0, workers=1, quiet=True, seed=seed)
+    model = node2vec.fit(window=5, min_count=1, batch_words=4, epochs=1)
+    return np.array([model.wv[f'M_{i}'] for i in range(n_merchants)], dtype=np.float32)
+
+
+def graph_edges(n_merchants, src, dst, weight, seed):
+    """Ring edges plus the notebook's noise edges, as the embedding graph"""
+    noise_src, noise_dst, noise_weight = noise_edges(n_merchants, seed)
+    return (np.concatenate([src, noise_src]), np.concatenate([dst, noise_dst]),
+            np.concatenate([weight, noise_weight]))
+
+
+def walk_embeddings(n_merchants, src, dst, weight, seed):
+    """The notebook's node2vec settings on the ML service's NumPy walk engine
+
+    Same walks and skip-gram model as node2vec_embeddings without the
+    optional packages. Trained in one process, as parallel training is not
+    reproducible from the seed.
+    """
+    if SERVICE_DIR not in sys.path:
+        sys.path.insert(0, SERVICE_DIR)
+    from node_embeddings import WalkGraph, train_embeddings
+
+    graph = WalkGraph.from_edges(n_merchants, *graph_edges(n_merchants, src, dst, weight, seed))
+    vectors, _ = train_embeddings(graph, dim=EMBEDDING_DIM, walk_length=10, num_walks=5, window=5, seed=seed,
+                                  workers=1)
+    return vectors
+
+
+def clustered_embeddings(ring_of, seed):
+    """Fast stand-in for node2vec: ring members scattered around a per-ring centroid
+
+    Reproduces what the similarity search relies on (members of a ring are
+    close to each other, everyone else is spread out) without walking the
+    graph, so it works at any size.
+    """
+    rng = phase_rng(seed, 6, 0)
+    n_rings = int(ring_of.max()) + 1 if len(ring_of) else 0
+    centroids = rng.normal(0, 1, (n_rings, EMBEDDING_DIM)).astype(np.float32)
+    embeddings = rng.normal(0, 1, (len(ring_of), EMBEDDING_DIM)).astype(np.float32)
+    in_ring = ring_of >= 0
+    embeddings[in_ring] = centroids[ring_of[in_ring]] + np.float32(0.35) * embeddings[in_ring]
+    return embeddings
+
+
+def embeddings(method, ring_of, src, dst, weight, seed):
+    """(n_merchants, EMBEDDING_DIM) float32 embeddings by the named method"""
+    if method == 'node2vec':
+        return node2vec_embeddings(len(ring_of), src, dst, weight, seed)
+    if method == 'walks':
+        return walk_embeddings(len(ring_of), src, dst, weight, seed)
+    return clustered_embeddings(ring_of, seed)
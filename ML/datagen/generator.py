@@ -0,0 +1,201 @@
+"""Dataset generation: whole-dataset phases in the parent, chunks in a process pool"""
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import phases, writers
+from .embeddings import EMBEDDING_DIM, embeddings, require_method
+
+
+# Rows per chunk. Chunk boundaries seed the per-chunk generators, so the
+# output depends on this value but not on the number of workers.
+CHUNK_ROWS = 250_000
+
+EMBEDDING_COLUMNS = [f'emb_{i}' for i in range(EMBEDDING_DIM)]
+
+# Column order of merchant_synthetic_100k_phase6.csv
+MERCHANT_COLUMNS = [
+    'merchant_id', 'is_fraud', 'merchant_registration_date', 'merchant_category', 'business_city',
+    'merchant_tier', 'is_kyc_verified', 'pan_hash', 'device_id_hash', 'ip_hash', 'total_txns_90d',
+    'avg_txn_value', 'chargeback_rate', 'refund_ratio', 'merchant_age_days', 'total_txns_30d',
+    'total_txns_7d', 'avg_txn_value_30d', 'median_txn_value_90d', 'std_txn_value_90d',
+    'min_txn_value_30d', 'max_txn_value_30d', 'pct_high_value_txns', 'high_value_txns_90d',
+    'high_value_txns_30d', 'shared_pan_count', 'shared_device_count', 'shared_ip_count', 'phone_hash',
+    'email_hash', 'pos_terminal_id_hash', 'shared_phone_count', 'shared_email_count',
+    'shared_pos_terminal_count'
+] + EMBEDDING_COLUMNS
+
+EDGE_COLUMNS = ['merchant_A', 'merchant_B', 'weight', 'reason']
+
+
+def build_state(n_merchants, seed, fraud_rate, embedding_method):
+    """Run the whole-dataset phases; returns (per-merchant arrays, ring edges, ring sizes)"""
+    is_fraud = phases.labels(n_merchants, fraud_rate, seed)
+    print(f"  labels: {int(is_fraud.sum()):,} fraud of {n_merchants:,}")
+
+    kind, false_positive = phases.fraud_types(is_fraud, seed)
+    state = {'is_fraud': is_fraud, 'fraud_kind': kind, 'false_positive': false_positive}
+
+    for name, (codes, numbers) in phases.identifiers(is_fraud, seed).items():
+        state[f'{name}.codes'] = codes
+        state[f'{name}.numbers'] = numbers
+        state[phases.SHARED_COUNT_COLUMNS[name]] = phases.shared_counts(name, codes, numbers)
+    print("  identifiers and shared counts assigned")
+
+    ring_of, src, dst, reason = phases.rings(is_fraud, seed)
+    ring_sizes = np.bincount(ring_of[ring_of >= 0])
+    print(f"  {len(ring_sizes):,} fraud rings, {len(src):,} edges")
+
+    started = time.time()
+    state['embeddings'] = embeddings(embedding_method, ring_of, src, dst, phases.EDGE_WEIGHTS[reason], seed)
+    print(f"  {embedding_method} embeddings in {time.time() - started:.1f}s")
+    return state, (src, dst, reason), ring_sizes
+
+
+def save_state(work_dir, state):
+    for name, values in state.items():
+        np.save(os.path.join(work_dir, f'{name}.npy'), values)
+
+
+def load_state(work_dir):
+    return {name[:-4]: np.load(os.path.join(work_dir, name), mmap_mode='r')
+            for name in os.listdir(work_dir) if name.endswith('.npy')}
+
+
+def merchant_ids(rows):
+    return np.char.add('M_', rows.astype(str)).astype(object)
+
+
+def merchant_frame(state, seed, chunk_no, start, stop):
+    """All merchant columns for rows [start, stop)"""
+    is_fraud = np.asarray(state['is_fraud'][start:stop])
+    columns = {'merchant_id': merchant_ids(np.arange(start, stop)), 'is_fraud': is_fraud}
+    columns.update(phases.profile(phases.phase_rng(seed, 2, chunk_no), is_fraud))
+    columns.update(phases.transactions(phases.phase_rng(seed, 3, chunk_no),
+                                       state['fraud_kind'][start:stop], state['false_positive'][start:stop]))
+    columns.update(phases.activity(phases.phase_rng(seed, 4, chunk_no), is_fraud,
+                                   columns['total_txns_90d'], columns['avg_txn_value']))
+    for name, shared in phases.SHARED_COUNT_COLUMNS.items():
+        columns[name] = phases.identifier_strings(name, state[f'{name}.codes'][start:stop],
+                                                  state[f'{name}.numbers'][start:stop])
+        columns[shared] = np.asarray(state[shared][start:stop])
+    chunk_embeddings = state['embeddings'][start:stop]
+    for i, column in enumerate(EMBEDDING_COLUMNS):
+        columns[column] = chunk_embeddings[:, i]
+    return pd.DataFrame(columns)[MERCHANT_COLUMNS]
+
+
+def npy_dtypes(sample, n_merchants):
+    """Column dtypes for the npy output; strings become fixed-width bytes"""
+    widths = {
+        'merchant_id': len(f'M_{n_merchants - 1}'),
+        'merchant_registration_date': 19,
+        'merchant_category': max(map(len, phases.CATEGORIES)),
+        'business_city': max(map(len, phases.CITIES)),
+        'merchant_tier': max(map(len, phases.TIERS))
+    }
+    for name in phases.SHARED_COUNT_COLUMNS:
+        widths[name] = max(len(prefix) + len(str(phases.pool_size(prefix, n_merchants) - 1))
+                           for prefix in phases.IDENTIFIER_PREFIXES[name])
+    return {column: f'S{widths[column]}' if column in widths else sample[column].dtype
+            for column in MERCHANT_COLUMNS}
+
+
+def write_chunk(task):
+    """Generate one chunk and write it in every requested format (runs in a worker)"""
+    work_dir, out_dir, formats, seed, chunk_no, start, stop = task
+    frame = merchant_frame(load_state(work_dir), seed, chunk_no, start, stop)
+    if 'csv' in formats:
+        writers.write_csv_part(out_dir, 'merchants', chunk_no, frame)
+    if 'npy' in formats:
+        writers.write_npy_rows(out_dir, 'merchants', start, {column: frame[column].to_numpy()
+                                                              for column in MERCHANT_COLUMNS})
+    if 'parquet' in formats:
+        writers.write_parquet_part(out_dir, 'merchants', chunk_no, frame)
+    return stop - start
+
+
+def write_edges(out_dir, formats, n_merchants, src, dst, reason):
+    frame = pd.DataFrame({
+        'merchant_A': merchant_ids(src),
+        'merchant_B': merchant_ids(dst),
+        'weight': phases.EDGE_WEIGHTS[reason].astype(np.int64),
+        'reason': phases.EDGE_REASONS[reason]
+    })
+    if 'csv' in formats:
+        frame.to_csv(os.path.join(out_dir, writers.EDGES_CSV), index=False)
+    if 'npy' in formats:
+        id_dtype = f'S{len(f"M_{n_merchants - 1}")}'
+        dtypes = {'merchant_A': id_dtype, 'merchant_B': id_dtype, 'weight': np.int64, 'reason': 'S6'}
+        writers.create_npy_columns(out_dir, 'edges', dtypes, len(frame))
+        writers.write_npy_rows(out_dir, 'edges', 0, {column: frame[column].to_numpy() for column in EDGE_COLUMNS})
+    if 'parquet' in formats:
+        writers.write_parquet_part(out_dir, 'edges', 0, frame)
+
+
+def generate(out_dir, n_merchants, seed=42, fraud_rate=0.11, formats=('csv',), workers=None,
+             chunk_rows=CHUNK_ROWS, embedding_method='node2vec'):
+    """Generate the merchants and edges datasets into out_dir; returns dataset stats
+
+    workers=None uses every CPU; workers=1 generates the chunks in this process.
+    """
+    for fmt in formats:
+        writers.require_format(fmt)
+    require_method(embedding_method)
+    started = time.time()
+    os.makedirs(out_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='.datagen-', dir=out_dir)
+    try:
+        print(f"Generating {n_merchants:,} merchants (seed {seed})...")
+        state, (src, dst, reason), ring_sizes = build_state(n_merchants, seed, fraud_rate, embedding_method)
+        save_state(work_dir, state)
+        fraud_merchants = int(state['is_fraud'].sum())
+        del state
+        write_edges(out_dir, formats, n_merchants, src, dst, reason)
+
+        bounds = [(chunk_no, start, min(start + chunk_rows, n_merchants))
+                  for chunk_no, start in enumerate(range(0, n_merchants, chunk_rows))]
+        if 'csv' in formats:
+            os.makedirs(os.path.join(out_dir, writers.PARTS_DIR), exist_ok=True)
+        if 'npy' in formats:
+            sample = merchant_frame(load_state(work_dir), seed, 0, 0, 1)
+            writers.create_npy_columns(out_dir, 'merchants', npy_dtypes(sample, n_merchants), n_merchants)
+
+        tasks = [(work_dir, out_dir, formats, seed, chunk_no, start, stop) for chunk_no, start, stop in bounds]
+        done = 0
+        if workers == 1:
+            results = map(write_chunk, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(write_chunk, tasks)
+        try:
+            for rows in results:
+                done += rows
+                print(f"  merchants: {done:,}/{n_merchants:,} ({time.time() - started:.1f}s)")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if 'csv' in formats:
+            writers.concat_csv_parts(out_dir, 'merchants', len(bounds), writers.MERCHANTS_CSV)
+            os.rmdir(os.path.join(out_dir, writers.PARTS_DIR))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'merchants': n_merchants,
+        'fraud_merchants': fraud_merchants,
+        'edges': int(len(src)),
+        'fraud_rings': int(len(ring_sizes)),
+        'largest_ring': int(ring_sizes.max(initial=0)),
+        'seed': seed,
+        'embeddings': embedding_method,
+        'formats': list(formats),
+        'seconds': round(time.time() - started, 2)
+    }
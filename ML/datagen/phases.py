@@ -0,0 +1,324 @@
+"""Vectorized versions of the dataset_generation.ipynb phases
+
+Phases that decide who is what (labels, fraud types, identifier sharing,
+rings) run once over the whole dataset and return compact integer arrays.
+Phases that only draw per-merchant values (profile, transactions, activity)
+run per chunk and can be spread over processes.
+"""
+import numpy as np
+
+
+CATEGORIES = np.array(['kirana', 'delivery', 'marketplace', 'digital_goods', 'services', 'restaurant'])
+CATEGORY_P = [0.35, 0.25, 0.1, 0.08, 0.12, 0.1]
+TIERS = np.array(['micro', 'small', 'medium', 'enterprise'])
+TIER_P = [0.55, 0.25, 0.15, 0.05]
+CITIES = np.array([f'City_{i}' for i in range(1, 201)])
+BASE_DATE = np.datetime64('2024-01-01T00:00:00')
+
+EDGE_REASONS = np.array(['PAN', 'DEVICE', 'IP'])
+EDGE_WEIGHTS = np.array([3, 2, 1], dtype=np.int8)
+RING_REASON_P = [0.5, 0.3, 0.2]
+CHORD_REASON_P = [0.4, 0.4, 0.2]
+
+# Fraud types of phase 3: obvious, moderate, hard to detect
+OBVIOUS, MODERATE, HARD = 0, 1, 2
+
+# Identifier pool sizes at 100k merchants (phase 5); they scale with the
+# number of merchants so sharing stays the same at any size
+POOLS_100K = {
+    'PAN_C_': 180_000, 'PAN_F_': 800, 'PAN_FP_': 50,
+    'DEV_C_': 140_000, 'DEV_F_': 1200, 'DEV_FP_': 80,
+    'IP_C_': 140_000, 'IP_F_': 1500,
+    'PH_': 200_000, 'PH_fraud_': 100,
+    'EM_': 200_000,
+    'POS_': 60_000
+}
+
+# Identifier column -> prefixes it draws from, in code order
+IDENTIFIER_PREFIXES = {
+    'pan_hash': ['PAN_C_', 'PAN_F_', 'PAN_FP_'],
+    'device_id_hash': ['DEV_C_', 'DEV_F_', 'DEV_FP_'],
+    'ip_hash': ['IP_C_', 'IP_F_'],
+    'phone_hash': ['PH_', 'PH_fraud_'],
+    'email_hash': ['EM_'],
+    'pos_terminal_id_hash': ['POS_']
+}
+
+SHARED_COUNT_COLUMNS = {
+    'pan_hash': 'shared_pan_count',
+    'device_id_hash': 'shared_device_count',
+    'ip_hash': 'shared_ip_count',
+    'phone_hash': 'shared_phone_count',
+    'email_hash': 'shared_email_count',
+    'pos_terminal_id_hash': 'shared_pos_terminal_count'
+}
+
+
+def phase_rng(seed, phase, *keys):
+    """Independent generator per phase (and chunk), like the notebook's per-phase reseeding
+
+    Keys are shifted by one: SeedSequence pads with zeros, so [seed, phase]
+    and [seed, phase, 0] would otherwise be the same stream.
+    """
+    return np.random.default_rng([seed, phase, *(key + 1 for key in keys)])
+
+
+def pool_size(prefix, n_merchants):
+    return max(1, round(POOLS_100K[prefix] * n_merchants / 100_000))
+
+
+def uniform(rng, low, high, size=None):
+    """rng.uniform with per-row bounds"""
+    low = np.asarray(low, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    if size is None:
+        size = np.broadcast(low, high).shape
+    return low + (high - low) * rng.random(size)
+
+
+# ---------------------------------------------------------------------------
+# Whole-dataset phases
+# ---------------------------------------------------------------------------
+
+def labels(n_merchants, fraud_rate, seed):
+    """Phase 1: is_fraud (int8), the first n*fraud_rate set and shuffled
+
+    Uses the notebook's generator unchanged, so the labels match it exactly.
+    """
+    is_fraud = np.zeros(n_merchants, dtype=np.int8)
+    is_fraud[:int(n_merchants * fraud_rate)] = 1
+    np.random.default_rng(seed).shuffle(is_fraud)
+    return is_fraud
+
+
+def fraud_types(is_fraud, seed):
+    """Phase 3: fraud type per merchant (-1 for clean) and the 8% of clean made to look suspicious"""
+    rng = phase_rng(seed, 3)
+    fraud_rows = np.flatnonzero(is_fraud)
+    clean_rows = np.flatnonzero(is_fraud == 0)
+
+    kind = np.full(len(is_fraud), -1, dtype=np.int8)
+    shuffled = rng.permutation(fraud_rows)
+    n_obvious = int(len(fraud_rows) * 0.40)
+    n_moderate = int(len(fraud_rows) * 0.35)
+    kind[shuffled[:n_obvious]] = OBVIOUS
+    kind[shuffled[n_obvious:n_obvious + n_moderate]] = MODERATE
+    kind[shuffled[n_obvious + n_moderate:]] = HARD
+
+    false_positive = np.zeros(len(is_fraud), dtype=bool)
+    false_positive[rng.choice(clean_rows, int(len(clean_rows) * 0.08), replace=False)] = True
+    return kind, false_positive
+
+
+def identifiers(is_fraud, seed):
+    """Phase 5: identifier columns as {column: (prefix codes int8, numbers int32)}
+
+    70% of fraud merchants draw PAN/device/IP from small fraud pools (40% of
+    them also share a fraud phone), the rest and all clean merchants draw from
+    the large clean pools, and 5% of clean merchants share PAN/device from
+    small false-positive pools.
+    """
+    rng = phase_rng(seed, 5)
+    n = len(is_fraud)
+    fraud_rows = np.flatnonzero(is_fraud)
+    clean_rows = np.flatnonzero(is_fraud == 0)
+    connected = np.sort(rng.choice(fraud_rows, int(len(fraud_rows) * 0.70), replace=False))
+    isolated = np.setdiff1d(fraud_rows, connected)
+    others = np.concatenate([clean_rows, isolated])
+
+    columns = {name: (np.zeros(n, dtype=np.int8), np.zeros(n, dtype=np.int32)) for name in IDENTIFIER_PREFIXES}
+
+    def assign(name, rows, prefix):
+        codes, numbers = columns[name]
+        codes[rows] = IDENTIFIER_PREFIXES[name].index(prefix)
+        numbers[rows] = rng.integers(0, pool_size(prefix, n), len(rows))
+
+    for name, kind in (('pan_hash', 'PAN'), ('device_id_hash', 'DEV'), ('ip_hash', 'IP')):
+        assign(name, connected, f'{kind}_F_')
+        assign(name, others, f'{kind}_C_')
+    false_positive = rng.choice(clean_rows, int(len(clean_rows) * 0.05), replace=False)
+    assign('pan_hash', false_positive, 'PAN_FP_')
+    assign('device_id_hash', false_positive, 'DEV_FP_')
+
+    shares_phone = rng.random(len(connected)) < 0.4
+    assign('phone_hash', connected[shares_phone], 'PH_fraud_')
+    assign('phone_hash', connected[~shares_phone], 'PH_')
+    assign('phone_hash', others, 'PH_')
+    assign('email_hash', np.arange(n), 'EM_')
+    assign('pos_terminal_id_hash', np.arange(n), 'POS_')
+    return columns
+
+
+def shared_counts(name, codes, numbers):
+    """Number of other merchants with the same identifier value (int32)"""
+    n = len(codes)
+    offsets = np.cumsum([0] + [pool_size(prefix, n) for prefix in IDENTIFIER_PREFIXES[name]])
+    dense = offsets[codes] + numbers
+    counts = np.bincount(dense, minlength=offsets[-1])
+    return (counts[dense] - 1).astype(np.int32)
+
+
+def identifier_strings(name, codes, numbers):
+    """Identifier values as strings, e.g. 'PAN_F_123'"""
+    prefixes = np.array(IDENTIFIER_PREFIXES[name], dtype=object)
+    return prefixes[codes] + numbers.astype(str).astype(object)
+
+
+def rings(is_fraud, seed):
+    """Phase 5: fraud rings and their edges
+
+    All fraud merchants are shuffled into one ring of 40-60 merchants and
+    rings of 5-15 from the rest. Each ring is a cycle; the large ring gets
+    extra (i, i + 2) chords from every third member. Returns
+    (ring_of int32 per merchant, -1 outside rings; src, dst, reason codes).
+    """
+    rng = phase_rng(seed, 5, 0)
+    order = rng.permutation(np.flatnonzero(is_fraud))
+    ring_of = np.full(len(is_fraud), -1, dtype=np.int32)
+    if len(order) < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return ring_of, empty, empty, empty.astype(np.int8)
+
+    large = min(int(rng.integers(40, 61)), len(order))
+    remaining = len(order) - large
+    sizes = rng.integers(5, 16, remaining // 5 + 1)
+    ends = np.cumsum(sizes)
+    sizes = sizes[:np.searchsorted(ends, remaining) + 1]
+    if len(sizes):
+        sizes[-1] -= ends[len(sizes) - 1] - remaining
+    sizes = np.concatenate([[large], sizes[sizes > 0]]).astype(np.int64)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    ring = np.repeat(np.arange(len(sizes)), sizes)
+    ring_of[order] = ring
+    offset = np.arange(len(order)) - starts[ring]
+    following = starts[ring] + (offset + 1) % sizes[ring]
+    single = sizes[ring] == 1
+    cycle_reason = rng.choice(3, size=len(order), p=RING_REASON_P)
+
+    chord_from = np.arange(0, large, 3)
+    chord_to = (chord_from + 2) % large
+    chord_reason = rng.choice(3, size=len(chord_from), p=CHORD_REASON_P)
+
+    # A trailing ring of one merchant has no cycle; the notebook writes a
+    # self-loop for it, which the graph ignores anyway
+    src = np.concatenate([order[~single], order[chord_from]])
+    dst = np.concatenate([order[following[~single]], order[chord_to]])
+    reason = np.concatenate([cycle_reason[~single], chord_reason]).astype(np.int8)
+    return ring_of, src, dst, reason
+
+
+def noise_edges(n_merchants, seed):
+    """Phase 6: random edges (2% of merchants) added to the graph before embedding
+
+    Self-loops are dropped. Returns (src, dst, weight); these edges are not
+    written to merchant_edges.csv.
+    """
+    rng = phase_rng(seed, 6)
+    count = n_merchants // 50
+    src = rng.integers(0, n_merchants, count)
+    dst = rng.integers(0, n_merchants, count)
+    weight = rng.choice(np.array([1, 2, 3], dtype=np.int8), size=count, p=[0.6, 0.3, 0.1])
+    keep = src != dst
+    return src[keep], dst[keep], weight[keep]
+
+
+# ---------------------------------------------------------------------------
+# Per-chunk phases
+# ---------------------------------------------------------------------------
+
+def profile(rng, is_fraud):
+    """Phase 2: registration date, category, city, tier and KYC flag"""
+    n = len(is_fraud)
+    days = rng.integers(0, 1500, n)
+    dates = BASE_DATE - days.astype('timedelta64[D]')
+    return {
+        'merchant_registration_date': np.datetime_as_string(dates, unit='s'),
+        'merchant_category': CATEGORIES[rng.choice(len(CATEGORIES), n, p=CATEGORY_P)],
+        'business_city': CITIES[rng.integers(0, len(CITIES), n)],
+        'merchant_tier': TIERS[rng.choice(len(TIERS), n, p=TIER_P)],
+        # 40% of fraud and 85% of clean merchants are KYC verified
+        'is_kyc_verified': (rng.random(n) < np.where(is_fraud == 1, 0.40, 0.85)).astype(np.float64)
+    }
+
+
+def transactions(rng, kind, false_positive):
+    """Phase 3: 90-day aggregates, shifted by fraud type, false positives and noise"""
+    n = len(kind)
+    total_90d = rng.lognormal(2.4, 1.1, n).astype(np.int64)
+    avg = np.clip(rng.normal(950, 350, n), 10, 200_000).round(2)
+    chargeback = np.round(rng.beta(1.6, 40, n), 4)
+    refund = np.round(rng.beta(1.3, 25, n), 4)
+    age = rng.integers(20, 1200, n)
+
+    fraud = kind >= 0
+    k = np.where(fraud, kind, 0)
+    avg_range = np.array([[1.6, 2.5], [1.2, 1.6], [0.95, 1.25]])[k]
+    cb_range = np.array([[0.15, 0.35], [0.05, 0.15], [0.01, 0.06]])[k]
+    rr_range = np.array([[0.12, 0.28], [0.03, 0.12], [0.01, 0.05]])[k]
+    avg = np.where(fraud, avg * uniform(rng, avg_range[:, 0], avg_range[:, 1]), avg)
+    chargeback = np.where(fraud, chargeback + uniform(rng, cb_range[:, 0], cb_range[:, 1]), chargeback)
+    refund = np.where(fraud, refund + uniform(rng, rr_range[:, 0], rr_range[:, 1]), refund)
+
+    chargeback = np.where(false_positive, chargeback + uniform(rng, 0.08, 0.20, n), chargeback)
+    refund = np.where(false_positive, refund + uniform(rng, 0.06, 0.18, n), refund)
+    avg = np.where(false_positive, avg * uniform(rng, 1.3, 1.9, n), avg)
+
+    noise = rng.random(n) < 0.15
+    chargeback = np.where(noise, chargeback + uniform(rng, -0.02, 0.05, n), chargeback)
+    refund = np.where(noise, refund + uniform(rng, -0.02, 0.04, n), refund)
+    avg = np.where(noise, avg * uniform(rng, 0.85, 1.15, n), avg)
+
+    return {
+        'total_txns_90d': total_90d,
+        'avg_txn_value': avg.clip(10, 200_000),
+        'chargeback_rate': chargeback.clip(0, 1),
+        'refund_ratio': refund.clip(0, 1),
+        'merchant_age_days': age
+    }
+
+
+def activity(rng, is_fraud, total_90d, avg):
+    """Phase 4: 30d/7d activity, value spread and high-value transactions"""
+    n = len(is_fraud)
+    fraud = is_fraud == 1
+
+    # Steady, spiky or declining activity
+    pattern = rng.choice(3, n, p=[0.5, 0.3, 0.2])
+    ratio = np.array([[0.28, 0.38], [0.45, 0.75], [0.10, 0.25]])[pattern]
+    total_30d = np.maximum(0, (total_90d * uniform(rng, ratio[:, 0], ratio[:, 1])).astype(np.int64))
+    total_7d = np.maximum(0, (total_30d * uniform(rng, 0.1, 0.5, n)).astype(np.int64))
+
+    avg_30d = (avg * uniform(rng, 0.75, 1.35, n)).round(2)
+    median_90d = (avg * uniform(rng, 0.4, 1.2, n)).round(2)
+    # Consistent, variable or erratic values
+    consistency = rng.choice(3, n, p=[0.4, 0.4, 0.2])
+    spread = np.array([[0.05, 0.25], [0.25, 0.65], [0.65, 1.5]])[consistency]
+    std_90d = (avg * uniform(rng, spread[:, 0], spread[:, 1])).round(2)
+    min_30d = (avg * uniform(rng, 0.01, 0.45, n)).round(2)
+    max_30d = (avg * uniform(rng, 1.0, 8.0, n)).round(2)
+
+    # 60% of fraud and 12% of clean merchants have many high-value transactions
+    base_pct = rng.beta(0.8, 6, n)
+    boosted = rng.random(n) < np.where(fraud, 0.6, 0.12)
+    boost = np.where(fraud,
+                     np.where(boosted, uniform(rng, 1.5, 3.5, n), uniform(rng, 0.8, 1.2, n)),
+                     np.where(boosted, uniform(rng, 1.8, 4.0, n), 1.0))
+    pct = np.round((base_pct * boost).clip(0, 1), 4)
+
+    # 8% of records have an inconsistent 7-day count
+    inconsistent = rng.random(n) < 0.08
+    jittered = np.clip(total_7d + rng.integers(-5, 8, n), 0, total_30d)
+
+    return {
+        'total_txns_30d': total_30d.astype(np.float64),
+        'total_txns_7d': np.where(inconsistent, jittered, total_7d),
+        'avg_txn_value_30d': avg_30d,
+        'median_txn_value_90d': median_90d,
+        'std_txn_value_90d': std_90d,
+        'min_txn_value_30d': min_30d,
+        'max_txn_value_30d': max_30d,
+        'pct_high_value_txns': pct,
+        'high_value_txns_90d': (total_90d * pct).astype(np.int64),
+        'high_value_txns_30d': (total_30d * pct).astype(np.int64)
+    }
@@ -0,0 +1,83 @@
+"""Output formats: CSV (what the service and SQL loader read), npy columns and Parquet
+
+Every format is written chunk by chunk from the worker that generated the
+chunk; nothing holds the whole table in memory.
+"""
+import os
+import shutil
+
+import numpy as np
+
+
+FORMATS = ('csv', 'npy', 'parquet')
+
+MERCHANTS_CSV = 'merchant_synthetic_100k_phase6.csv'
+EDGES_CSV = 'merchant_edges.csv'
+COLUMNAR_DIR = 'columnar'
+PARTS_DIR = '.parts'
+
+
+def require_format(fmt):
+    """Fail early if an output format's optional dependency is missing"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("parquet output needs the pyarrow package") from e
+
+
+def part_path(out_dir, name, chunk_no, suffix):
+    return os.path.join(out_dir, PARTS_DIR, f'{name}-{chunk_no:05d}.{suffix}')
+
+
+def fixed_width(values):
+    """Strings as a fixed-width bytes array (all generated values are ASCII)"""
+    return np.asarray(values).astype(np.bytes_)
+
+
+def create_npy_columns(out_dir, table, dtypes, n_rows):
+    """Preallocate one full-length .npy file per column, filled in by chunk writers"""
+    directory = os.path.join(out_dir, COLUMNAR_DIR, table)
+    os.makedirs(directory, exist_ok=True)
+    for column, dtype in dtypes.items():
+        np.lib.format.open_memmap(os.path.join(directory, f'{column}.npy'), mode='w+', dtype=dtype, shape=(n_rows,))
+
+
+def write_npy_rows(out_dir, table, start, columns):
+    """Write a chunk's columns into the preallocated .npy files at row offset start"""
+    directory = os.path.join(out_dir, COLUMNAR_DIR, table)
+    for column, values in columns.items():
+        target = np.load(os.path.join(directory, f'{column}.npy'), mmap_mode='r+')
+        if target.dtype.kind == 'S':
+            values = fixed_width(values)
+        target[start:start + len(values)] = values
+        target.flush()
+        del target
+
+
+def write_parquet_part(out_dir, table, chunk_no, frame):
+    """One Parquet file per chunk under columnar/<table>.parquet/, readable as a dataset"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    directory = os.path.join(out_dir, COLUMNAR_DIR, f'{table}.parquet')
+    os.makedirs(directory, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False),
+                   os.path.join(directory, f'part-{chunk_no:05d}.parquet'), compression='zstd')
+
+
+def write_csv_part(out_dir, name, chunk_no, frame):
+    """CSV part of a chunk; only the first part carries the header"""
+    frame.to_csv(part_path(out_dir, name, chunk_no, 'csv'), index=False, header=chunk_no == 0)
+
+
+def concat_csv_parts(out_dir, name, n_chunks, filename):
+    """Join the CSV parts in chunk order into the final file"""
+    with open(os.path.join(out_dir, filename), 'wb') as out:
+        for chunk_no in range(n_chunks):
+            path = part_path(out_dir, name, chunk_no, 'csv')
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, out, 16 << 20)
+            os.unlink(path)
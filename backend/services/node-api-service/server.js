@@ -27,11 +27,40 @@ app.get('/api/health', (req, res) => {
   res.json({ status: 'healthy', service: 'node-api-service' });
 });
 
+// Headers of the ML service's cached fraud-rings responses passed through to the client
+const FRAUD_RINGS_REQUEST_HEADERS = ['if-none-match', 'accept-encoding'];
+const FRAUD_RINGS_RESPONSE_HEADERS = ['etag', 'content-type', 'content-encoding', 'content-length', 'vary', 'cache-control'];
+
 // Get top fraud rings for dashboard
+// The (pre-compressed) body is streamed through as is, and 304 revalidations are passed on
 app.get('/api/dashboard/fraud-rings', async (req, res) => {
   try {
-    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/top-fraud-rings`);
-    res.json(response.data);
+    const headers = {};
+    for (const name of FRAUD_RINGS_REQUEST_HEADERS) {
+      if (req.headers[name]) {
+        headers[name] = req.headers[name];
+      }
+    }
+    
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/top-fraud-rings`, {
+      params: req.query,
+      headers,
+      decompress: false,
+      responseType: 'stream',
+      validateStatus: (status) => status === 200 || status === 304
+    });
+    
+    for (const name of FRAUD_RINGS_RESPONSE_HEADERS) {
+      if (response.headers[name]) {
+        res.set(name, response.headers[name]);
+      }
+    }
+    res.status(response.status);
+    if (response.status === 304) {
+      response.data.resume();
+      return res.end();
+    }
+    response.data.pipe(res);
   } catch (error) {
     console.error('Error fetching fraud rings:', error.message);
     
@@ -77,7 +106,9 @@ app.get('/api/merchant/:merchant_id', async (req, res) => {
   try {
     const { merchant_id } = req.params;
     
-    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/merchant/${merchant_id}`);
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/merchant/${merchant_id}`, {
+      params: req.query
+    });
     
     res.json(response.data);
   } catch (error) {
@@ -91,6 +122,129 @@ app.get('/api/merchant/:merchant_id', async (req, res) => {
   }
 });
 
+// Get the multi-hop neighborhood of a merchant
+app.get('/api/merchant/:merchant_id/neighborhood', async (req, res) => {
+  try {
+    const { merchant_id } = req.params;
+    
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/merchant/${merchant_id}/neighborhood`, {
+      params: req.query
+    });
+    
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching merchant neighborhood:', error.message);
+    
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: 'Failed to fetch merchant neighborhood',
+      details: error.response?.data || error.message
+    });
+  }
+});
+
+// Get the fraud merchants most similar to a merchant, optionally filtered
+app.get('/api/merchant/:merchant_id/similar-frauds', async (req, res) => {
+  try {
+    const { merchant_id } = req.params;
+    
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/merchant/${merchant_id}/similar-frauds`, {
+      params: req.query
+    });
+    
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching similar frauds:', error.message);
+    
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: 'Failed to fetch similar frauds',
+      details: error.response?.data || error.message
+    });
+  }
+});
+
+// Get the fraud ring catalog
+app.get('/api/rings', async (req, res) => {
+  try {
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/rings`, {
+      params: req.query
+    });
+    
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching ring catalog:', error.message);
+    
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: 'Failed to fetch ring catalog',
+      details: error.response?.data || error.message
+    });
+  }
+});
+
+// Get one fraud ring with its statistics
+app.get('/api/rings/:ring_id', async (req, res) => {
+  try {
+    const { ring_id } = req.params;
+    
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/rings/${encodeURIComponent(ring_id)}`, {
+      params: req.query
+    });
+    
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching ring:', error.message);
+    
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: 'Failed to fetch ring',
+      details: error.response?.data || error.message
+    });
+  }
+});
+
+// Get the merchants using an identifier value
+app.get('/api/identifier/:type/:hash', async (req, res) => {
+  try {
+    const { type, hash } = req.params;
+    
+    const response = await axios.get(
+      `${PYTHON_SERVICE_URL}/api/identifier/${encodeURIComponent(type)}/${encodeURIComponent(hash)}`,
+      { params: req.query }
+    );
+    
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching identifier merchants:', error.message);
+    
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: 'Failed to fetch identifier merchants',
+      details: error.response?.data || error.message
+    });
+  }
+});
+
+// Get the merchants with the highest risk scores
+app.get('/api/risk-scores/top', async (req, res) => {
+  try {
+    const response = await axios.get(`${PYTHON_SERVICE_URL}/api/risk-scores/top`, {
+      params: req.query
+    });
+    
+    res.json(response.data);
+  } catch (error) {
+    console.error('Error fetching risk scores:', error.message);
+    
+    res.status(error.response?.status || 500).json({
+      success: false,
+      error: 'Failed to fetch risk scores',
+      details: error.response?.data || error.message
+    });
+  }
+});
+
 // Get analytics summary
 app.get('/api/analytics/summary', async (req, res) => {
   try {
@@ -1,26 +1,90 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
-import networkx as nx
-from sklearn.metrics.pairwise import cosine_similarity
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
+import sys
+import threading
+import gzip
+import hashlib
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g
+
+from merchant_store import MerchantStore
+from merchant_graph import MerchantGraph
+from ring_index import RingIndex
+from identifier_index import IdentifierIndex, SHARED_COUNT_COLUMNS
+from top_rings import TopRingsCache
+from ring_stats import RingStats
+from similarity import FraudSimilarityIndex, top_k
+from serialization import FastJSONProvider, columnar_graph, compress, fast_dumps, negotiate_encoding, use_fast_json
+from fraud_filters import FraudFilterIndex
+from node_embeddings import WalkGraph
+from update_journal import UpdateJournal
+from metrics import span
+import metrics
+import snapshot
+import ingest
+import node_embeddings
+import risk_scores
 
 # Load .env from project root
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '..', '..', '.env'))
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Global variables to store data
-merchants_df = None
+merchant_store = None
+edge_data = None
 graph = None
-embeddings_matrix = None
-merchant_id_to_idx = {}
-fraud_rings = {}
+ring_index = None
+ring_stats = None
+top_rings_cache = None
+similarity_index = None
+fraud_filters = None
+identifiers = None
+data_version = None
+data_source = None
+data_fingerprint = None
+data_ready = False
+
+# Context vectors of the last embedding training (None when the embeddings
+# came from the source data), and the walk graph, rebuilt after graph changes
+embedding_context = None
+walk_graph = None
+
+# Feature scales of the risk score, and cached /api/risk-scores/top rankings
+# (by include_fraud), dropped whenever scores change
+risk_scales = None
+risk_rankings = {}
+
+# Serializes the write endpoints; readers never take it
+update_lock = threading.Lock()
+
+# Live updates shared between server workers (kept in the snapshot directory)
+journal = None
+JOURNAL_FILE = 'updates.jsonl'
+
+# Fields returned for a merchant profile and for graph nodes
+MERCHANT_DETAIL_FIELDS = [
+    'merchant_id', 'is_fraud', 'pan_hash', 'device_id_hash', 'ip_hash',
+    'merchant_tier', 'merchant_category', 'city', 'is_kyc_verified',
+    'total_txns_90d', 'avg_txn_value', 'chargeback_rate', 'refund_ratio',
+    'shared_pan_count', 'shared_device_count', 'shared_ip_count',
+    'risk_score', 'graph_risk'
+]
+RING_NODE_FIELDS = ['merchant_id', 'pan_hash', 'merchant_tier', 'city']
+SIMILAR_FRAUD_FIELDS = ['merchant_id', 'pan_hash', 'merchant_tier', 'city',
+                        'avg_txn_value', 'chargeback_rate']
+RISK_FIELDS = ['merchant_id', 'is_fraud', 'merchant_tier', 'city', 'chargeback_rate',
+               'refund_ratio', 'shared_pan_count', 'risk_score', 'graph_risk']
+IDENTIFIER_FIELDS = ['merchant_id', 'is_fraud', 'merchant_tier', 'merchant_category', 'city', 'risk_score']
 
 # Database connection parameters
 DB_CONFIG = {
@@ -31,6 +95,91 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'postgres')
 }
 
+# Source files for the CSV fallback
+MERCHANTS_CSV = 'merchant_synthetic_100k_phase6.csv'
+EDGES_CSV = 'merchant_edges.csv'
+
+# Directory of the binary snapshot of all derived state (empty disables snapshots)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'ml_snapshot')
+
+# Ring payload cache: the largest rings are pinned, the rest share an LRU
+RING_CACHE_SIZE = int(os.getenv('RING_CACHE_SIZE', '512'))
+RING_PINNED = int(os.getenv('RING_PINNED', '10'))
+
+# Similar-fraud search: 'exact', 'ivf' (clustered approximate search) or
+# 'auto' (ivf once there are at least SIMILARITY_IVF_MIN fraud merchants)
+SIMILARITY_MODE = os.getenv('SIMILARITY_MODE', 'auto')
+SIMILARITY_IVF_MIN = int(os.getenv('SIMILARITY_IVF_MIN', '1000000'))
+SIMILARITY_NPROBE = int(os.getenv('SIMILARITY_NPROBE', '8'))
+
+# Similar-fraud filters: query parameter -> attribute matched exactly, the
+# accepted kyc values, range attributes (min_<column> / max_<column>) and the
+# bound for top_n
+SIMILAR_FRAUD_FILTERS = {'city': 'city', 'tier': 'merchant_tier', 'category': 'merchant_category'}
+SIMILAR_FRAUD_KYC = {'1': 1, 'true': 1, '0': 0, 'false': 0}
+SIMILAR_FRAUD_RANGES = ['avg_txn_value', 'chargeback_rate']
+SIMILAR_FRAUDS_MAX_TOP_N = 100
+
+# Batch endpoints: maximum ids per request and ids resolved per streamed chunk
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', '100000'))
+BATCH_CHUNK_SIZE = 1024
+
+# Bounds for /api/top-fraud-rings query parameters
+TOP_RINGS_MAX_LIMIT = 100
+TOP_RINGS_MAX_NODES = 1000
+TOP_RINGS_MAX_EDGES = 5000
+
+# /api/rings catalog: sort columns, page size bound and central members listed
+# per ring; the filters name a ring statistic or a mix attribute
+RING_SORT_COLUMNS = ['size', 'edge_count', 'density', 'total_txns_90d', 'mean_chargeback_rate']
+RING_MIX_FILTERS = {'city': 'city', 'tier': 'merchant_tier', 'category': 'merchant_category'}
+RINGS_MAX_LIMIT = 100
+RING_CENTRAL_MEMBERS = 5
+
+# Risk scores: label propagation damping (share of a merchant's graph score
+# taken from its neighbors) and the graph score's share of the risk score
+RISK_ALPHA = float(os.getenv('RISK_ALPHA', '0.85'))
+RISK_GRAPH_WEIGHT = float(os.getenv('RISK_GRAPH_WEIGHT', '0.6'))
+RISK_TOP_MAX_LIMIT = 1000
+
+# Edges: 'table' reads merchant_edges, 'identifiers' derives them from shared
+# identifier values. A value shared by up to IDENTIFIER_CLIQUE_MAX merchants
+# connects all of them, a larger group becomes a star around one merchant,
+# and groups of more than IDENTIFIER_MAX_GROUP merchants are skipped (0 keeps all)
+EDGE_SOURCE = os.getenv('EDGE_SOURCE', 'table')
+IDENTIFIER_CLIQUE_MAX = int(os.getenv('IDENTIFIER_CLIQUE_MAX', '8'))
+IDENTIFIER_MAX_GROUP = int(os.getenv('IDENTIFIER_MAX_GROUP', '10000'))
+IDENTIFIER_MAX_LIMIT = 1000
+
+# Bounds for /api/merchant/<id>/neighborhood query parameters
+NEIGHBORHOOD_MAX_HOPS = 4
+NEIGHBORHOOD_MAX_NODES = 2000
+NEIGHBORHOOD_MAX_EDGES = 10000
+
+# node2vec embeddings: full retraining (python app.py --refresh-embeddings)
+# and incremental embedding of new merchants (POST /api/embeddings).
+# EMBED_WORKERS=0 uses every CPU for the retraining; only a single worker
+# gives the same embeddings on every run.
+EMBED_WALK_LENGTH = int(os.getenv('EMBED_WALK_LENGTH', '80'))
+EMBED_NUM_WALKS = int(os.getenv('EMBED_NUM_WALKS', '10'))
+EMBED_WINDOW = int(os.getenv('EMBED_WINDOW', '10'))
+EMBED_P = float(os.getenv('EMBED_P', '1'))
+EMBED_Q = float(os.getenv('EMBED_Q', '1'))
+EMBED_EPOCHS = int(os.getenv('EMBED_EPOCHS', '1'))
+EMBED_WORKERS = int(os.getenv('EMBED_WORKERS', '1'))
+EMBED_SEED = 42
+
+# Sampling profiler: requests slower than PROFILE_SLOW_MS write folded stacks
+# to PROFILE_DIR (0 disables profiling)
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+
+# Response formats for ring views ('objects': one dict per node and edge, as
+# before) and the JSON body size from which responses are compressed
+RESPONSE_FORMATS = ['objects', 'columnar']
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
 # City mapping for India
 CITY_MAPPING = {
     'City_1': 'Mumbai', 'City_2': 'Delhi', 'City_3': 'Bangalore', 
@@ -111,223 +260,685 @@ def get_db_connection():
 
 def load_data():
     """Load merchant data from PostgreSQL and build graph"""
-    global merchants_df, graph, embeddings_matrix, merchant_id_to_idx, fraud_rings
+    global merchant_store, edge_data, data_source, data_fingerprint, data_ready
     
     print("Loading data from PostgreSQL...")
+    start = time.perf_counter()
     
     try:
         conn = get_db_connection()
         
-        # Load merchant data
-        merchants_df = pd.read_sql_query("SELECT * FROM merchants", conn)
-        print(f"Loaded {len(merchants_df)} merchants from database")
-        
-        # Map cities
-        merchants_df['city'] = merchants_df['business_city'].map(CITY_MAPPING).fillna(merchants_df['business_city'])
+        # Reuse the snapshot when the database has not changed since it was written
+        fingerprint = snapshot.db_fingerprint(conn)
+        fingerprint['edge_source'] = edge_source_config()
+        data_fingerprint = fingerprint
+        if load_snapshot(fingerprint):
+            conn.close()
+            data_source = 'postgres'
+            return
         
-        # Extract embedding columns and create matrix for fast similarity calculation
-        embedding_cols = [f'emb_{i}' for i in range(16)]
-        embeddings_matrix = merchants_df[embedding_cols].values
-        merchant_id_to_idx = {mid: idx for idx, mid in enumerate(merchants_df['merchant_id'].values)}
+        # Stream merchants and edges with COPY into typed columnar arrays
+        with span('load.merchants'):
+            merchant_store = ingest.read_merchants_db(conn, CITY_MAPPING)
+        print(f"Loaded {len(merchant_store)} merchants from database")
         
-        # Load edges and build NetworkX graph
-        edges_df = pd.read_sql_query("SELECT * FROM merchant_edges", conn)
-        print(f"Loaded {len(edges_df)} edges from database")
+        if EDGE_SOURCE != 'identifiers':
+            with span('load.edges'):
+                edge_data = ingest.read_edges_db(conn, merchant_store)
+            print(f"Loaded {len(edge_data['src'])} edges from database")
         
         conn.close()
         
-        # Build NetworkX graph efficiently
-        print("Building NetworkX graph...")
-        graph = nx.Graph()
-        
-        # Add all merchants as nodes first
-        graph.add_nodes_from(merchants_df['merchant_id'].values)
-        
-        # Add edges with attributes (use lowercase column names from query)
-        edge_list = [(row['merchant_a'], row['merchant_b'], 
-                     {'weight': row['weight'], 'reason': row['reason']}) 
-                    for _, row in edges_df.iterrows()]
-        graph.add_edges_from(edge_list)
-        
-        print(f"Graph created: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
-        
-        # Identify fraud rings using NetworkX connected components
-        print("Identifying fraud rings using NetworkX connected_components...")
-        fraud_merchants = set(merchants_df[merchants_df['is_fraud'] == 1]['merchant_id'].values)
-        print(f"Found {len(fraud_merchants)} fraudulent merchants")
-        
-        # Create subgraph of only fraudulent merchants
-        fraud_subgraph = graph.subgraph(fraud_merchants).copy()
-        print(f"Fraud subgraph: {fraud_subgraph.number_of_nodes()} nodes, {fraud_subgraph.number_of_edges()} edges")
-        
-        # Find connected components (fraud rings)
-        fraud_rings = {}
-        components = list(nx.connected_components(fraud_subgraph))
-        print(f"Found {len(components)} connected components")
-        
-        for idx, component in enumerate(components):
-            if len(component) >= 2:  # Only rings with 2+ merchants
-                fraud_rings[f"ring_{idx}"] = list(component)
-        
-        print(f"Identified {len(fraud_rings)} fraud rings with 2+ members")
-        
-        # Print ring size distribution
-        ring_sizes = sorted([len(members) for members in fraud_rings.values()], reverse=True)
-        if ring_sizes:
-            print(f"Largest ring: {ring_sizes[0]} members")
-            print(f"Ring sizes: {ring_sizes[:10]}...")  # Top 10
+        data_source = 'postgres'
+        build_derived_state()
+        save_snapshot(fingerprint)
         
     except Exception as e:
         print(f"Error loading data from database: {e}")
         print("Falling back to CSV files...")
         load_data_from_csv()
+    
+    metrics.stage_seconds.observe(time.perf_counter() - start, 'load')
+    data_ready = True
 
 
 def load_data_from_csv():
     """Fallback: Load data from CSV files"""
-    global merchants_df, graph, embeddings_matrix, merchant_id_to_idx, fraud_rings
+    global merchant_store, edge_data, data_source, data_fingerprint
     
     print("Loading data from CSV files...")
+    data_source = 'csv'
     
-    # Load merchant data
-    merchants_df = pd.read_csv('merchant_synthetic_100k_phase6.csv')
+    if EDGE_SOURCE == 'identifiers':
+        fingerprint = snapshot.csv_fingerprint(MERCHANTS_CSV)
+    else:
+        fingerprint = snapshot.csv_fingerprint(MERCHANTS_CSV, EDGES_CSV)
+    fingerprint['edge_source'] = edge_source_config()
+    data_fingerprint = fingerprint
+    if load_snapshot(fingerprint):
+        return
     
-    # Map cities
-    merchants_df['city'] = merchants_df['business_city'].map(CITY_MAPPING).fillna(merchants_df['business_city'])
+    # Read both files in chunks straight into typed columnar arrays
+    with span('load.merchants'):
+        merchant_store = ingest.read_merchants_csv(MERCHANTS_CSV, CITY_MAPPING)
+    print(f"Loaded {len(merchant_store)} merchants")
     
-    # Load edges
-    edges_df = pd.read_csv('merchant_edges.csv')
+    if EDGE_SOURCE != 'identifiers':
+        with span('load.edges'):
+            edge_data = ingest.read_edges_csv(EDGES_CSV, merchant_store)
     
-    # Extract embeddings
-    embedding_cols = [f'emb_{i}' for i in range(16)]
-    embeddings_matrix = merchants_df[embedding_cols].values
-    merchant_id_to_idx = {mid: idx for idx, mid in enumerate(merchants_df['merchant_id'].values)}
+    build_derived_state()
+    save_snapshot(fingerprint)
+
+
+def edge_source_config():
+    """Settings that decide the graph's edges, part of the snapshot fingerprint"""
+    if EDGE_SOURCE == 'identifiers':
+        return [EDGE_SOURCE, IDENTIFIER_CLIQUE_MAX, IDENTIFIER_MAX_GROUP]
+    return [EDGE_SOURCE]
+
+
+def build_identifier_index():
+    """Inverted index of the identifier columns; recomputes the shared-count columns from it"""
+    global identifiers
+    identifiers = IdentifierIndex(merchant_store)
+    for name in identifiers.types:
+        counts = identifiers.shared_counts(name)
+        merchant_store.columns[SHARED_COUNT_COLUMNS[name]] = counts.astype(
+            np.int16 if counts.max(initial=0) < 2 ** 15 else np.int32)
+    print(f"Identifier index: {', '.join(identifiers.types)}")
+
+
+def derive_edges():
+    """Edges between merchants sharing identifier values, in ingest's edge format"""
+    edges, stats = identifiers.derive_edges(IDENTIFIER_CLIQUE_MAX, IDENTIFIER_MAX_GROUP)
+    for name, counts in stats.items():
+        print(f"  {name}: {counts['groups']:,} shared values ({counts['stars']:,} as stars, "
+              f"{counts['skipped']:,} skipped), {counts['edges']:,} edges")
+    print(f"Derived {len(edges['src']):,} edges from shared identifiers")
+    return edges
+
+
+def find_fraud_rings():
+    """Connected components (2+ members) of the fraud-only subgraph
+
+    Returns (ring_ids, offsets, member_indices): members of ring r are
+    member_indices[offsets[r]:offsets[r + 1]], in ascending row order.
+    """
+    print("Identifying fraud rings using connected components...")
+    fraud_rows = merchant_store.fraud_indices()
+    print(f"Found {len(fraud_rows)} fraudulent merchants")
     
-    # Build NetworkX graph efficiently
-    print("Building NetworkX graph...")
-    graph = nx.Graph()
-    graph.add_nodes_from(merchants_df['merchant_id'].values)
+    # Label connected components of the subgraph of only fraudulent merchants
+    labels, n_components = graph.components(fraud_rows)
+    print(f"Found {n_components} connected components")
     
-    edge_list = [(row['merchant_A'], row['merchant_B'], 
-                 {'weight': row['weight'], 'reason': row['reason']}) 
-                for _, row in edges_df.iterrows()]
-    graph.add_edges_from(edge_list)
+    # Only rings with 2+ merchants
+    sizes = np.bincount(labels, minlength=n_components)
+    ring_labels = np.flatnonzero(sizes >= 2)
+    in_ring = sizes[labels] >= 2
+    order = np.argsort(labels[in_ring], kind='stable')
+    member_indices = fraud_rows[in_ring][order]
+    offsets = np.zeros(len(ring_labels) + 1, dtype=np.int64)
+    np.cumsum(sizes[ring_labels], out=offsets[1:])
     
-    print(f"Graph created: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+    print(f"Identified {len(ring_labels)} fraud rings with 2+ members")
+    return [RingIndex.ring_id(member_indices[start:]) for start in offsets[:-1].tolist()], offsets, member_indices
+
+
+def build_derived_state(arrays=None, meta=None):
+    """Build graph, fraud rings, indexes and cached responses from merchant_store/edge_data
+
+    With `arrays`/`meta` from a snapshot, the graph, similarity index and
+    rings are mapped from it instead of being recomputed.
+    """
+    global graph, ring_index, ring_stats, similarity_index, top_rings_cache, data_version, embedding_context, walk_graph
+    global risk_scales, identifiers, edge_data, fraud_filters
     
-    # Identify fraud rings using NetworkX
-    print("Identifying fraud rings using NetworkX connected_components...")
-    fraud_merchants = set(merchants_df[merchants_df['is_fraud'] == 1]['merchant_id'].values)
-    print(f"Found {len(fraud_merchants)} fraudulent merchants")
+    walk_graph = None
+    embedding_context = arrays.get('emb.context') if arrays is not None else None
+    if arrays is None:
+        with span('load.identifiers'):
+            build_identifier_index()
+        if EDGE_SOURCE == 'identifiers':
+            with span('load.edges'):
+                edge_data = derive_edges()
+        
+        with span('load.similarity_index'):
+            similarity_index = build_similarity_index()
+        
+        print("Building CSR graph...")
+        with span('load.graph'):
+            graph = MerchantGraph.from_edges(len(merchant_store), edge_data)
+        
+        # Index ring membership
+        with span('load.rings'):
+            ring_ids, offsets, member_indices = find_fraud_rings()
+        ring_of = None
+    else:
+        # The stored index is reused unless the similarity settings changed
+        if meta.get('similarity_config') == [SIMILARITY_MODE, SIMILARITY_IVF_MIN]:
+            similarity_index = FraudSimilarityIndex.from_arrays(snapshot_group(arrays, 'sim.'),
+                                                                n_probe=SIMILARITY_NPROBE)
+            print(f"Similarity index: {len(similarity_index)} fraud merchants, mode={similarity_index.mode}")
+        else:
+            with span('load.similarity_index'):
+                similarity_index = build_similarity_index()
+        graph = MerchantGraph.from_arrays(snapshot_group(arrays, 'graph.'))
+        identifiers = IdentifierIndex.from_arrays(merchant_store, snapshot_group(arrays, 'ident.'))
+        ring_ids = meta['ring_ids']
+        offsets, member_indices, ring_of = arrays['ring.offsets'], arrays['ring.members'], arrays['ring.of']
+    print(f"Graph created: {graph.n_nodes} nodes, {graph.n_edges} edges")
     
-    fraud_subgraph = graph.subgraph(fraud_merchants).copy()
-    print(f"Fraud subgraph: {fraud_subgraph.number_of_nodes()} nodes, {fraud_subgraph.number_of_edges()} edges")
+    with span('load.fraud_filters'):
+        fraud_filters = FraudFilterIndex(merchant_store, merchant_store.fraud_indices())
     
-    fraud_rings = {}
-    components = list(nx.connected_components(fraud_subgraph))
-    print(f"Found {len(components)} connected components")
+    if meta and meta.get('risk_config') == [RISK_ALPHA, RISK_GRAPH_WEIGHT]:
+        risk_scales = meta['risk_scales']
+    else:
+        with span('load.risk_scores'):
+            compute_risk_scores()
     
-    for idx, component in enumerate(components):
-        if len(component) >= 2:
-            fraud_rings[f"ring_{idx}"] = list(component)
+    # Build payloads of the largest rings
+    ring_index = RingIndex(ring_ids, offsets, member_indices, len(merchant_store), build_ring_payload,
+                           cache_size=RING_CACHE_SIZE, pinned=RING_PINNED, ring_of=ring_of)
+    with span('load.ring_payloads'):
+        ring_index.warm()
+    with span('load.ring_stats'):
+        ring_stats = RingStats(ring_index, merchant_store, graph)
     
-    print(f"Loaded {len(merchants_df)} merchants")
-    print(f"Identified {len(fraud_rings)} fraud rings")
+    # Materialize the dashboard response for this data version
+    data_version = meta['data_version'] if meta else compute_data_version()
+    top_rings_cache = TopRingsCache(data_version, ring_index, build_ring_slice, encode_json,
+                                    max_nodes_cap=TOP_RINGS_MAX_NODES, ring_members=ring_stats.display_order,
+                                    columnar_builder=build_ring_columns)
+    with span('load.top_rings'):
+        top_rings_cache.response()
+    print(f"Data version: {data_version}")
     
     # Print ring size distribution
-    ring_sizes = sorted([len(members) for members in fraud_rings.values()], reverse=True)
+    ring_sizes = np.sort(ring_index.sizes)[::-1].tolist()
     if ring_sizes:
         print(f"Largest ring: {ring_sizes[0]} members")
-        print(f"Ring sizes: {ring_sizes[:10]}...")
+        print(f"Ring sizes: {ring_sizes[:10]}...")  # Top 10
+
+
+def snapshot_group(arrays, prefix):
+    """Snapshot arrays whose name starts with prefix, keyed without it"""
+    return {name[len(prefix):]: values for name, values in arrays.items() if name.startswith(prefix)}
+
+
+def load_snapshot(fingerprint):
+    """Restore all loaded and derived state from an up-to-date snapshot, if any
+
+    fingerprint=None skips the source check (server workers map the snapshot
+    the master process has just validated or rebuilt).
+    """
+    global merchant_store, journal
+    
+    if not SNAPSHOT_DIR:
+        return False
+    
+    try:
+        with span('load.snapshot_map'):
+            loaded = snapshot.load(SNAPSHOT_DIR, fingerprint)
+        if loaded is None:
+            return False
+        arrays, meta = loaded
+        
+        print(f"Loading snapshot from {SNAPSHOT_DIR}...")
+        merchant_store = MerchantStore.from_arrays(
+            {name: values for name, values in arrays.items()
+             if not name.startswith(('graph.', 'sim.', 'ring.', 'emb.', 'ident.'))})
+        print(f"Loaded {len(merchant_store)} merchants from snapshot")
+        
+        build_derived_state(arrays, meta)
+        
+        # Live updates received since the snapshot was written
+        journal = UpdateJournal(os.path.join(SNAPSHOT_DIR, JOURNAL_FILE))
+        replayed = sync_updates()
+        if replayed:
+            print(f"Replayed {replayed} journaled updates")
+        return True
+    
+    except Exception as e:
+        print(f"Error loading snapshot, rebuilding from source: {e}")
+        return False
+
+
+def save_snapshot(fingerprint):
+    """Write the loaded and derived state to SNAPSHOT_DIR for the next start"""
+    global journal
+    
+    if not SNAPSHOT_DIR:
+        return
+    
+    ring_ids, ring_arrays = ring_index.to_arrays()
+    arrays = merchant_store.to_arrays()
+    arrays.update({f'graph.{name}': values for name, values in graph.to_arrays().items()})
+    arrays.update({f'sim.{name}': values for name, values in similarity_index.to_arrays().items()})
+    arrays.update({f'ring.{name}': values for name, values in ring_arrays.items()})
+    arrays.update({f'ident.{name}': values for name, values in identifiers.to_arrays().items()})
+    if embedding_context is not None:
+        arrays['emb.context'] = embedding_context
+    
+    try:
+        with span('load.snapshot_save'):
+            snapshot.save(SNAPSHOT_DIR, fingerprint, arrays, {
+                'ring_ids': ring_ids, 'data_version': data_version, 'source': data_source,
+                'similarity_config': [SIMILARITY_MODE, SIMILARITY_IVF_MIN],
+                'risk_config': [RISK_ALPHA, RISK_GRAPH_WEIGHT], 'risk_scales': risk_scales
+            })
+        journal = UpdateJournal(os.path.join(SNAPSHOT_DIR, JOURNAL_FILE))
+        print(f"Snapshot written to {SNAPSHOT_DIR}")
+    except OSError as e:
+        print(f"Could not write snapshot: {e}")
+
+
+def load_shared_data():
+    """Server worker start-up: map the snapshot prepared by the master process
+
+    Falls back to a full load_data() when there is no usable snapshot.
+    """
+    global data_source, data_ready
+    
+    if not load_snapshot(None):
+        load_data()
+        return
+    data_source = snapshot.read_manifest(SNAPSHOT_DIR)['meta'].get('source')
+    data_ready = True
+
+
+def node_records(member_idx, fields):
+    """Graph node payloads for a set of merchant rows"""
+    nodes = merchant_store.records(member_idx, fields)
+    for node in nodes:
+        node['id'] = node['merchant_id']
+    return nodes
+
+
+def build_similarity_index():
+    """Normalized embedding index over all fraud merchants"""
+    fraud_rows = merchant_store.fraud_indices()
+    mode = SIMILARITY_MODE
+    if mode == 'auto':
+        mode = 'ivf' if len(fraud_rows) >= SIMILARITY_IVF_MIN else 'exact'
+    
+    index = FraudSimilarityIndex(fraud_rows, merchant_store.embeddings,
+                                 mode=mode, n_probe=SIMILARITY_NPROBE)
+    print(f"Similarity index: {len(index)} fraud merchants, mode={index.mode}")
+    if index.mode != 'exact':
+        print(f"Similarity recall@10 vs exact search: {index.recall(k=10):.3f}")
+    return index
+
+
+def compute_risk_scores():
+    """Risk score of every merchant into the graph_risk and risk_score columns
+
+    graph_risk is label propagation from fraud merchants over the weighted
+    merchant graph; risk_score blends it with a score of the merchant's
+    chargeback, refund and shared-identifier features.
+    """
+    global risk_scales, risk_rankings
+    columns = merchant_store.columns
+    risk_scales = risk_scores.feature_scales(columns)
+    graph_risk, iterations = risk_scores.graph_scores(graph, columns['is_fraud'], RISK_ALPHA)
+    columns['graph_risk'] = graph_risk
+    columns['risk_score'] = risk_scores.blend(graph_risk, risk_scores.feature_scores(columns, risk_scales),
+                                              RISK_GRAPH_WEIGHT)
+    risk_rankings = {}
+    print(f"Risk scores: label propagation converged in {iterations} iterations")
+
+
+def update_risk_scores(rows):
+    """Re-score merchants after the edges or labels of rows changed (or rows were added)"""
+    global risk_rankings
+    columns = merchant_store.columns
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    added = rows[np.isnan(columns['graph_risk'][rows])]
+    if len(added):
+        merchant_store.set_values('graph_risk', added, 0.0)
+    
+    changed, values = risk_scores.propagate_changes(graph, columns['graph_risk'], columns['is_fraud'], rows,
+                                                    RISK_ALPHA)
+    merchant_store.set_values('graph_risk', changed, values)
+    changed = np.union1d(changed, rows)
+    merchant_store.set_values('risk_score', changed, risk_scores.blend(
+        columns['graph_risk'][changed], risk_scores.feature_scores(columns, risk_scales, changed),
+        RISK_GRAPH_WEIGHT))
+    risk_rankings = {}
+
+
+def current_walk_graph():
+    """Weighted CSR graph for embedding walks, rebuilt after graph changes"""
+    global walk_graph
+    if walk_graph is None:
+        walk_graph = WalkGraph.from_edges(len(merchant_store), graph.src, graph.dst, graph.weight)
+    return walk_graph
+
+
+def refresh_embeddings():
+    """Retrain every merchant embedding on the current graph (EMBED_* settings)
+
+    Replaces the embeddings in memory and in PostgreSQL and rebuilds the
+    similarity index; the caller saves the snapshot.
+    """
+    global similarity_index, embedding_context
+    print(f"Training embeddings: {EMBED_NUM_WALKS} walks of {EMBED_WALK_LENGTH} per merchant...")
+    with span('embeddings.train'):
+        vectors, context = node_embeddings.train_embeddings(
+            current_walk_graph(), dim=merchant_store.embeddings.shape[1], walk_length=EMBED_WALK_LENGTH,
+            num_walks=EMBED_NUM_WALKS, p=EMBED_P, q=EMBED_Q, window=EMBED_WINDOW, epochs=EMBED_EPOCHS,
+            seed=EMBED_SEED, workers=EMBED_WORKERS or None)
+    
+    merchant_store.set_embeddings(slice(None), vectors)
+    embedding_context = context
+    similarity_index = build_similarity_index()
+    with span('embeddings.persist'):
+        persist_embeddings(np.arange(len(merchant_store)), vectors)
+
+
+def build_ring_payload(ring_id, member_idx):
+    """Nodes and edges of a fraud ring as embedded in the merchant response"""
+    payload = {
+        'ring_id': ring_id,
+        'nodes': node_records(member_idx, RING_NODE_FIELDS),
+        'edges': []
+    }
+    
+    edge_ids = graph.induced_edges(member_idx)
+    for u, v, weight, reason in zip(*graph.edge_records(edge_ids, merchant_store.merchant_ids)):
+        payload['edges'].append({
+            'source': u,
+            'target': v,
+            'weight': weight,
+            'reason': reason
+        })
+    
+    return payload
+
+
+def build_ring_slice(member_idx):
+    """Dashboard nodes and edges for ring members, with each edge's rank
+
+    An edge's rank is the position of its later endpoint in member_idx, i.e.
+    the edge is visible once more than `rank` members are displayed.
+    """
+    nodes = node_records(member_idx, RING_NODE_FIELDS + ['is_fraud'])
+    member_idx = np.asarray(member_idx, dtype=np.int64)
+    by_row = np.argsort(member_idx)
+    sorted_members = member_idx[by_row]
+    
+    def position(rows):
+        return by_row[np.searchsorted(sorted_members, rows)]
+    
+    edge_ids = graph.induced_edges(member_idx)
+    edges = [
+        {'source': u, 'target': v, 'weight': float(weight), 'reason': reason}
+        for u, v, weight, reason in zip(*graph.edge_records(edge_ids, merchant_store.merchant_ids))
+    ]
+    ranks = np.maximum(position(graph.src[edge_ids]), position(graph.dst[edge_ids])).tolist()
+    
+    return nodes, edges, ranks
+
+
+def build_ring_columns(member_idx, max_edges=None, fields=None):
+    """Columnar nodes and edges of ring members (see serialization.columnar_graph)
+
+    Edges come in build_ring_slice order, so with max_edges the same edges
+    are kept as in the object format.
+    """
+    member_idx = np.asarray(member_idx, dtype=np.int64)
+    edge_ids = graph.induced_edges(member_idx)
+    if max_edges is not None:
+        by_row = np.argsort(member_idx)
+        sorted_members = member_idx[by_row]
+        ranks = np.maximum(by_row[np.searchsorted(sorted_members, graph.src[edge_ids])],
+                           by_row[np.searchsorted(sorted_members, graph.dst[edge_ids])])
+        edge_ids = edge_ids[np.argsort(ranks, kind='stable')][:max_edges]
+    return columnar_graph(merchant_store, graph, member_idx, fields or RING_NODE_FIELDS + ['is_fraud'], edge_ids)
+
+
+def compute_data_version():
+    """Fingerprint of the loaded merchants, graph and rings"""
+    digest = hashlib.sha1()
+    digest.update(f"{len(merchant_store)}:{graph.n_edges}".encode())
+    digest.update(ring_index.offsets.tobytes())
+    digest.update(ring_index.member_indices.tobytes())
+    return digest.hexdigest()[:12]
+
+
+def encode_json(payload):
+    """Encode a payload exactly as jsonify() would"""
+    return app.json.response(payload).get_data()
+
+
+def int_arg(name, default, minimum, maximum):
+    """Integer query parameter, clamped to maximum; raises ValueError if invalid"""
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    if value < minimum:
+        raise ValueError(f"'{name}' must be at least {minimum}")
+    return min(value, maximum)
+
+
+def columnar_arg():
+    """Whether the columnar format was asked for (format=columnar); raises ValueError if invalid
+
+    Columnar responses are encoded with orjson (see FastJSONProvider).
+    """
+    value = request.args.get('format') or 'objects'
+    if value not in RESPONSE_FORMATS:
+        raise ValueError(f"'format' must be one of: {', '.join(RESPONSE_FORMATS)}")
+    if value == 'columnar':
+        use_fast_json()
+    return value == 'columnar'
+
+
+def float_arg(name, default):
+    """Numeric query parameter; raises ValueError if invalid"""
+    raw = request.args.get(name)
+    if raw is None or raw == '':
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a number")
+
+
+def cached_json_response(etag, gzip_body):
+    """Serve a pre-compressed JSON body, honouring If-None-Match and Accept-Encoding"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif request.accept_encodings['gzip']:
+        response = Response(gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(gzip.decompress(gzip_body), mimetype='application/json')
+    
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Per-endpoint request metrics and the opt-in slow-request profiler
+request_seconds = metrics.registry.histogram(
+    'ml_request_duration_seconds', 'Request handling time per endpoint (streamed bodies excluded)',
+    ('endpoint', 'method'))
+requests_total = metrics.registry.counter(
+    'ml_requests_total', 'Requests handled per endpoint and status', ('endpoint', 'method', 'status'))
+profiler = (metrics.SamplingProfiler(PROFILE_DIR, PROFILE_SLOW_MS / 1000, PROFILE_INTERVAL_MS / 1000)
+            if PROFILE_SLOW_MS > 0 else None)
+
+
+def structure_bytes():
+    """Size in bytes of the loaded data structures (memory-mapped arrays included)"""
+    sizes = {}
+    if merchant_store is not None:
+        sizes[('merchant_store',)] = metrics.array_bytes(
+            merchant_store.merchant_ids, merchant_store.embeddings, *merchant_store.columns.values(),
+            *merchant_store.categories.values(), merchant_store.sorted_ids, merchant_store.sorted_rows)
+    if graph is not None:
+        sizes[('graph',)] = metrics.array_bytes(
+            graph.src, graph.dst, graph.weight, graph.reason, graph.indptr, graph.neighbors, graph.edge_ids)
+    if ring_index is not None:
+        sizes[('ring_index',)] = metrics.array_bytes(
+            ring_index.offsets, ring_index.member_indices, ring_index.ring_of, ring_index.sizes)
+    if similarity_index is not None:
+        sizes[('similarity_index',)] = metrics.array_bytes(
+            similarity_index.rows, similarity_index.vectors, similarity_index.centroids,
+            getattr(similarity_index, 'list_order', None), getattr(similarity_index, 'list_offsets', None))
+    if fraud_filters is not None:
+        sizes[('fraud_filters',)] = metrics.array_bytes(
+            *(array for pair in fraud_filters.partitions.values() for array in pair),
+            *(array for pair in fraud_filters.ranges.values() for array in pair), fraud_filters.added)
+    if ring_stats is not None:
+        sizes[('ring_stats',)] = metrics.array_bytes(
+            *ring_stats.columns.values(), *(array for pair in ring_stats.mix.values() for array in pair),
+            ring_stats.central_members, ring_stats.central_offsets)
+    if identifiers is not None:
+        sizes[('identifier_index',)] = metrics.array_bytes(
+            *(array for group in identifiers.groups.values() for array in group))
+    if top_rings_cache is not None:
+        sizes[('top_rings_responses',)] = top_rings_cache.cached_bytes()
+    return sizes
+
+
+def register_gauges(registry):
+    """Data size and memory gauges, read at scrape time"""
+    def when_loaded(collect):
+        return lambda: collect() if data_ready else None
+    
+    registry.gauge('ml_data_ready', 'Whether this process has loaded its data', lambda: int(data_ready))
+    registry.gauge('ml_merchants', 'Merchants loaded', when_loaded(lambda: len(merchant_store)))
+    registry.gauge('ml_fraud_merchants', 'Merchants labelled as fraud',
+                   when_loaded(lambda: len(similarity_index)))
+    registry.gauge('ml_edges', 'Merchant edges in the graph', when_loaded(lambda: graph.n_edges))
+    registry.gauge('ml_fraud_rings', 'Fraud rings (2+ members)', when_loaded(lambda: len(ring_index)))
+    registry.gauge('ml_ring_payloads_cached', 'Fraud ring payloads in the cache',
+                   when_loaded(lambda: ring_index.cached_payloads()))
+    registry.gauge('ml_structure_bytes', 'Size of each loaded data structure', structure_bytes, ('structure',))
+    registry.gauge('process_resident_memory_bytes', 'Resident memory of this process',
+                   metrics.resident_memory_bytes)
+
+
+register_gauges(metrics.registry)
+
+
+@app.before_request
+def start_request_metrics():
+    """Start timing (and profiling, if enabled) the request"""
+    g.request_start = time.perf_counter()
+    if profiler is not None:
+        profiler.start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency and status of the request; dump the profile of a slow one"""
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_seconds.observe(elapsed, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    if profiler is not None:
+        path = profiler.stop(f'{request.method} {endpoint}', elapsed)
+        if path:
+            print(f"Slow request {request.method} {request.path} took {elapsed * 1000:.0f}ms, profile: {path}")
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON bodies of COMPRESS_MIN_BYTES or more with the client's preferred coding
+
+    Streamed and already encoded (cached) responses are left as they are.
+    """
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.before_request
+def require_data():
+    """Reject requests until data is loaded; pick up other workers' updates"""
+    if request.path in ('/api/health', '/api/metrics'):
+        return None
+    if not data_ready:
+        return jsonify({'success': False, 'error': 'Data is still loading'}), 503
+    if journal is not None and journal.pending():
+        with update_lock:
+            sync_updates()
+    return None
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'python-ml-service'})
+    """Health check endpoint (503 until the data is loaded, for readiness probes)"""
+    if not data_ready:
+        return jsonify({'status': 'loading', 'service': 'python-ml-service'}), 503
+    return jsonify({'status': 'healthy', 'service': 'python-ml-service', 'data_version': data_version})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Metrics of this process in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/api/top-fraud-rings', methods=['GET'])
 def get_top_fraud_rings():
-    """Get top 10 largest fraud rings for visualization"""
+    """Get the largest fraud rings for visualization (top 10 by default)
+
+    Query parameters: limit, offset, max_nodes (per ring), max_edges (per ring),
+    format (objects or columnar). Responses are materialized once per data
+    version and support If-None-Match.
+    """
     try:
         # Check if data is loaded
-        if merchants_df is None or graph is None:
+        if merchant_store is None or graph is None or top_rings_cache is None:
             return jsonify({
                 'success': False,
                 'error': 'Data not loaded. Please restart the service.'
             }), 500
         
-        if not fraud_rings:
+        if len(ring_index) == 0:
             return jsonify({
                 'success': False,
                 'error': 'No fraud rings found in the dataset.'
             }), 404
         
-        # Sort fraud rings by size
-        sorted_rings = sorted(fraud_rings.items(), 
-                            key=lambda x: len(x[1]), 
-                            reverse=True)[:10]
-        
-        rings_data = []
-        for ring_id, members in sorted_rings:
-            # Limit visualization for very large rings
-            MAX_NODES = 100
-            is_truncated = len(members) > MAX_NODES
-            display_members = members[:MAX_NODES] if is_truncated else members
-            
-            ring_data = {
-                'ring_id': ring_id,
-                'size': len(members),
-                'displayed_size': len(display_members),
-                'is_truncated': is_truncated,
-                'members': display_members,
-                'nodes': [],
-                'edges': []
-            }
-            
-            # Get member details (limited for large rings)
-            for merchant_id in display_members:
-                try:
-                    merchant = merchants_df[merchants_df['merchant_id'] == merchant_id].iloc[0]
-                    ring_data['nodes'].append({
-                        'id': merchant_id,
-                        'merchant_id': merchant_id,
-                        'pan_hash': str(merchant['pan_hash']),
-                        'merchant_tier': str(merchant['merchant_tier']),
-                        'city': str(merchant.get('city', merchant['business_city'])),
-                        'is_fraud': int(merchant['is_fraud'])
-                    })
-                except Exception as e:
-                    print(f"Error getting merchant {merchant_id}: {e}")
-                    continue
-            
-            # Get edges within the ring (limited for large rings)
-            try:
-                subgraph = graph.subgraph(display_members)
-                edge_count = 0
-                MAX_EDGES = 200
-                
-                for u, v, data in subgraph.edges(data=True):
-                    if edge_count >= MAX_EDGES:
-                        break
-                    ring_data['edges'].append({
-                        'source': u,
-                        'target': v,
-                        'weight': float(data.get('weight', 1)),
-                        'reason': str(data.get('reason', 'unknown'))
-                    })
-                    edge_count += 1
-                    
-            except Exception as e:
-                print(f"Error getting edges for ring {ring_id}: {e}")
-            
-            rings_data.append(ring_data)
+        try:
+            limit = int_arg('limit', 10, 1, TOP_RINGS_MAX_LIMIT)
+            offset = int_arg('offset', 0, 0, len(ring_index))
+            max_nodes = int_arg('max_nodes', 100, 1, TOP_RINGS_MAX_NODES)
+            max_edges = int_arg('max_edges', 200, 0, TOP_RINGS_MAX_EDGES)
+            columnar = columnar_arg()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        return jsonify({
-            'success': True,
-            'rings': rings_data
-        })
+        with span('top_rings.response'):
+            etag, body = top_rings_cache.response(limit, offset, max_nodes, max_edges, columnar)
+        with span('top_rings.serve'):
+            return cached_json_response(etag, body)
     
     except Exception as e:
         print(f"Error in get_top_fraud_rings: {e}")
@@ -336,131 +947,339 @@ def get_top_fraud_rings():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/rings', methods=['GET'])
+def get_rings():
+    """Catalog of all fraud rings with their statistics
+
+    Query parameters: limit, offset, sort (one of RING_SORT_COLUMNS, size by
+    default), order (desc or asc), min_size, max_size, min_density,
+    max_density, min_chargeback_rate, max_chargeback_rate, and reason, city,
+    tier and category, which match the ring's most common value.
+    """
+    try:
+        try:
+            limit = int_arg('limit', 20, 1, RINGS_MAX_LIMIT)
+            offset = int_arg('offset', 0, 0, len(ring_stats.columns['size']))
+            sort = request.args.get('sort', 'size')
+            if sort not in RING_SORT_COLUMNS:
+                raise ValueError(f"'sort' must be one of: {', '.join(RING_SORT_COLUMNS)}")
+            order = request.args.get('order', 'desc')
+            if order not in ('asc', 'desc'):
+                raise ValueError("'order' must be asc or desc")
+            filters = {
+                'size': (int_arg('min_size', None, 0, sys.maxsize), int_arg('max_size', None, 0, sys.maxsize)),
+                'density': (float_arg('min_density', None), float_arg('max_density', None)),
+                'mean_chargeback_rate': (float_arg('min_chargeback_rate', None),
+                                         float_arg('max_chargeback_rate', None))
+            }
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # Unknown labels match no ring (code -2 is never stored)
+        if request.args.get('reason'):
+            reasons = graph.reasons.tolist()
+            filters['reason'] = reasons.index(request.args['reason']) if request.args['reason'] in reasons else -2
+        for name, column in RING_MIX_FILTERS.items():
+            if request.args.get(name):
+                code = merchant_store.code_of(column, request.args[name])
+                filters[column] = -2 if code is None else code
+        
+        with span('rings.select'):
+            selected = ring_stats.select(filters, sort, order == 'desc')
+        with span('rings.records'):
+            reasons = graph.reasons.tolist()
+            rings = []
+            for ring_no in selected[offset:offset + limit].tolist():
+                record = {'ring_id': ring_index.ring_ids[ring_no]}
+                record.update(ring_stats.record(ring_no, reasons, RING_CENTRAL_MEMBERS))
+                rings.append(record)
+        
+        return jsonify({'success': True, 'total': len(selected), 'offset': offset, 'rings': rings})
+    
+    except Exception as e:
+        print(f"Error in get_rings: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/rings/<ring_id>', methods=['GET'])
+def get_ring(ring_id):
+    """Statistics of one fraud ring and a view of its most central members
+
+    Query parameters: max_nodes, max_edges, format (as for /api/top-fraud-rings).
+    """
+    try:
+        ring_no = ring_index.ring_numbers.get(ring_id)
+        if ring_no is None or ring_index.sizes[ring_no] == 0:
+            return jsonify({'success': False, 'error': 'Ring not found'}), 404
+        
+        try:
+            max_nodes = int_arg('max_nodes', 100, 1, TOP_RINGS_MAX_NODES)
+            max_edges = int_arg('max_edges', 200, 0, TOP_RINGS_MAX_EDGES)
+            columnar = columnar_arg()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        ring = top_rings_cache.ring_view(ring_no, max_nodes, max_edges, columnar)
+        ring.update(ring_stats.record(ring_no, graph.reasons.tolist(), RING_CENTRAL_MEMBERS))
+        return jsonify({'success': True, 'ring': ring})
+    
+    except Exception as e:
+        print(f"Error in get_ring: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/merchant/<merchant_id>', methods=['GET'])
 def get_merchant_info(merchant_id):
-    """Get detailed information about a specific merchant"""
+    """Get detailed information about a specific merchant
+
+    Query parameters: format (objects or columnar, for the fraud ring).
+    """
     try:
+        try:
+            columnar = columnar_arg()
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
         # Check if merchant exists
-        merchant_data = merchants_df[merchants_df['merchant_id'] == merchant_id]
+        with span('merchant.lookup'):
+            merchant_idx = merchant_store.index_of(merchant_id)
         
-        if merchant_data.empty:
+        if merchant_idx is None:
             return jsonify({
                 'success': False,
                 'error': 'Merchant not found'
             }), 404
         
-        merchant = merchant_data.iloc[0]
+        with span('merchant.record'):
+            merchant = merchant_store.row(merchant_idx, MERCHANT_DETAIL_FIELDS)
         
         result = {
             'success': True,
-            'merchant': {
-                'merchant_id': merchant_id,
-                'is_fraud': int(merchant['is_fraud']),
-                'pan_hash': merchant['pan_hash'],
-                'device_id_hash': merchant['device_id_hash'],
-                'ip_hash': merchant['ip_hash'],
-                'merchant_tier': merchant['merchant_tier'],
-                'merchant_category': merchant['merchant_category'],
-                'city': merchant['city'],
-                'is_kyc_verified': int(merchant['is_kyc_verified']),
-                'total_txns_90d': int(merchant['total_txns_90d']),
-                'avg_txn_value': float(merchant['avg_txn_value']),
-                'chargeback_rate': float(merchant['chargeback_rate']),
-                'refund_ratio': float(merchant['refund_ratio']),
-                'shared_pan_count': int(merchant['shared_pan_count']),
-                'shared_device_count': int(merchant['shared_device_count']),
-                'shared_ip_count': int(merchant['shared_ip_count'])
-            }
+            'merchant': merchant
         }
         
         # If merchant is fraud, get network and similar frauds
         if merchant['is_fraud'] == 1:
-            # Find the fraud ring this merchant belongs to
-            merchant_ring = None
-            for ring_id, members in fraud_rings.items():
-                if merchant_id in members:
-                    merchant_ring = ring_id
-                    break
-            
-            if merchant_ring:
-                result['fraud_ring'] = {
-                    'ring_id': merchant_ring,
-                    'nodes': [],
-                    'edges': []
-                }
+            # Find the fraud ring this merchant belongs to (cached payload)
+            with span('merchant.fraud_ring'):
+                ring_no = ring_index.ring_of_row(merchant_idx)
                 
-                members = fraud_rings[merchant_ring]
-                
-                # Get nodes
-                for mid in members:
-                    m = merchants_df[merchants_df['merchant_id'] == mid].iloc[0]
-                    result['fraud_ring']['nodes'].append({
-                        'id': mid,
-                        'merchant_id': mid,
-                        'pan_hash': m['pan_hash'],
-                        'merchant_tier': m['merchant_tier'],
-                        'city': m['city']
-                    })
-                
-                # Get edges
-                subgraph = graph.subgraph(members)
-                for u, v, data in subgraph.edges(data=True):
-                    result['fraud_ring']['edges'].append({
-                        'source': u,
-                        'target': v,
-                        'weight': data.get('weight', 1),
-                        'reason': data.get('reason', 'unknown')
-                    })
+                if ring_no is not None and columnar:
+                    result['fraud_ring'] = {'ring_id': ring_index.ring_ids[ring_no]}
+                    result['fraud_ring'].update(build_ring_columns(ring_index.members(ring_no),
+                                                                   fields=RING_NODE_FIELDS))
+                elif ring_no is not None:
+                    result['fraud_ring'] = ring_index.payload(ring_no)
             
             # Get top 10 similar frauds using cosine similarity
-            result['similar_frauds'] = get_similar_frauds(merchant_id, top_n=10)
+            with span('merchant.similar_frauds'):
+                result['similar_frauds'] = get_similar_frauds(merchant_id, top_n=10)
         
-        return jsonify(result)
+        with span('merchant.serialize'):
+            return jsonify(result)
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def get_similar_frauds(merchant_id, top_n=10):
-    """Calculate top N similar fraud merchants using cosine similarity (optimized)"""
+def risk_ranking(include_fraud):
+    """Rows of the RISK_TOP_MAX_LIMIT highest risk scores, riskiest first"""
+    ranking = risk_rankings.get(include_fraud)
+    if ranking is None:
+        scores = np.nan_to_num(merchant_store.columns['risk_score'], nan=-1.0)
+        if include_fraud:
+            ranking = top_k(scores, RISK_TOP_MAX_LIMIT)
+        else:
+            clean = np.flatnonzero(merchant_store.columns['is_fraud'] != 1)
+            ranking = clean[top_k(scores[clean], RISK_TOP_MAX_LIMIT)]
+        risk_rankings[include_fraud] = ranking
+    return ranking
+
+
+@app.route('/api/risk-scores/top', methods=['GET'])
+def get_top_risk_scores():
+    """Merchants with the highest risk scores
+
+    Query parameters: limit, offset (limit + offset at most RISK_TOP_MAX_LIMIT)
+    and include_fraud (0 by default: only merchants not labelled fraud).
+    """
     try:
-        # Get index for target merchant
-        if merchant_id not in merchant_id_to_idx:
-            return []
+        try:
+            limit = int_arg('limit', 50, 1, RISK_TOP_MAX_LIMIT)
+            offset = int_arg('offset', 0, 0, RISK_TOP_MAX_LIMIT)
+            include_fraud = int_arg('include_fraud', 0, 0, 1) == 1
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        target_idx = merchant_id_to_idx[merchant_id]
-        target_embedding = embeddings_matrix[target_idx:target_idx+1]
+        with span('risk.ranking'):
+            rows = risk_ranking(include_fraud)[offset:offset + limit]
+        with span('risk.records'):
+            merchants = merchant_store.records(rows, RISK_FIELDS)
         
-        # Get all fraud merchants (excluding target)
-        fraud_mask = (merchants_df['is_fraud'] == 1) & (merchants_df['merchant_id'] != merchant_id)
-        fraud_merchants_df = merchants_df[fraud_mask].copy()
+        return jsonify({'success': True, 'offset': offset, 'merchants': merchants})
+    
+    except Exception as e:
+        print(f"Error in get_top_risk_scores: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/identifier/<identifier_type>/<value>', methods=['GET'])
+def get_identifier_merchants(identifier_type, value):
+    """Merchants using an identifier value
+
+    identifier_type is one of pan, device, ip, phone, email or pos and value
+    is the hash as stored (e.g. PAN_F_123). Query parameters: limit, offset.
+    merchant_count and fraud_count cover all merchants, not just the page.
+    """
+    try:
+        if identifier_type not in identifiers.types:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown identifier type '{identifier_type}', expected one of: {', '.join(identifiers.types)}"
+            }), 400
         
-        if fraud_merchants_df.empty:
-            return []
+        try:
+            limit = int_arg('limit', 100, 1, IDENTIFIER_MAX_LIMIT)
+            offset = int_arg('offset', 0, 0, len(merchant_store))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Get fraud embeddings efficiently
-        fraud_indices = [merchant_id_to_idx[mid] for mid in fraud_merchants_df['merchant_id'].values]
-        fraud_embeddings = embeddings_matrix[fraud_indices]
+        with span('identifier.lookup'):
+            rows = identifiers.lookup(identifier_type, value)
+        if len(rows) == 0:
+            return jsonify({'success': False, 'error': 'Identifier not found'}), 404
         
-        # Calculate cosine similarity (vectorized)
-        similarities = cosine_similarity(target_embedding, fraud_embeddings)[0]
+        with span('identifier.records'):
+            merchants = merchant_store.records(rows[offset:offset + limit], IDENTIFIER_FIELDS)
         
-        # Get top N
-        top_indices = np.argsort(similarities)[::-1][:top_n]
+        return jsonify({
+            'success': True,
+            'type': identifier_type,
+            'value': value,
+            'merchant_count': len(rows),
+            'fraud_count': int((merchant_store.columns['is_fraud'][rows] == 1).sum()),
+            'offset': offset,
+            'merchants': merchants
+        })
+    
+    except Exception as e:
+        print(f"Error in get_identifier_merchants: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/merchant/<merchant_id>/neighborhood', methods=['GET'])
+def get_merchant_neighborhood(merchant_id):
+    """Merchants within a few hops of any merchant, fraud or not
+
+    Query parameters: hops, max_nodes, max_edges, min_weight, reasons
+    (comma-separated). Past the node budget, merchants joined by the
+    heaviest edges are kept. hop_counts lists the merchants and fraud
+    merchants reached at every hop, including those cut by the budget.
+    """
+    try:
+        merchant_idx = merchant_store.index_of(merchant_id)
+        if merchant_idx is None:
+            return jsonify({'success': False, 'error': 'Merchant not found'}), 404
         
-        similar_frauds = []
-        for idx in top_indices:
-            fraud_data = fraud_merchants_df.iloc[idx]
-            
-            similar_frauds.append({
-                'merchant_id': fraud_data['merchant_id'],
-                'similarity_score': float(similarities[idx]),
-                'pan_hash': fraud_data['pan_hash'],
-                'merchant_tier': fraud_data['merchant_tier'],
-                'city': fraud_data['city'],
-                'avg_txn_value': float(fraud_data['avg_txn_value']),
-                'chargeback_rate': float(fraud_data['chargeback_rate'])
-            })
+        try:
+            hops = int_arg('hops', 2, 1, NEIGHBORHOOD_MAX_HOPS)
+            max_nodes = int_arg('max_nodes', 200, 1, NEIGHBORHOOD_MAX_NODES)
+            max_edges = int_arg('max_edges', 1000, 0, NEIGHBORHOOD_MAX_EDGES)
+            min_weight = float_arg('min_weight', None)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        reason_codes = None
+        if request.args.get('reasons'):
+            requested = set(request.args['reasons'].split(','))
+            reason_codes = [code for code, label in enumerate(graph.reasons.tolist()) if label in requested]
+        
+        with span('neighborhood.search'):
+            rows, row_hops, edge_ids, reached, truncated = graph.neighborhood(
+                merchant_idx, hops, max_nodes, max_edges, min_weight, reason_codes)
+        
+        with span('neighborhood.records'):
+            nodes = node_records(rows, RING_NODE_FIELDS + ['is_fraud'])
+            for node, hop in zip(nodes, row_hops.tolist()):
+                node['hop'] = hop
+            edges = [{'source': u, 'target': v, 'weight': weight, 'reason': reason}
+                     for u, v, weight, reason in zip(*graph.edge_records(edge_ids, merchant_store.merchant_ids))]
+            is_fraud = merchant_store.columns['is_fraud']
+            hop_counts = [{
+                'hop': hop,
+                'merchants': len(new_rows),
+                'fraud_merchants': int(is_fraud[new_rows].sum()),
+                'returned': int((row_hops == hop).sum())
+            } for hop, new_rows in enumerate(reached, start=1)]
+        
+        return jsonify({
+            'success': True,
+            'merchant_id': merchant_id,
+            'nodes': nodes,
+            'edges': edges,
+            'hop_counts': hop_counts,
+            'truncated': truncated
+        })
+    
+    except Exception as e:
+        print(f"Error in get_merchant_neighborhood: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def similar_fraud_filters(values):
+    """FraudFilterIndex conditions from query parameters or a JSON object; raises ValueError if invalid
+
+    Unknown city/tier/category labels match no merchant (code -1).
+    """
+    filters = {}
+    for name, column in SIMILAR_FRAUD_FILTERS.items():
+        if values.get(name) not in (None, ''):
+            code = merchant_store.code_of(column, str(values[name]))
+            filters[column] = -1 if code is None else code
+    if values.get('kyc') not in (None, ''):
+        kyc = str(values['kyc']).lower()
+        if kyc not in SIMILAR_FRAUD_KYC:
+            raise ValueError("'kyc' must be true or false")
+        filters['is_kyc_verified'] = SIMILAR_FRAUD_KYC[kyc]
+    for column in SIMILAR_FRAUD_RANGES:
+        bounds = []
+        for name in (f'min_{column}', f'max_{column}'):
+            raw = values.get(name)
+            try:
+                bounds.append(None if raw in (None, '') else float(raw))
+            except (TypeError, ValueError):
+                raise ValueError(f"'{name}' must be a number")
+        if bounds != [None, None]:
+            filters[column] = tuple(bounds)
+    return filters
+
+
+def get_similar_frauds(merchant_id, top_n=10, filters=None):
+    """Calculate top N similar fraud merchants using cosine similarity (indexed)
+
+    filters (from similar_fraud_filters) restricts the search to the fraud
+    merchants matching them; only those are scored.
+    """
+    try:
+        # Get index for target merchant
+        target_idx = merchant_store.index_of(merchant_id)
+        if target_idx is None:
+            return []
+        
+        candidates = None
+        if filters:
+            with span('similarity.filter'):
+                candidates = fraud_filters.candidates(filters)
+        
+        # Top N over the normalized fraud embeddings, excluding the target
+        with span('similarity.search'):
+            rows, scores = similarity_index.search(merchant_store.embeddings[target_idx], top_n,
+                                                   exclude_row=target_idx, candidates=candidates)
+        
+        with span('similarity.records'):
+            similar_frauds = merchant_store.records(rows, SIMILAR_FRAUD_FIELDS)
+        for fraud_data, score in zip(similar_frauds, scores.tolist()):
+            fraud_data['similarity_score'] = score
         
         return similar_frauds
     
@@ -469,6 +1288,34 @@ def get_similar_frauds(merchant_id, top_n=10):
         return []
 
 
+@app.route('/api/merchant/<merchant_id>/similar-frauds', methods=['GET'])
+def get_merchant_similar_frauds(merchant_id):
+    """Top N fraud merchants most similar to any merchant, optionally filtered
+
+    Query parameters: top_n, city, tier, category, kyc (true or false) and
+    min_/max_avg_txn_value, min_/max_chargeback_rate.
+    """
+    try:
+        if merchant_store.index_of(merchant_id) is None:
+            return jsonify({'success': False, 'error': 'Merchant not found'}), 404
+        
+        try:
+            top_n = int_arg('top_n', 10, 1, SIMILAR_FRAUDS_MAX_TOP_N)
+            filters = similar_fraud_filters(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'merchant_id': merchant_id,
+            'similar_frauds': get_similar_frauds(merchant_id, top_n, filters)
+        })
+    
+    except Exception as e:
+        print(f"Error in get_merchant_similar_frauds: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/search', methods=['POST'])
 def search_merchant():
     """Search for merchant by ID"""
@@ -489,9 +1336,531 @@ def search_merchant():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def batch_merchant_ids(data):
+    """Validate the merchant_ids list of a batch request body"""
+    merchant_ids = (data or {}).get('merchant_ids')
+    if not isinstance(merchant_ids, list) or not merchant_ids:
+        raise ValueError('merchant_ids must be a non-empty list')
+    if len(merchant_ids) > BATCH_MAX_IDS:
+        raise ValueError(f'At most {BATCH_MAX_IDS} merchant_ids per request')
+    return merchant_ids
+
+
+def ndjson_response(lines):
+    """Stream an iterable of payloads as newline-delimited JSON
+
+    Lines are compact and encoded with orjson when it can (json.dumps()
+    otherwise); NaN and infinity are written as null.
+    """
+    def generate():
+        for payload in lines:
+            line = fast_dumps(payload, app.json.default)
+            if line is None:
+                line = app.json.dumps(payload, separators=(',', ':')).encode()
+            yield line + b'\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/merchants/batch', methods=['POST'])
+def get_merchants_batch():
+    """Profiles for many merchants, streamed as NDJSON (one line per requested id)"""
+    try:
+        merchant_ids = batch_merchant_ids(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    store = merchant_store
+    rings = ring_index
+    merchant_rows = store.indices_of(merchant_ids)
+    
+    def lines():
+        for start in range(0, len(merchant_ids), BATCH_CHUNK_SIZE):
+            rows = merchant_rows[start:start + BATCH_CHUNK_SIZE]
+            found = rows >= 0
+            records = iter(store.records(rows[found], MERCHANT_DETAIL_FIELDS))
+            ring_numbers = iter(rings.ring_of[rows[found]].tolist())
+            
+            for merchant_id, ok in zip(merchant_ids[start:start + BATCH_CHUNK_SIZE], found.tolist()):
+                if not ok:
+                    yield {'merchant_id': merchant_id, 'success': False, 'error': 'Merchant not found'}
+                    continue
+                ring_no = next(ring_numbers)
+                yield {
+                    'merchant_id': merchant_id,
+                    'success': True,
+                    'merchant': next(records),
+                    'fraud_ring_id': rings.ring_ids[ring_no] if ring_no >= 0 else None
+                }
+    
+    return ndjson_response(lines())
+
+
+@app.route('/api/similar-frauds/batch', methods=['POST'])
+def get_similar_frauds_batch():
+    """Top N similar frauds for many merchants, streamed as NDJSON
+
+    All resolved ids are scored against the fraud embedding matrix in blocks
+    of one matrix product each; unknown ids get a per-line error. An optional
+    "filters" object (keys as for /api/merchant/<id>/similar-frauds) limits
+    every search to the matching fraud merchants.
+    """
+    try:
+        data = request.get_json(silent=True)
+        merchant_ids = batch_merchant_ids(data)
+        top_n = int(data.get('top_n', 10))
+        if top_n < 1:
+            raise ValueError('top_n must be at least 1')
+        if top_n > SIMILAR_FRAUDS_MAX_TOP_N:
+            raise ValueError(f'top_n must be at most {SIMILAR_FRAUDS_MAX_TOP_N}')
+        filters = data.get('filters') or {}
+        if not isinstance(filters, dict):
+            raise ValueError('filters must be an object')
+        filters = similar_fraud_filters(filters)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    store = merchant_store
+    index = similarity_index
+    candidates = fraud_filters.candidates(filters) if filters else None
+    merchant_rows = store.indices_of(merchant_ids)
+    valid = np.flatnonzero(merchant_rows >= 0)
+    
+    def lines():
+        results = index.search_batch(store.embeddings[merchant_rows[valid]], top_n,
+                                     exclude_rows=merchant_rows[valid], candidates=candidates)
+        emitted = 0
+        for start, rows, scores in results:
+            keep = np.isfinite(scores)
+            records = iter(store.records(rows[keep], SIMILAR_FRAUD_FIELDS))
+            score_values = iter(scores[keep].tolist())
+            
+            for i, row_keep in enumerate(keep.tolist()):
+                position = int(valid[start + i])
+                # Ids before this one that could not be resolved
+                while emitted < position:
+                    yield {'merchant_id': merchant_ids[emitted], 'success': False, 'error': 'Merchant not found'}
+                    emitted += 1
+                similar_frauds = []
+                for ok in row_keep:
+                    if ok:
+                        fraud_data = next(records)
+                        fraud_data['similarity_score'] = next(score_values)
+                        similar_frauds.append(fraud_data)
+                yield {'merchant_id': merchant_ids[position], 'success': True, 'similar_frauds': similar_frauds}
+                emitted += 1
+        
+        while emitted < len(merchant_ids):
+            yield {'merchant_id': merchant_ids[emitted], 'success': False, 'error': 'Merchant not found'}
+            emitted += 1
+    
+    return ndjson_response(lines())
+
+
+def write_records(data, key):
+    """Validate the record list of a write request body"""
+    records = (data or {}).get(key)
+    if not isinstance(records, list) or not records:
+        raise ValueError(f'{key} must be a non-empty list')
+    if len(records) > BATCH_MAX_IDS:
+        raise ValueError(f'At most {BATCH_MAX_IDS} {key} per request')
+    return records
+
+
+def persist(statement, rows):
+    """Write rows through to PostgreSQL when the data was loaded from it
+
+    With the CSV fallback, updates only live in memory and the update journal.
+    """
+    if data_source != 'postgres':
+        return
+    conn = get_db_connection()
+    try:
+        with conn, conn.cursor() as cur:
+            execute_values(cur, statement, rows)
+    finally:
+        conn.close()
+
+
+def persist_embeddings(rows, vectors):
+    """Write embeddings (emb_0..emb_15) of the given rows through to PostgreSQL"""
+    columns = ingest.EMBEDDING_COLUMNS
+    persist(f"UPDATE merchants AS m SET {', '.join(f'{c} = v.{c}' for c in columns)} "
+            f"FROM (VALUES %s) AS v(merchant_id, {', '.join(columns)}) WHERE m.merchant_id = v.merchant_id",
+            [(merchant_id, *vector) for merchant_id, vector in
+             zip(merchant_store.merchant_ids[rows].tolist(), np.asarray(vectors).tolist())])
+
+
+def apply_fraud_connections(rows):
+    """Union newly fraud-labelled rows with their fraud neighbors; returns changed rings"""
+    owners, neighbors, _ = graph.adjacency(rows)
+    fraud = merchant_store.columns['is_fraud'][neighbors] == 1
+    return ring_index.union(zip(owners[fraud].tolist(), neighbors[fraud].tolist()))
+
+
+def changed_ring_ids(changed):
+    """Ids of the rings in changed that still exist"""
+    return sorted(ring_index.ring_ids[ring_no] for ring_no in changed if ring_index.sizes[ring_no] > 0)
+
+
+def label_changes(merchant_ids, labels):
+    """(rows, labels) of the label updates that change is_fraud; unknown merchants are skipped"""
+    rows = merchant_store.indices_of(merchant_ids)
+    known = rows >= 0
+    rows, labels = rows[known], np.asarray(labels)[known]
+    # Last label per merchant wins
+    rows, last = np.unique(rows[::-1], return_index=True)
+    labels = labels[::-1][last]
+    moved = merchant_store.columns['is_fraud'][rows] != labels
+    return rows[moved], labels[moved]
+
+
+def invalidate_rings(changed):
+    """Recompute the statistics and drop the cached views of changed rings"""
+    ring_stats.update(changed)
+    top_rings_cache.invalidate(changed)
+
+
+def apply_merchants(records):
+    """Append merchant records to the in-memory state; returns the new rows
+
+    Merchants that already exist are skipped, so a journal entry applied
+    twice is harmless.
+    """
+    global similarity_index, walk_graph
+    frame = ingest.merchant_frame(records)
+    frame = frame[merchant_store.indices_of(frame['merchant_id'].tolist()) < 0]
+    if frame.empty:
+        return np.empty(0, dtype=np.int64)
+    
+    rows = merchant_store.extend(ingest.merchants_from_frame(frame, CITY_MAPPING))
+    graph.add_nodes(len(rows))
+    walk_graph = None
+    ring_index.resize(len(merchant_store))
+    fraud_rows = rows[merchant_store.columns['is_fraud'][rows] == 1]
+    if len(fraud_rows):
+        similarity_index = similarity_index.updated(merchant_store.embeddings, add_rows=fraud_rows)
+        fraud_filters.add(fraud_rows)
+    
+    # Merchants sharing an identifier with the new ones get new shared counts
+    rescored = [rows]
+    for name, (shared_rows, counts) in identifiers.add_rows(rows).items():
+        column = SHARED_COUNT_COLUMNS[name]
+        if counts.max(initial=0) > np.iinfo(merchant_store.columns[column].dtype).max:
+            merchant_store.columns[column] = merchant_store.columns[column].astype(np.int32)
+        merchant_store.set_values(column, shared_rows, counts)
+        rescored.append(shared_rows)
+    if EDGE_SOURCE == 'identifiers':
+        src, dst, weights, reasons = identifiers.edges_for(rows, IDENTIFIER_CLIQUE_MAX, IDENTIFIER_MAX_GROUP)
+        if src:
+            connect(np.asarray(src), np.asarray(dst), weights, reasons)
+    update_risk_scores(np.concatenate(rescored))
+    return rows
+
+
+def connect(src, dst, weights, reasons):
+    """Add edges between merchant rows to the graph and rings; returns the changed ring numbers"""
+    global walk_graph
+    graph.add_edges(src, dst, weights, reasons)
+    walk_graph = None
+    is_fraud = merchant_store.columns['is_fraud']
+    fraud = (is_fraud[src] == 1) & (is_fraud[dst] == 1)
+    changed = ring_index.union(zip(src[fraud].tolist(), dst[fraud].tolist()))
+    invalidate_rings(changed)
+    update_risk_scores(np.concatenate([src, dst]))
+    return changed
+
+
+def apply_edges(records):
+    """Add edge records to the graph and rings; returns the changed ring numbers"""
+    src = merchant_store.indices_of([edge['merchant_a'] for edge in records])
+    dst = merchant_store.indices_of([edge['merchant_b'] for edge in records])
+    known = np.flatnonzero((src >= 0) & (dst >= 0))
+    if len(known) == 0:
+        return set()
+    
+    return connect(src[known], dst[known], [records[i]['weight'] for i in known.tolist()],
+                   [records[i]['reason'] for i in known.tolist()])
+
+
+def apply_labels(records):
+    """Apply fraud label records; returns (flagged rows, unflagged rows, changed ring numbers)"""
+    global similarity_index
+    rows, labels = label_changes([label['merchant_id'] for label in records],
+                                 [label['is_fraud'] for label in records])
+    flagged, unflagged = rows[labels == 1], rows[labels == 0]
+    
+    merchant_store.set_values('is_fraud', rows, labels)
+    changed = ring_index.remove(unflagged, graph.components)
+    changed |= apply_fraud_connections(flagged)
+    if len(rows):
+        similarity_index = similarity_index.updated(merchant_store.embeddings, flagged, unflagged)
+        fraud_filters.add(flagged)
+    invalidate_rings(changed)
+    update_risk_scores(rows)
+    return flagged, unflagged, changed
+
+
+def apply_embeddings(records):
+    """Overwrite merchant embeddings; returns the rows changed"""
+    global similarity_index
+    rows = merchant_store.indices_of([record['merchant_id'] for record in records])
+    known = rows >= 0
+    values = np.array([record['embedding'] for record in records], dtype=np.float32).reshape(len(records), -1)
+    rows = rows[known]
+    
+    merchant_store.set_embeddings(rows, values[known])
+    fraud_rows = rows[merchant_store.columns['is_fraud'][rows] == 1]
+    if len(fraud_rows):
+        similarity_index = similarity_index.updated(merchant_store.embeddings, fraud_rows, fraud_rows)
+    return rows
+
+
+UPDATE_HANDLERS = {
+    'merchants': apply_merchants,
+    'edges': apply_edges,
+    'labels': apply_labels,
+    'embeddings': apply_embeddings
+}
+
+
+def sync_updates():
+    """Apply journal entries written by other server workers (hold update_lock)
+
+    Returns the number of entries applied.
+    """
+    if journal is None:
+        return 0
+    entries = journal.read_new()
+    for entry in entries:
+        UPDATE_HANDLERS[entry['kind']](entry['records'])
+    return len(entries)
+
+
+def record_update(kind, records):
+    """Journal a validated update for the other workers and apply it here
+
+    Call with update_lock and journal.locked() held, after sync_updates().
+    Returns the result of the update handler.
+    """
+    if journal is not None:
+        journal.append({'kind': kind, 'records': records})
+    return UPDATE_HANDLERS[kind](records)
+
+
+@contextmanager
+def update_transaction():
+    """Exclusive access for a write request, with all journaled updates applied"""
+    with update_lock:
+        if journal is None:
+            yield
+            return
+        with journal.locked():
+            sync_updates()
+            yield
+
+
+@app.route('/api/merchants', methods=['POST'])
+def add_merchants():
+    """Append merchants without a restart
+
+    Body: {"merchants": [{"merchant_id": ..., "is_fraud": 0|1, ...}]} using the
+    merchants table columns; "embedding" may replace emb_0..emb_15.
+    """
+    try:
+        records = write_records(request.get_json(silent=True), 'merchants')
+        frame = ingest.merchant_frame(records)
+        new_merchants = ingest.merchants_from_frame(frame, CITY_MAPPING)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        with update_transaction():
+            existing = new_merchants.merchant_ids[merchant_store.indices_of(new_merchants.merchant_ids) >= 0]
+            if len(existing) or len(np.unique(new_merchants.merchant_ids)) < len(new_merchants):
+                duplicate = existing[0] if len(existing) else 'in request'
+                return jsonify({'success': False, 'error': f'Duplicate merchant_id: {duplicate}'}), 409
+            
+            values = frame.astype(object).where(frame.notna(), None).values.tolist()
+            persist(f"INSERT INTO merchants ({', '.join(frame.columns)}) VALUES %s", values)
+            
+            rows = record_update('merchants', records)
+        
+        return jsonify({'success': True, 'merchants_added': len(rows)})
+    
+    except Exception as e:
+        print(f"Error in add_merchants: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/edges', methods=['POST'])
+def add_edges():
+    """Append merchant_edges rows and update fraud rings
+
+    Body: {"edges": [{"merchant_a": ..., "merchant_b": ..., "weight": 1, "reason": "PAN"}]}.
+    Re-adding a connected pair replaces its weight and reason.
+    """
+    try:
+        records = [{
+            'merchant_a': str(edge.get('merchant_a', edge.get('merchant_A'))),
+            'merchant_b': str(edge.get('merchant_b', edge.get('merchant_B'))),
+            'weight': float(edge.get('weight', 1)),
+            'reason': str(edge.get('reason') or 'unknown')
+        } for edge in write_records(request.get_json(silent=True), 'edges')]
+    except (AttributeError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        with update_transaction():
+            ends = [edge['merchant_a'] for edge in records] + [edge['merchant_b'] for edge in records]
+            unknown = np.flatnonzero(merchant_store.indices_of(ends) < 0)
+            if len(unknown):
+                return jsonify({'success': False, 'error': f'Merchant not found: {ends[unknown[0]]}'}), 404
+            
+            persist("INSERT INTO merchant_edges (merchant_a, merchant_b, weight, reason) VALUES %s",
+                    [tuple(edge.values()) for edge in records])
+            
+            changed = record_update('edges', records)
+        
+        return jsonify({'success': True, 'edges_added': len(records), 'rings_changed': changed_ring_ids(changed)})
+    
+    except Exception as e:
+        print(f"Error in add_edges: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/merchants/labels', methods=['POST'])
+def set_fraud_labels():
+    """Flag or un-flag merchants as fraud and update fraud rings
+
+    Body: {"labels": [{"merchant_id": ..., "is_fraud": 0|1}]}. Un-flagging
+    re-splits only the ring the merchant was in.
+    """
+    try:
+        records = [{'merchant_id': str(label['merchant_id']), 'is_fraud': int(label['is_fraud'])}
+                   for label in write_records(request.get_json(silent=True), 'labels')]
+        if any(label['is_fraud'] not in (0, 1) for label in records):
+            raise ValueError('is_fraud must be 0 or 1')
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid labels: {e}'}), 400
+    
+    try:
+        with update_transaction():
+            merchant_ids = [label['merchant_id'] for label in records]
+            unknown = np.flatnonzero(merchant_store.indices_of(merchant_ids) < 0)
+            if len(unknown):
+                return jsonify({'success': False, 'error': f'Merchant not found: {merchant_ids[unknown[0]]}'}), 404
+            
+            rows, labels = label_changes(merchant_ids, [label['is_fraud'] for label in records])
+            persist("UPDATE merchants AS m SET is_fraud = v.is_fraud "
+                    "FROM (VALUES %s) AS v(merchant_id, is_fraud) WHERE m.merchant_id = v.merchant_id",
+                    list(zip(merchant_store.merchant_ids[rows].tolist(), labels.tolist())))
+            
+            flagged, unflagged, changed = record_update('labels', records)
+        
+        return jsonify({
+            'success': True,
+            'flagged': len(flagged),
+            'unflagged': len(unflagged),
+            'rings_changed': changed_ring_ids(changed)
+        })
+    
+    except Exception as e:
+        print(f"Error in set_fraud_labels: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/embeddings', methods=['POST'])
+def embed_merchants():
+    """Embed merchants from random walks over their edges
+
+    Body: {"merchant_ids": [...]}, typically merchants added since the last
+    --refresh-embeddings once their edges are in. All other embeddings stay
+    frozen; merchants without edges keep their embedding.
+    """
+    try:
+        merchant_ids = [str(merchant_id) for merchant_id in
+                        write_records(request.get_json(silent=True), 'merchant_ids')]
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        with update_transaction():
+            rows = merchant_store.indices_of(merchant_ids)
+            unknown = np.flatnonzero(rows < 0)
+            if len(unknown):
+                return jsonify({'success': False, 'error': f'Merchant not found: {merchant_ids[unknown[0]]}'}), 404
+            
+            walks = current_walk_graph()
+            rows = np.unique(rows)
+            rows = rows[walks.degree(rows) > 0]
+            with span('embeddings.incremental'):
+                vectors = node_embeddings.embed_new_nodes(
+                    walks, merchant_store.embeddings, embedding_context, rows, walk_length=EMBED_WALK_LENGTH,
+                    num_walks=EMBED_NUM_WALKS, p=EMBED_P, q=EMBED_Q, window=EMBED_WINDOW,
+                    epochs=EMBED_EPOCHS, seed=EMBED_SEED)
+            persist_embeddings(rows, vectors)
+            
+            record_update('embeddings', [{'merchant_id': merchant_id, 'embedding': vector}
+                                         for merchant_id, vector in
+                                         zip(merchant_store.merchant_ids[rows].tolist(), vectors.tolist())])
+        
+        return jsonify({
+            'success': True,
+            'embedded': len(rows),
+            'without_edges': len(set(merchant_ids)) - len(rows)
+        })
+    
+    except Exception as e:
+        print(f"Error in embed_merchants: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 if __name__ == '__main__':
-    # Load data on startup
-    load_data()
+    if '--prepare-snapshot' in sys.argv:
+        # Run by the production server master: validate or rebuild the snapshot
+        # that its workers map, then exit
+        load_data()
+        sys.exit(0)
+    
+    if '--derive-edges' in sys.argv:
+        # Rebuild merchant_edges from shared identifiers: write the derived
+        # edges as a CSV with the merchant_edges.csv columns, then exit
+        position = sys.argv.index('--derive-edges') + 1
+        path = sys.argv[position] if position < len(sys.argv) else 'merchant_edges_derived.csv'
+        load_data()
+        edges = derive_edges()
+        pd.DataFrame({
+            'merchant_A': merchant_store.merchant_ids[edges['src']],
+            'merchant_B': merchant_store.merchant_ids[edges['dst']],
+            'weight': edges['weight'],
+            'reason': edges['reasons'][edges['reason']]
+        }).to_csv(path, index=False)
+        print(f"Wrote {len(edges['src']):,} edges to {path}")
+        sys.exit(0)
+    
+    if '--refresh-embeddings' in sys.argv:
+        # Nightly job: retrain all embeddings and save them in the snapshot;
+        # send the production server a HUP afterwards to load it
+        load_data()
+        refresh_embeddings()
+        with update_transaction():
+            fingerprint = data_fingerprint
+            if data_source == 'postgres':
+                # Includes updates the server persisted while training ran
+                conn = get_db_connection()
+                try:
+                    fingerprint = snapshot.db_fingerprint(conn)
+                    fingerprint['edge_source'] = edge_source_config()
+                finally:
+                    conn.close()
+            save_snapshot(fingerprint)
+        sys.exit(0)
+    
+    # Load data on startup (in the reloader child only, not in its parent)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        load_data()
+    else:
+        print("Starting development server; data loads in the reloader process")
     
     # Run Flask app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class ArrayBuffers:
+    """Over-allocated backing storage for arrays that grow by appending
+
+    ``append`` returns a view of the first n + k rows of a buffer that is
+    grown geometrically, so appending is amortized O(rows appended) and
+    readers holding an older (shorter) view are unaffected. Read-only
+    arrays (memory-mapped snapshots) are copied on first write.
+    """
+
+    def __init__(self, headroom=0.25, minimum=1024):
+        self.headroom = headroom
+        self.minimum = minimum
+        self._buffers = {}
+
+    def _owned(self, name, current, rows, dtype):
+        """A writable buffer named name that holds current and has room for rows"""
+        buffer = self._buffers.get(name)
+        n = len(current)
+        # Reuse the buffer only if current is still a view of it
+        if buffer is None or current.base is not buffer or len(buffer) < rows or buffer.dtype != dtype:
+            capacity = max(rows, int(n * (1 + self.headroom)) + self.minimum)
+            buffer = np.empty((capacity,) + current.shape[1:], dtype=dtype)
+            buffer[:n] = current
+            self._buffers[name] = buffer
+        return buffer
+
+    def append(self, name, current, values):
+        """current with values appended (dtype widened if needed), as a buffer view"""
+        values = np.asarray(values)
+        dtype = np.promote_types(current.dtype, values.dtype) if len(values) else current.dtype
+        n = len(current)
+        buffer = self._owned(name, current, n + len(values), dtype)
+        buffer[n:n + len(values)] = values
+        return buffer[:n + len(values)]
+
+    def writable(self, name, current):
+        """current itself if it can be written in place, else a writable copy"""
+        if current.flags.writeable:
+            return current
+        return self._owned(name, current, len(current), current.dtype)[:len(current)]
@@ -0,0 +1,315 @@
+"""Reproducible performance benchmark for the ML service
+
+Generates a synthetic dataset with ML/datagen (fixed seed, configurable scale)
+in the schema of merchant_synthetic_100k_phase6.csv and merchant_edges.csv,
+then measures in fresh
+processes, through the CSV fallback (no PostgreSQL needed):
+
+- cold start: rebuild from the CSVs (writing the snapshot) and snapshot load,
+  each with load time, per-stage times and peak RSS
+- latency (p50/p90/p99) and throughput of /api/merchant/<id> for clean, fraud
+  and largest-ring merchants, /api/top-fraud-rings and get_similar_frauds,
+  through the Flask test client
+
+Usage:
+    python benchmark.py --scale 100k            # or 1m, 10m, or --merchants N
+    python benchmark.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCALES = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Bump when the generator or the measurements change, so results are only
+# compared like for like
+BENCHMARK_VERSION = 2
+
+# The dataset generator lives with the notebook it replaces (ML/datagen)
+ML_DIR = os.path.normpath(os.path.join(SERVICE_DIR, '..', '..', '..', 'ML'))
+
+
+def ensure_dataset(data_dir, n_merchants, seed):
+    """Generate the dataset once per (scale, seed, benchmark version); returns its stats"""
+    out_dir = os.path.join(data_dir, f'{n_merchants}-seed{seed}-v{BENCHMARK_VERSION}')
+    stats_path = os.path.join(out_dir, 'dataset.json')
+    if os.path.exists(stats_path):
+        with open(stats_path) as f:
+            return out_dir, json.load(f)
+
+    sys.path.insert(0, ML_DIR)
+    import datagen
+
+    # node2vec does not scale past a few hundred thousand merchants; the
+    # clustered stand-in keeps rings close in embedding space at any size
+    stats = datagen.generate(out_dir, n_merchants, seed=seed, embedding_method='clustered')
+    with open(stats_path, 'w') as f:
+        json.dump(stats, f, indent=2)
+    return out_dir, stats
+
+
+# ---------------------------------------------------------------------------
+# Measurements (run in a fresh child process per cold start)
+# ---------------------------------------------------------------------------
+
+def latency_stats(timings, errors=0):
+    """Latency percentiles (ms) and throughput of a list of request durations (s)"""
+    timings = np.asarray(timings)
+    return {
+        'requests': int(len(timings)),
+        'errors': errors,
+        'p50_ms': round(float(np.percentile(timings, 50)) * 1000, 3),
+        'p90_ms': round(float(np.percentile(timings, 90)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(timings, 99)) * 1000, 3),
+        'mean_ms': round(float(timings.mean()) * 1000, 3),
+        'max_ms': round(float(timings.max()) * 1000, 3),
+        'throughput_rps': round(len(timings) / float(timings.sum()), 1)
+    }
+
+
+def measure(call, arguments, warmup=50):
+    """Time call(argument) for every argument after a warmup; call returns True on success"""
+    for argument in arguments[:warmup]:
+        call(argument)
+    timings = []
+    errors = 0
+    for argument in arguments:
+        start = time.perf_counter()
+        ok = call(argument)
+        timings.append(time.perf_counter() - start)
+        errors += not ok
+    return latency_stats(timings, errors)
+
+
+def peak_rss_mb():
+    """Peak RSS of this process in MB
+
+    VmHWM restarts at exec, unlike ru_maxrss which Linux carries over from
+    the parent that spawned the child.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import ingest
+    return ingest.peak_rss_mb() or 0
+
+
+def run_child(data_dir, requests, seed, run_latency):
+    """Cold-start the service in this process and benchmark it; returns the results"""
+    os.chdir(data_dir)
+    sys.path.insert(0, SERVICE_DIR)
+    started = time.perf_counter()
+    import app as service
+    import metrics
+    import_seconds = time.perf_counter() - started
+
+    # The CSV fallback directly: the benchmark never depends on a database
+    started = time.perf_counter()
+    service.load_data_from_csv()
+    service.data_ready = True
+    result = {
+        'import_seconds': round(import_seconds, 3),
+        'load_seconds': round(time.perf_counter() - started, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages_seconds': {
+            labels[0]: round(total, 3) for labels, (_, total) in sorted(metrics.stage_seconds.totals().items())
+        }
+    }
+    if not run_latency:
+        return result
+
+    client = service.app.test_client()
+    store = service.merchant_store
+    rng = np.random.default_rng(seed)
+    ring_index = service.ring_index
+    largest = int(np.argmax(ring_index.sizes))
+    in_ring = ring_index.ring_of >= 0
+    is_fraud = store.columns['is_fraud'] == 1
+
+    def sample(rows):
+        return store.merchant_ids[rng.choice(rows, requests)].tolist()
+
+    clean = sample(np.flatnonzero(~is_fraud))
+    fraud = sample(np.flatnonzero(is_fraud & (ring_index.ring_of != largest)))
+    largest_ring = sample(ring_index.members(largest))
+
+    def merchant(merchant_id):
+        return client.get(f'/api/merchant/{merchant_id}').status_code == 200
+
+    def top_rings(query):
+        return client.get(f'/api/top-fraud-rings{query}', headers={'Accept-Encoding': 'gzip'}).status_code == 200
+
+    def similar(merchant_id):
+        return len(service.get_similar_frauds(merchant_id, top_n=10)) > 0
+
+    # Pages across the ring list exercise slice building and the response cache
+    n_rings = len(ring_index)
+    pages = [f'?limit=10&offset={int(offset)}' for offset in rng.integers(0, max(1, n_rings - 10), requests)]
+
+    result['latency'] = {
+        'merchant_clean': measure(merchant, clean),
+        'merchant_fraud': measure(merchant, fraud),
+        'merchant_largest_ring': measure(merchant, largest_ring),
+        'top_fraud_rings': measure(top_rings, [''] * requests),
+        'top_fraud_rings_pages': measure(top_rings, pages, warmup=0),
+        'similar_frauds': measure(similar, fraud)
+    }
+    result['loaded'] = {
+        'merchants': len(store),
+        'fraud_merchants': int(is_fraud.sum()),
+        'edges': int(service.graph.n_edges),
+        'fraud_rings': n_rings,
+        'largest_ring': int(ring_index.sizes[largest]),
+        'fraud_merchants_in_rings': int((in_ring & is_fraud).sum())
+    }
+    return result
+
+
+def spawn_child(data_dir, requests, seed, run_latency):
+    """Run run_child() in a fresh interpreter so load time and peak RSS are its own"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        out = f.name
+    try:
+        command = [sys.executable, os.path.abspath(__file__), '--child', data_dir, '--child-out', out,
+                   '--requests', str(requests), '--seed', str(seed)]
+        if run_latency:
+            command.append('--latency')
+        env = dict(os.environ, SNAPSHOT_DIR='ml_snapshot')
+        subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            return json.load(f)
+    finally:
+        os.unlink(out)
+
+
+def environment():
+    """Where the benchmark ran, for comparing results across machines and commits"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--', '.'], cwd=SERVICE_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def run_benchmark(n_merchants, seed, data_dir, requests, out):
+    data_dir, dataset = ensure_dataset(os.path.abspath(data_dir), n_merchants, seed)
+
+    # Rebuild from the CSVs (this also writes the snapshot), then map the snapshot
+    shutil.rmtree(os.path.join(data_dir, 'ml_snapshot'), ignore_errors=True)
+    print("Cold start from CSV...")
+    from_csv = spawn_child(data_dir, requests, seed, run_latency=False)
+    print(f"  {from_csv['load_seconds']}s, peak RSS {from_csv['peak_rss_mb']} MB")
+    print("Cold start from snapshot + latency...")
+    from_snapshot = spawn_child(data_dir, requests, seed, run_latency=True)
+    print(f"  {from_snapshot['load_seconds']}s, peak RSS {from_snapshot['peak_rss_mb']} MB")
+
+    latency = from_snapshot.pop('latency')
+    results = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'environment': environment(),
+        'dataset': dataset,
+        'loaded': from_snapshot.pop('loaded'),
+        'cold_start': {'csv': from_csv, 'snapshot': from_snapshot},
+        'latency': latency
+    }
+
+    if out is None:
+        out = os.path.join('benchmark_results', f"{n_merchants}-{results['environment']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for name, stats in latency.items():
+        print(f"{name:24} p50 {stats['p50_ms']:8.3f} ms  p99 {stats['p99_ms']:8.3f} ms  "
+              f"{stats['throughput_rps']:9.1f} req/s")
+    print(f"Results written to {out}")
+
+
+# ---------------------------------------------------------------------------
+# Comparing results
+# ---------------------------------------------------------------------------
+
+def numeric_leaves(tree, prefix=''):
+    """{dotted path: number} of every numeric value in a result tree"""
+    leaves = {}
+    for key, value in tree.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            leaves.update(numeric_leaves(value, f'{path}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[path] = value
+    return leaves
+
+
+def compare(old_path, new_path):
+    """Print every measurement of two result files side by side with the relative change"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old.get('benchmark_version') != new.get('benchmark_version') or old.get('dataset') != new.get('dataset'):
+        print("Warning: results come from different benchmark versions or datasets")
+    print(f"{'metric':58} {old['environment'].get('commit') or 'old':>12} "
+          f"{new['environment'].get('commit') or 'new':>12} {'change':>9}")
+    before, after = numeric_leaves(old), numeric_leaves(new)
+    for path in before:
+        if path.startswith(('environment.', 'dataset.', 'benchmark_version')) or path not in after:
+            continue
+        change = (after[path] - before[path]) / before[path] * 100 if before[path] else 0.0
+        print(f"{path:58} {before[path]:12g} {after[path]:12g} {change:+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='100k', help='dataset size')
+    parser.add_argument('--merchants', type=int, help='dataset size in merchants (overrides --scale)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=2000, help='timed requests per latency scenario')
+    parser.add_argument('--data-dir', default='benchmark_data', help='where generated datasets are kept')
+    parser.add_argument('--out', help='result file (default benchmark_results/<merchants>-<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-out', help=argparse.SUPPRESS)
+    parser.add_argument('--latency', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.child:
+        result = run_child(args.child, args.requests, args.seed, args.latency)
+        with open(args.child_out, 'w') as f:
+            json.dump(result, f)
+    else:
+        run_benchmark(args.merchants or SCALES[args.scale], args.seed, args.data_dir, args.requests, args.out)
+
+
+if __name__ == '__main__':
+    main()
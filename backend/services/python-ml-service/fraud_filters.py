@@ -0,0 +1,108 @@
+import numpy as np
+
+
+# Attributes similar-fraud searches can filter on: equality on category codes
+# (or small integers) and ranges on numeric columns
+EQUALITY_COLUMNS = ['city', 'merchant_tier', 'merchant_category', 'is_kyc_verified']
+RANGE_COLUMNS = ['avg_txn_value', 'chargeback_rate']
+
+
+class FraudFilterIndex:
+    """Partition indexes over the attributes of fraud merchants
+
+    For every EQUALITY_COLUMNS attribute the fraud rows are partitioned by
+    value (rows with value v are ``rows[offsets[v]:offsets[v + 1]]``,
+    ascending); for every RANGE_COLUMNS attribute they are sorted by value.
+    A filter is resolved by taking the smallest partition or value range
+    among its conditions and checking the remaining conditions on those
+    rows only, so the more selective a filter, the fewer rows it touches.
+
+    Fraud merchants added after the build are kept in a short list and
+    checked directly until there are enough of them to rebuild. Rows that
+    stopped being fraud stay in the partitions; callers intersect with the
+    current fraud rows (FraudSimilarityIndex does).
+    """
+
+    def __init__(self, store, fraud_rows):
+        self.store = store
+        self._build(fraud_rows)
+
+    def _build(self, fraud_rows):
+        rows = np.sort(np.asarray(fraud_rows, dtype=np.int64))
+        self.partitions = {}
+        for column in EQUALITY_COLUMNS:
+            if column not in self.store.columns:
+                continue
+            values = np.asarray(self.store.columns[column][rows], dtype=np.int64)
+            order = np.argsort(values, kind='stable')
+            offsets = np.zeros(int(values.max(initial=-1)) + 2, dtype=np.int64)
+            np.cumsum(np.bincount(values, minlength=len(offsets) - 1), out=offsets[1:])
+            self.partitions[column] = (offsets, rows[order])
+        self.ranges = {}
+        for column in RANGE_COLUMNS:
+            if column not in self.store.columns:
+                continue
+            values = np.asarray(self.store.columns[column][rows], dtype=np.float64)
+            known = ~np.isnan(values)
+            order = np.argsort(values[known], kind='stable')
+            self.ranges[column] = (values[known][order], rows[known][order])
+        self.n_rows = len(rows)
+        self.added = np.empty(0, dtype=np.int64)
+
+    def add(self, rows):
+        """Account for merchants that became fraud (new or re-labelled)"""
+        self.added = np.union1d(self.added, np.asarray(rows, dtype=np.int64))
+        if len(self.added) > max(4096, self.n_rows // 100):
+            self._build(self.store.fraud_indices())
+
+    def _matches(self, rows, filters):
+        """Mask of rows passing every condition, checked on the store columns"""
+        keep = np.ones(len(rows), dtype=bool)
+        for column, condition in filters.items():
+            values = self.store.columns[column][rows]
+            if column in RANGE_COLUMNS:
+                low, high = condition
+                values = np.asarray(values, dtype=np.float64)
+                keep &= ~np.isnan(values)
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+            else:
+                keep &= values == condition
+        return keep
+
+    def _driver(self, column, condition):
+        """Rows of one condition's partition or value range (ascending for partitions)"""
+        if column in self.partitions:
+            offsets, rows = self.partitions[column]
+            if condition < 0 or condition >= len(offsets) - 1:
+                return rows[:0]
+            return rows[offsets[condition]:offsets[condition + 1]]
+        values, rows = self.ranges[column]
+        low, high = condition
+        start = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+        stop = len(values) if high is None else int(np.searchsorted(values, high, side='right'))
+        return rows[start:max(start, stop)]
+
+    def candidates(self, filters):
+        """Ascending rows of the fraud merchants passing filters
+
+        filters maps EQUALITY_COLUMNS to a value (a category code; -1 matches
+        nothing) and RANGE_COLUMNS to a (low, high) pair, either end None.
+        """
+        filters = {column: condition for column, condition in filters.items()
+                   if column in self.partitions or column in self.ranges}
+        if not filters:
+            raise ValueError('No filter conditions')
+        drivers = {column: self._driver(column, condition) for column, condition in filters.items()}
+        column = min(drivers, key=lambda name: len(drivers[name]))
+        rows = drivers[column]
+        rest = {name: condition for name, condition in filters.items() if name != column}
+        if rest:
+            rows = rows[self._matches(rows, rest)]
+        rows = np.sort(rows) if column in self.ranges else rows
+        if len(self.added):
+            extra = self.added[self._matches(self.added, filters)]
+            rows = np.union1d(rows, extra)
+        return rows
@@ -0,0 +1,50 @@
+"""Gunicorn settings for the ML service: gunicorn -c gunicorn.conf.py wsgi:app
+
+The master process prepares the snapshot (validating it against the source
+or rebuilding it) before any worker starts, and again on SIGHUP before the
+workers are replaced, so workers only ever map a complete snapshot.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'ml_snapshot')
+
+# Relative data paths (CSV files, SNAPSHOT_DIR) resolve from here, as with python app.py
+chdir = SERVICE_DIR
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Requests are CPU-bound under the GIL, so parallelism comes from processes.
+# Sync workers also finish every queued connection on a graceful reload,
+# which gthread workers (WEB_THREADS > 1) do not
+threads = int(os.getenv('WEB_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+
+# Workers load the data themselves (mapping the shared snapshot); the master
+# never imports the app, so a reload picks up new code and data
+preload_app = False
+
+
+def prepare_snapshot():
+    """Validate or rebuild the snapshot in a child process of the master"""
+    if not SNAPSHOT_DIR:
+        return
+    subprocess.run([sys.executable, os.path.join(SERVICE_DIR, 'app.py'), '--prepare-snapshot'], check=True)
+
+
+def on_starting(server):
+    if workers > 1 and not SNAPSHOT_DIR:
+        server.log.warning("SNAPSHOT_DIR is empty: every worker loads its own copy of the data "
+                           "and live updates are not shared between workers")
+    prepare_snapshot()
+
+
+def on_reload(server):
+    try:
+        prepare_snapshot()
+    except subprocess.CalledProcessError as e:
+        server.log.error(f"Snapshot preparation failed ({e}); new workers use the existing snapshot")
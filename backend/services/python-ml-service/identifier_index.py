@@ -0,0 +1,251 @@
+import numpy as np
+
+from merchant_graph import expand_ranges
+
+
+# Identifier type -> merchants column holding its (dictionary-encoded) values
+IDENTIFIER_COLUMNS = {
+    'pan': 'pan_hash',
+    'device': 'device_id_hash',
+    'ip': 'ip_hash',
+    'phone': 'phone_hash',
+    'email': 'email_hash',
+    'pos': 'pos_terminal_id_hash'
+}
+
+# Column with the number of other merchants sharing each identifier
+SHARED_COUNT_COLUMNS = {
+    'pan': 'shared_pan_count',
+    'device': 'shared_device_count',
+    'ip': 'shared_ip_count',
+    'phone': 'shared_phone_count',
+    'email': 'shared_email_count',
+    'pos': 'shared_pos_terminal_count'
+}
+
+# Reason and weight of derived edges; PAN/DEVICE/IP match merchant_edges
+EDGE_REASONS = {
+    'pan': ('PAN', 3),
+    'device': ('DEVICE', 2),
+    'ip': ('IP', 1),
+    'phone': ('PHONE', 2),
+    'email': ('EMAIL', 2),
+    'pos': ('POS', 1)
+}
+
+
+def group_arrays(codes, n_labels):
+    """(offsets, rows) grouping rows by code: rows with code c are rows[offsets[c]:offsets[c + 1]], ascending"""
+    codes = np.asarray(codes)
+    n = max(len(codes), 1)
+    # Sorting code * n + row (unique keys) is several times faster than a stable argsort
+    keys = codes.astype(np.int64) * n + np.arange(len(codes))
+    keys.sort()
+    rows = (keys % n).astype(np.int32)
+    offsets = np.zeros(n_labels + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n_labels), out=offsets[1:])
+    return offsets, rows
+
+
+class IdentifierIndex:
+    """Identifier value -> merchant rows, one inverted index per identifier type
+
+    Built over the category codes of the store's identifier columns: the rows
+    using code c of a type are ``rows[offsets[c]:offsets[c + 1]]``, in
+    ascending order. Blank values ('') are never matched. Merchants appended
+    after the index was built (rows >= ``indexed_rows``) are scanned directly
+    until there are enough of them to rebuild, like edges in MerchantGraph.
+    """
+
+    def __init__(self, store, groups=None, indexed_rows=None):
+        self.store = store
+        self.types = [name for name, column in IDENTIFIER_COLUMNS.items() if column in store.categories]
+        if groups is None:
+            self._build()
+        else:
+            self.groups = groups
+            self.indexed_rows = indexed_rows
+
+    def _build(self):
+        """(Re)build the inverted index over all current merchants"""
+        self.groups = {}
+        for name in self.types:
+            column = IDENTIFIER_COLUMNS[name]
+            self.groups[name] = group_arrays(self.store.columns[column], len(self.store.categories[column]))
+        self.indexed_rows = len(self.store)
+
+    @classmethod
+    def from_arrays(cls, store, arrays):
+        """Rebuild from to_arrays() output (arrays may be memory-mapped)"""
+        groups = {name: (arrays[f'{name}.offsets'], arrays[f'{name}.rows'])
+                  for name in IDENTIFIER_COLUMNS if f'{name}.offsets' in arrays}
+        return cls(store, groups, int(arrays['indexed_rows']))
+
+    def to_arrays(self):
+        """Index arrays keyed by name, for writing a snapshot"""
+        if self.indexed_rows < len(self.store):
+            self._build()
+        arrays = {'indexed_rows': np.array(self.indexed_rows, dtype=np.int64)}
+        for name, (offsets, rows) in self.groups.items():
+            arrays[f'{name}.offsets'] = offsets
+            arrays[f'{name}.rows'] = rows
+        return arrays
+
+    def code_of(self, name, value):
+        """Category code of an identifier value, or None if no merchant (ever) used it"""
+        if not value:
+            return None
+        return self.store.code_of(IDENTIFIER_COLUMNS[name], value)
+
+    def members(self, name, code):
+        """Ascending rows of the merchants whose identifier of type name has the given code"""
+        offsets, rows = self.groups[name]
+        indexed = rows[offsets[code]:offsets[code + 1]] if code < len(offsets) - 1 else rows[:0]
+        if self.indexed_rows == len(self.store):
+            return indexed
+        appended = self.store.columns[IDENTIFIER_COLUMNS[name]][self.indexed_rows:]
+        return np.concatenate([indexed, self.indexed_rows + np.flatnonzero(appended == code)])
+
+    def lookup(self, name, value):
+        """Rows of the merchants using an identifier value (empty if unknown)"""
+        code = self.code_of(name, value)
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        return self.members(name, code)
+
+    def blank_code(self, name):
+        """Code of the blank value of type name, or None if no merchant lacks it"""
+        return self.store.code_of(IDENTIFIER_COLUMNS[name], '')
+
+    def shared_counts(self, name):
+        """Number of other merchants sharing each merchant's identifier of type name (0 for blanks)"""
+        if self.indexed_rows < len(self.store):
+            self._build()
+        offsets, _ = self.groups[name]
+        codes = self.store.columns[IDENTIFIER_COLUMNS[name]]
+        counts = np.diff(offsets)[codes] - 1
+        blank = self.blank_code(name)
+        if blank is not None:
+            counts[codes == blank] = 0
+        return counts
+
+    def add_rows(self, rows):
+        """Account for appended merchants; returns {type: (rows, shared counts)} to write
+
+        Every merchant sharing an identifier with one of the new rows is
+        returned, with the new rows themselves.
+        """
+        if len(self.store) - self.indexed_rows > max(4096, len(self.store) // 100):
+            self._build()
+        changed = {}
+        for name in self.types:
+            codes = np.unique(self.store.columns[IDENTIFIER_COLUMNS[name]][rows])
+            codes = codes[codes != self.blank_code(name)]
+            groups = [self.members(name, code) for code in codes.tolist()]
+            if not groups:
+                changed[name] = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+                continue
+            sizes = np.array([len(group) for group in groups])
+            changed[name] = (np.concatenate(groups), np.repeat(sizes - 1, sizes))
+        return changed
+
+    def derive_edges(self, clique_max, max_group=0):
+        """Edges between merchants sharing an identifier, in ingest's edge format
+
+        Groups of up to clique_max merchants are fully connected; larger
+        groups become a star around their lowest row, so a hot identifier
+        adds one edge per member instead of a quadratic number. Groups of
+        more than max_group merchants are skipped (0 keeps all). A pair
+        sharing several identifiers keeps the heaviest reason. Returns
+        (edges, stats) with stats per type: groups, cliques, stars, skipped
+        and edges.
+        """
+        if self.indexed_rows < len(self.store):
+            self._build()
+        src, dst, kind, stats = [], [], [], {}
+        for type_no, name in enumerate(self.types):
+            offsets, rows = self.groups[name]
+            sizes = np.diff(offsets)
+            blank = self.blank_code(name)
+            if blank is not None:
+                sizes[blank] = 0
+            shared = sizes >= 2
+            if max_group:
+                skipped = shared & (sizes > max_group)
+                shared &= ~skipped
+            else:
+                skipped = np.zeros(len(sizes), dtype=bool)
+            cliques = np.flatnonzero(shared & (sizes <= clique_max))
+            stars = np.flatnonzero(shared & (sizes > clique_max))
+            count = 0
+
+            # Cliques, one matrix of groups per size
+            for size in np.unique(sizes[cliques]).tolist():
+                groups = cliques[sizes[cliques] == size]
+                members = rows[offsets[groups][:, None] + np.arange(size)]
+                first, second = np.triu_indices(size, 1)
+                src.append(members[:, first].ravel())
+                dst.append(members[:, second].ravel())
+                count += src[-1].size
+
+            # Stars: every member but the first joined to the first
+            hubs = rows[offsets[stars]]
+            src.append(np.repeat(hubs, sizes[stars] - 1))
+            dst.append(rows[expand_ranges(offsets[stars] + 1, sizes[stars] - 1)])
+            count += src[-1].size
+
+            kind.append(np.full(count, type_no, dtype=np.int16))
+            stats[name] = {'groups': int(shared.sum()), 'cliques': len(cliques), 'stars': len(stars),
+                           'skipped': int(skipped.sum()), 'edges': count}
+
+        src = np.concatenate(src).astype(np.int64) if src else np.empty(0, dtype=np.int64)
+        dst = np.concatenate(dst).astype(np.int64) if dst else np.empty(0, dtype=np.int64)
+        kind = np.concatenate(kind) if kind else np.empty(0, dtype=np.int16)
+        weights = np.array([EDGE_REASONS[name][1] for name in self.types], dtype=np.int16)[kind]
+
+        # One edge per pair: the heaviest identifier, then the earliest type
+        keys = np.minimum(src, dst) * len(self.store) + np.maximum(src, dst)
+        order = np.lexsort((kind, -weights, keys))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = keys[order][1:] != keys[order][:-1]
+        keep = np.sort(order[first])
+
+        reasons = np.array([EDGE_REASONS[name][0] for name in self.types], dtype=str)
+        labels = np.unique(reasons)
+        edges = {
+            'src': src[keep].astype(np.int32),
+            'dst': dst[keep].astype(np.int32),
+            'weight': weights[keep],
+            'reason': np.searchsorted(labels, reasons)[kind[keep]].astype(np.int16),
+            'reasons': labels
+        }
+        return edges, stats
+
+    def edges_for(self, rows, clique_max, max_group=0):
+        """(src, dst, weight, reason labels) joining appended rows to merchants sharing an identifier
+
+        A new merchant is connected to every other member of a group of up
+        to clique_max merchants and to the group's lowest row otherwise, the
+        same shapes derive_edges() builds; a pair sharing several identifiers
+        keeps the heaviest reason. Call after add_rows().
+        """
+        edges = {}
+        for name in self.types:
+            reason, weight = EDGE_REASONS[name]
+            codes = self.store.columns[IDENTIFIER_COLUMNS[name]]
+            blank = self.blank_code(name)
+            for row in np.asarray(rows).tolist():
+                code = int(codes[row])
+                if code == blank:
+                    continue
+                members = self.members(name, code)
+                if len(members) < 2 or (max_group and len(members) > max_group):
+                    continue
+                others = members[members != row] if len(members) <= clique_max else members[:1]
+                for other in others[others != row].tolist():
+                    pair = (min(row, other), max(row, other))
+                    if pair not in edges or edges[pair][0] < weight:
+                        edges[pair] = (weight, reason)
+        pairs = list(edges)
+        return ([u for u, _ in pairs], [v for _, v in pairs],
+                [edges[pair][0] for pair in pairs], [edges[pair][1] for pair in pairs])
@@ -0,0 +1,378 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from merchant_store import MerchantStore
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', '200000'))
+PROGRESS_EVERY_ROWS = 1_000_000
+
+EMBEDDING_COLUMNS = [f'emb_{i}' for i in range(16)]
+
+# In-memory types for the merchants table (backend/database/load_merchant_data.sql).
+# 'category' columns are dictionary-encoded as int32 codes plus one label array;
+# integer types are minimums and are widened if a chunk does not fit.
+MERCHANT_SCHEMA = {
+    'merchant_id': 'id',
+    'is_fraud': np.int8,
+    'merchant_registration_date': 'datetime',
+    'merchant_category': 'category',
+    'business_city': 'category',
+    'merchant_tier': 'category',
+    'is_kyc_verified': np.int8,
+    'pan_hash': 'category',
+    'device_id_hash': 'category',
+    'ip_hash': 'category',
+    'total_txns_90d': np.int32,
+    'avg_txn_value': np.float64,
+    'chargeback_rate': np.float64,
+    'refund_ratio': np.float64,
+    'merchant_age_days': np.int16,
+    'total_txns_30d': np.int32,
+    'total_txns_7d': np.int32,
+    'avg_txn_value_30d': np.float64,
+    'median_txn_value_90d': np.float64,
+    'std_txn_value_90d': np.float64,
+    'min_txn_value_30d': np.float64,
+    'max_txn_value_30d': np.float64,
+    'pct_high_value_txns': np.float64,
+    'high_value_txns_90d': np.int32,
+    'high_value_txns_30d': np.int32,
+    'shared_pan_count': np.int16,
+    'shared_device_count': np.int16,
+    'shared_ip_count': np.int16,
+    'phone_hash': 'category',
+    'email_hash': 'category',
+    'pos_terminal_id_hash': 'category',
+    'shared_phone_count': np.int16,
+    'shared_email_count': np.int16,
+    'shared_pos_terminal_count': np.int16,
+    **{col: np.float32 for col in EMBEDDING_COLUMNS}
+}
+
+# merchant_edges columns; the endpoint columns are 'merchant_a'/'merchant_b'
+# when read from PostgreSQL and 'merchant_A'/'merchant_B' in the CSV
+EDGE_COLUMNS = ['merchant_a', 'merchant_b', 'weight', 'reason']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Progress:
+    """Periodic row-count, throughput and peak-memory reporting for one ingest"""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.started = time.time()
+        self._next_report = PROGRESS_EVERY_ROWS
+
+    def _line(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        peak = peak_rss_mb()
+        memory = f", peak RSS {peak:,.0f} MB" if peak is not None else ""
+        return f"{self.label}: {self.rows:,} rows in {elapsed:.1f}s ({self.rows / elapsed:,.0f} rows/s{memory})"
+
+    def update(self, rows):
+        self.rows += rows
+        if self.rows >= self._next_report:
+            print(f"  {self._line()}")
+            self._next_report += PROGRESS_EVERY_ROWS
+
+    def done(self):
+        print(self._line())
+
+
+def _to_int(values, dtype, column):
+    """Cast a float chunk to the schema integer type, widening if it does not fit"""
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    for candidate in (dtype, np.int16, np.int32, np.int64):
+        if np.dtype(candidate).itemsize < np.dtype(dtype).itemsize:
+            continue
+        info = np.iinfo(candidate)
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            if candidate is not dtype:
+                print(f"  {column}: values exceed {np.dtype(dtype).name}, widening to {np.dtype(candidate).name}")
+            return values.astype(candidate)
+    raise ValueError(f"{column}: values out of int64 range")
+
+
+class _CategoryColumn:
+    """Dictionary encoding built chunk by chunk
+
+    Each chunk is factorized locally; the global dictionary is the sorted
+    union of the chunk dictionaries, so no per-value Python dict is needed.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def add(self, values):
+        codes, uniques = pd.factorize(pd.Series(values).fillna(''))
+        self.chunks.append((codes.astype(np.int32), np.asarray(uniques, dtype=str)))
+
+    def finish(self):
+        if not self.chunks:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=str)
+        labels = np.unique(np.concatenate([uniques for _, uniques in self.chunks]))
+        codes = np.concatenate([
+            np.searchsorted(labels, uniques).astype(np.int32)[local] for local, uniques in self.chunks
+        ])
+        self.chunks = []
+        return codes, labels
+
+
+class MerchantBuilder:
+    """Accumulates typed merchant chunks and assembles a MerchantStore"""
+
+    def __init__(self):
+        self.ids = []
+        self.columns = {}
+        self.categories = {}
+        self.embeddings = []
+
+    def add(self, chunk):
+        self.ids.append(np.asarray(chunk['merchant_id'].astype(str).values, dtype=str))
+        self.embeddings.append(np.ascontiguousarray(chunk[EMBEDDING_COLUMNS].values, dtype=np.float32))
+
+        for col, kind in MERCHANT_SCHEMA.items():
+            if col not in chunk.columns or col == 'merchant_id' or col in EMBEDDING_COLUMNS:
+                continue
+            values = chunk[col]
+            if kind == 'category':
+                self.categories.setdefault(col, _CategoryColumn()).add(values.values)
+            elif kind == 'datetime':
+                parsed = pd.to_datetime(values, errors='coerce', format='ISO8601')
+                self.columns.setdefault(col, []).append(parsed.values.astype('datetime64[s]'))
+            elif np.issubdtype(kind, np.integer):
+                self.columns.setdefault(col, []).append(
+                    _to_int(pd.to_numeric(values, errors='coerce'), kind, col))
+            else:
+                self.columns.setdefault(col, []).append(
+                    np.asarray(pd.to_numeric(values, errors='coerce'), dtype=kind))
+
+    def build(self, city_mapping=None):
+        merchant_ids = np.concatenate(self.ids) if self.ids else np.empty(0, dtype=str)
+        embeddings = (np.concatenate(self.embeddings) if self.embeddings
+                      else np.empty((0, len(EMBEDDING_COLUMNS)), dtype=np.float32))
+        columns = {col: np.concatenate(parts) for col, parts in self.columns.items()}
+        categories = {}
+        for col, encoder in self.categories.items():
+            columns[col], categories[col] = encoder.finish()
+
+        # 'city' shares the business_city codes; only the labels differ
+        if 'business_city' in columns:
+            city_labels = categories['business_city']
+            if city_mapping:
+                city_labels = np.array([city_mapping.get(c, c) for c in city_labels.tolist()], dtype=str)
+            columns['city'] = columns['business_city']
+            categories['city'] = city_labels
+
+        self.ids = self.embeddings = None
+        self.columns = self.categories = None
+        return MerchantStore(merchant_ids, columns, categories, embeddings)
+
+
+class EdgeBuilder:
+    """Accumulates edge chunks as merchant-row, weight and reason-code arrays"""
+
+    def __init__(self, store):
+        self.store = store
+        self.src = []
+        self.dst = []
+        self.weight = []
+        self.reason = _CategoryColumn()
+        self.skipped = 0
+
+    def add(self, chunk):
+        src = self.store.indices_of(chunk['merchant_a'].astype(str).values)
+        dst = self.store.indices_of(chunk['merchant_b'].astype(str).values)
+        valid = (src >= 0) & (dst >= 0)
+        self.skipped += int((~valid).sum())
+
+        self.src.append(src[valid].astype(np.int32))
+        self.dst.append(dst[valid].astype(np.int32))
+        weights = pd.to_numeric(chunk['weight'], errors='coerce').fillna(1).values
+        self.weight.append(np.asarray(weights[valid], dtype=np.float32))
+        self.reason.add(chunk['reason'].fillna('unknown').values[valid])
+
+    def build(self):
+        if self.skipped:
+            print(f"Skipped {self.skipped:,} edges that reference unknown merchants")
+        weight = np.concatenate(self.weight) if self.weight else np.empty(0, dtype=np.float32)
+        # Integral weights (the usual 1/2/3) are kept as integers
+        if len(weight) and np.all(weight == np.round(weight)) and np.abs(weight).max() < 2 ** 15:
+            weight = weight.astype(np.int16)
+        reason, reasons = self.reason.finish()
+        return {
+            'src': np.concatenate(self.src) if self.src else np.empty(0, dtype=np.int32),
+            'dst': np.concatenate(self.dst) if self.dst else np.empty(0, dtype=np.int32),
+            'weight': weight,
+            'reason': reason.astype(np.int16),
+            'reasons': reasons
+        }
+
+
+def _csv_read_options(columns):
+    """read_csv options for a known subset of columns; numbers are parsed as floats"""
+    dtypes = {}
+    for col in columns:
+        kind = MERCHANT_SCHEMA.get(col)
+        if kind in ('id', 'category', 'datetime') or kind is None:
+            dtypes[col] = object
+        elif kind is np.float32:
+            dtypes[col] = np.float32
+        else:
+            dtypes[col] = np.float64
+    return {'usecols': lambda c: c in columns, 'dtype': dtypes}
+
+
+def _csv_chunks(source, chunk_rows, **options):
+    """DataFrame chunks of a CSV file or stream"""
+    return pd.read_csv(source, chunksize=chunk_rows, **options)
+
+
+def _copy_chunks(conn, query, chunk_rows, **options):
+    """DataFrame chunks of `COPY (query) TO STDOUT`, streamed through a pipe
+
+    A background thread writes the COPY output into the pipe while chunks are
+    parsed from the other end, so the result set is never held in memory.
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as sink, conn.cursor() as cur:
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", sink)
+        except Exception as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as source:
+            yield from _csv_chunks(source, chunk_rows, **options)
+    except Exception:
+        producer.join()
+        if errors:
+            raise errors[0]
+        raise
+    producer.join()
+    if errors:
+        raise errors[0]
+
+
+def _ingest(chunks, builder, label):
+    progress = Progress(label)
+    for chunk in chunks:
+        builder.add(chunk)
+        progress.update(len(chunk))
+    progress.done()
+
+
+def read_merchants_csv(path, city_mapping=None, chunk_rows=CHUNK_ROWS):
+    """Stream the merchants CSV into a MerchantStore"""
+    builder = MerchantBuilder()
+    _ingest(_csv_chunks(path, chunk_rows, **_csv_read_options(MERCHANT_SCHEMA)), builder, 'merchants')
+    return builder.build(city_mapping)
+
+
+def read_merchants_db(conn, city_mapping=None, chunk_rows=CHUNK_ROWS):
+    """Stream the merchants table into a MerchantStore via COPY"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM merchants LIMIT 0")
+        available = {desc[0] for desc in cur.description}
+    columns = [col for col in MERCHANT_SCHEMA if col in available]
+
+    builder = MerchantBuilder()
+    query = f"SELECT {', '.join(columns)} FROM merchants"
+    _ingest(_copy_chunks(conn, query, chunk_rows, **_csv_read_options(columns)), builder, 'merchants')
+    return builder.build(city_mapping)
+
+
+def read_edges_csv(path, store, chunk_rows=CHUNK_ROWS):
+    """Stream the edges CSV into merchant-row edge arrays"""
+    builder = EdgeBuilder(store)
+    chunks = (chunk.rename(columns=str.lower) for chunk in _csv_chunks(
+        path, chunk_rows, usecols=lambda c: c.lower() in EDGE_COLUMNS,
+        dtype={'merchant_A': object, 'merchant_B': object, 'reason': object}))
+    _ingest(chunks, builder, 'edges')
+    return builder.build()
+
+
+def read_edges_db(conn, store, chunk_rows=CHUNK_ROWS):
+    """Stream the merchant_edges table into merchant-row edge arrays via COPY"""
+    builder = EdgeBuilder(store)
+    query = f"SELECT {', '.join(EDGE_COLUMNS)} FROM merchant_edges ORDER BY id"
+    chunks = _copy_chunks(conn, query, chunk_rows,
+                          dtype={'merchant_a': object, 'merchant_b': object, 'reason': object})
+    _ingest(chunks, builder, 'edges')
+    return builder.build()
+
+
+def merchant_frame(records):
+    """Merchant records (JSON objects) as a DataFrame of known schema columns
+
+    ``is_fraud`` (0 or 1) is required. An ``embedding`` list may be given
+    instead of emb_0..emb_15; missing embedding values are 0. Missing or
+    null integer fields (counters, is_kyc_verified) are 0, float fields stay
+    NaN. Raises ValueError for malformed records, including numeric fields
+    given a non-numeric or non-finite value.
+    """
+    rows = []
+    for record in records:
+        if not isinstance(record, dict) or not str(record.get('merchant_id') or '').strip():
+            raise ValueError('Every merchant needs a merchant_id')
+        try:
+            is_fraud = int(record['is_fraud'])
+        except (KeyError, TypeError, ValueError):
+            is_fraud = None
+        if is_fraud not in (0, 1):
+            raise ValueError('is_fraud must be 0 or 1')
+        record = dict(record, merchant_id=str(record['merchant_id']).strip(), is_fraud=is_fraud)
+        embedding = record.pop('embedding', None)
+        if embedding is not None:
+            if not isinstance(embedding, list) or len(embedding) != len(EMBEDDING_COLUMNS):
+                raise ValueError(f"embedding must be a list of {len(EMBEDDING_COLUMNS)} numbers")
+            record.update(zip(EMBEDDING_COLUMNS, embedding))
+        rows.append(record)
+
+    frame = pd.DataFrame.from_records(rows)
+    frame = frame[[col for col in MERCHANT_SCHEMA if col in frame.columns]].copy()
+    for col in EMBEDDING_COLUMNS:
+        frame[col] = pd.to_numeric(frame[col], errors='coerce').fillna(0.0) if col in frame.columns else 0.0
+    for col, kind in MERCHANT_SCHEMA.items():
+        if isinstance(kind, str) or col in EMBEDDING_COLUMNS:
+            continue
+        integer = np.issubdtype(kind, np.integer)
+        if col not in frame.columns:
+            if integer:
+                frame[col] = 0
+            continue
+        values = pd.to_numeric(frame[col], errors='coerce')
+        bad = frame[col].notna() & ~np.isfinite(values.astype(np.float64))
+        if bad.any():
+            raise ValueError(f"{col} must be a finite number")
+        frame[col] = values.fillna(0) if integer else values.astype(np.float64)
+    return frame
+
+
+def merchants_from_frame(frame, city_mapping=None):
+    """Typed MerchantStore for a merchant_frame() result"""
+    builder = MerchantBuilder()
+    builder.add(frame)
+    return builder.build(city_mapping)
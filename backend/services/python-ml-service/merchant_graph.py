@@ -0,0 +1,286 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from array_buffers import ArrayBuffers
+
+
+def expand_ranges(starts, counts):
+    """Concatenation of arange(start, start + count) for every (start, count) pair"""
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    offsets = np.repeat(np.asarray(starts, dtype=np.int64) - (ends - counts), counts)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+class MerchantGraph:
+    """Undirected merchant graph as CSR adjacency over merchant row indices
+
+    Edges are kept as parallel arrays (``src``, ``dst``, ``weight``, reason
+    codes into ``reasons``), deduplicated like ``nx.Graph`` would: a repeated
+    merchant pair keeps the attributes of its last occurrence. The adjacency
+    of row r is ``neighbors[indptr[r]:indptr[r + 1]]``, and ``edge_ids`` gives
+    the edge behind each of those entries.
+
+    Nodes and edges can be added at runtime. Edges added after the CSR
+    arrays were built (ids >= ``csr_edges``) are scanned directly until
+    there are enough of them to rebuild the CSR arrays.
+    """
+
+    def __init__(self, n_nodes, src, dst, weight, reason, reasons):
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        keys = np.minimum(src, dst) * n_nodes + np.maximum(src, dst)
+        # Last occurrence of every pair, in original edge order
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last)
+
+        self.n_nodes = n_nodes
+        self.src = src[keep].astype(np.int32)
+        self.dst = dst[keep].astype(np.int32)
+        self.weight = np.asarray(weight)[keep]
+        self.reason = np.asarray(reason)[keep]
+        self.reasons = np.asarray(reasons)
+
+        self._buffers = ArrayBuffers()
+        self._build_csr()
+
+    def _build_csr(self):
+        """(Re)build the CSR adjacency over all current edges"""
+        # Each edge is listed under both endpoints; self-loops only once
+        loop = self.src == self.dst
+        edge_ids = np.arange(len(self.src), dtype=np.int32)
+        heads = np.concatenate([self.src, self.dst[~loop]])
+        tails = np.concatenate([self.dst, self.src[~loop]])
+        ids = np.concatenate([edge_ids, edge_ids[~loop]])
+        order = np.argsort(heads, kind='stable')
+        indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=self.n_nodes), out=indptr[1:])
+        self.neighbors = tails[order]
+        self.edge_ids = ids[order]
+        self.indptr = indptr
+        self.csr_edges = len(self.src)
+
+    @classmethod
+    def from_edges(cls, n_nodes, edges):
+        """Build from the edge arrays produced by ingest (src/dst/weight/reason/reasons)"""
+        return cls(n_nodes, edges['src'], edges['dst'], edges['weight'], edges['reason'], edges['reasons'])
+
+    def to_arrays(self):
+        """Edge and CSR arrays keyed by name, for writing a snapshot"""
+        if self.csr_edges < len(self.src):
+            self._build_csr()
+        return {
+            'src': self.src, 'dst': self.dst, 'weight': self.weight, 'reason': self.reason,
+            'reasons': self.reasons, 'indptr': self.indptr, 'neighbors': self.neighbors,
+            'edge_ids': self.edge_ids
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild a graph from to_arrays() output (arrays may be memory-mapped)"""
+        graph = cls.__new__(cls)
+        for name, values in arrays.items():
+            setattr(graph, name, values)
+        graph.n_nodes = len(graph.indptr) - 1
+        graph.csr_edges = len(graph.src)
+        graph._buffers = ArrayBuffers()
+        return graph
+
+    @property
+    def n_edges(self):
+        return len(self.src)
+
+    def degree(self, rows=None):
+        """Number of adjacency entries per row (a self-loop counts once)"""
+        if rows is None:
+            rows = np.arange(self.n_nodes)
+        _, _, _, counts = self._adjacency(np.asarray(rows, dtype=np.int64))
+        return counts if np.ndim(rows) else int(counts[0])
+
+    def _adjacency(self, rows):
+        """adjacency() plus the number of entries of each row"""
+        rows = np.atleast_1d(rows)
+        indptr = self.indptr
+        in_csr = np.minimum(rows, len(indptr) - 2)
+        starts = indptr[in_csr]
+        counts = np.where(rows < len(indptr) - 1, indptr[in_csr + 1] - starts, 0)
+        positions = expand_ranges(starts, counts)
+        owners, neighbors, edge_ids = np.repeat(rows, counts), self.neighbors[positions], self.edge_ids[positions]
+
+        if self.csr_edges < len(self.src):
+            extra = np.arange(self.csr_edges, len(self.src), dtype=np.int32)
+            a, b = self.src[extra], self.dst[extra]
+            from_a = np.isin(a, rows)
+            from_b = np.isin(b, rows) & (a != b)
+            owners = np.concatenate([owners, a[from_a], b[from_b]])
+            neighbors = np.concatenate([neighbors, b[from_a], a[from_b]])
+            edge_ids = np.concatenate([edge_ids, extra[from_a], extra[from_b]])
+            row_pos = np.searchsorted(np.sort(rows), np.concatenate([a[from_a], b[from_b]]))
+            counts = counts + np.bincount(np.argsort(rows, kind='stable')[row_pos], minlength=len(rows))
+        return owners, neighbors, edge_ids, counts
+
+    def adjacency(self, rows):
+        """(owner rows, neighbor rows, edge ids) of all adjacency entries of rows"""
+        owners, neighbors, edge_ids, _ = self._adjacency(np.asarray(rows, dtype=np.int64))
+        return owners, neighbors, edge_ids
+
+    def induced_edges(self, rows):
+        """Ids (ascending) of the edges with both endpoints in rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int32)
+        _, neighbors, edge_ids = self.adjacency(rows)
+        member = np.isin(neighbors, rows)
+        return np.unique(edge_ids[member])
+
+    def edge_records(self, edge_ids, merchant_ids):
+        """(source ids, target ids, weights, reasons) of edges as Python lists"""
+        return (
+            merchant_ids[self.src[edge_ids]].tolist(),
+            merchant_ids[self.dst[edge_ids]].tolist(),
+            self.weight[edge_ids].tolist(),
+            self.reasons[self.reason[edge_ids]].tolist()
+        )
+
+    def edge_mask(self, edge_ids, min_weight=None, reason_codes=None):
+        """Edges with weight >= min_weight and a reason in reason_codes (None: no condition)"""
+        keep = np.ones(len(edge_ids), dtype=bool)
+        if min_weight is not None:
+            keep &= self.weight[edge_ids] >= min_weight
+        if reason_codes is not None:
+            keep &= np.isin(self.reason[edge_ids], reason_codes)
+        return keep
+
+    def neighborhood(self, root, hops, max_nodes, max_edges, min_weight=None, reason_codes=None):
+        """Bounded breadth-first neighborhood of a row over edges passing edge_mask()
+
+        Each hop expands the whole frontier at once. When a hop reaches more
+        new rows than max_nodes leaves room for, the rows joined by the
+        heaviest edges are kept and the search stops there. Returns (rows,
+        hop of each row, edge ids, new rows reached per hop, truncated), the
+        root first at hop 0. The edges connect returned rows: the edge each
+        row was reached by first, then the heaviest of the rest, at most
+        max_edges in all.
+        """
+        rows = [np.array([root], dtype=np.int64)]
+        row_hops = [np.zeros(1, dtype=np.int64)]
+        tree_edges = []
+        reached = []
+        visited = rows[0]
+        frontier = rows[0]
+        truncated = False
+        for hop in range(1, hops + 1):
+            _, neighbors, edge_ids = self.adjacency(frontier)
+            keep = self.edge_mask(edge_ids, min_weight, reason_codes) & ~np.isin(neighbors, visited)
+            neighbors, edge_ids = neighbors[keep].astype(np.int64), edge_ids[keep]
+            weight = -self.weight[edge_ids].astype(np.float64)
+
+            # Heaviest edge into every new row, then rows by that weight
+            order = np.lexsort((edge_ids, weight, neighbors))
+            new, first = np.unique(neighbors[order], return_index=True)
+            weight, edge_ids = weight[order][first], edge_ids[order][first]
+            order = np.lexsort((new, weight))
+            reached.append(new[order])
+
+            room = max_nodes - len(visited)
+            truncated = len(new) > room
+            order = order[:room]
+            rows.append(new[order])
+            row_hops.append(np.full(len(order), hop, dtype=np.int64))
+            tree_edges.append(edge_ids[order])
+            frontier = new[order]
+            visited = np.union1d(visited, frontier)
+            if truncated or len(frontier) == 0:
+                break
+
+        rows = np.concatenate(rows)
+        tree = np.concatenate(tree_edges) if tree_edges else np.empty(0, dtype=np.int64)
+        rest = self.induced_edges(rows)
+        rest = rest[self.edge_mask(rest, min_weight, reason_codes) & ~np.isin(rest, tree)]
+        rest = rest[np.lexsort((rest, -self.weight[rest].astype(np.float64)))]
+        edge_ids = np.concatenate([tree, rest])[:max_edges].astype(np.int64)
+        return rows, np.concatenate(row_hops), edge_ids, reached, truncated
+
+    def components(self, rows):
+        """Connected components of the subgraph induced by rows
+
+        Returns (labels, n_components) with labels aligned to rows; components
+        are numbered in order of their first member in rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        by_row = np.argsort(rows, kind='stable')
+        sorted_rows = rows[by_row]
+        edge_ids = self.induced_edges(rows)
+        a = by_row[np.searchsorted(sorted_rows, self.src[edge_ids])]
+        b = by_row[np.searchsorted(sorted_rows, self.dst[edge_ids])]
+        matrix = csr_matrix(
+            (np.ones(len(edge_ids), dtype=np.int8), (a, b)),
+            shape=(len(rows), len(rows))
+        )
+        n_components, labels = connected_components(matrix, directed=False)
+        return labels, n_components
+
+    def add_nodes(self, count):
+        """Grow the graph by count isolated nodes"""
+        self.n_nodes += count
+
+    def reason_codes(self, labels):
+        """Codes of reason labels, adding unseen labels to reasons"""
+        lookup = {label: code for code, label in enumerate(self.reasons.tolist())}
+        for label in labels:
+            if label not in lookup:
+                lookup[label] = len(lookup)
+        if len(lookup) > len(self.reasons):
+            self.reasons = np.asarray(list(lookup.keys()), dtype=str)
+        return np.fromiter((lookup[label] for label in labels), dtype=np.int16, count=len(labels))
+
+    def add_edges(self, src, dst, weight, reasons):
+        """Add edges; a pair that is already connected gets the new attributes
+
+        Returns the ids of the added or updated edges.
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        reason = self.reason_codes(list(reasons))
+        weight = np.asarray(weight)
+        # Keep the stored weight type when the new weights fit it exactly
+        as_stored = weight.astype(self.weight.dtype)
+        if np.array_equal(as_stored, weight):
+            weight = as_stored
+        elif np.promote_types(self.weight.dtype, weight.dtype) != self.weight.dtype:
+            self.weight = self.weight.astype(np.promote_types(self.weight.dtype, weight.dtype))
+
+        # Existing edges between the endpoints, keyed by ordered pair
+        owners, neighbors, edge_ids = self.adjacency(np.unique(src))
+        existing = dict(zip(zip(owners.tolist(), neighbors.tolist()), edge_ids.tolist()))
+
+        ids = np.empty(len(src), dtype=np.int64)
+        appended = []
+        for i, (u, v) in enumerate(zip(src.tolist(), dst.tolist())):
+            edge_id = existing.get((u, v))
+            if edge_id is None:
+                edge_id = len(self.src) + len(appended)
+                existing[(u, v)] = existing[(v, u)] = edge_id
+                appended.append(i)
+            ids[i] = edge_id
+
+        if appended:
+            appended = np.asarray(appended)
+            self.weight = self._buffers.append('weight', self.weight, weight[appended])
+            self.reason = self._buffers.append('reason', self.reason, reason[appended])
+            self.dst = self._buffers.append('dst', self.dst, dst[appended].astype(np.int32))
+            self.src = self._buffers.append('src', self.src, src[appended].astype(np.int32))
+
+        # Attributes in request order, so the last occurrence of a pair wins (as in nx.Graph)
+        self.weight = self._buffers.writable('weight', self.weight)
+        self.reason = self._buffers.writable('reason', self.reason)
+        self.weight[ids] = weight
+        self.reason[ids] = reason
+
+        if len(self.src) - self.csr_edges > max(10000, self.csr_edges // 20):
+            self._build_csr()
+        return ids
@@ -0,0 +1,254 @@
+import numpy as np
+
+from array_buffers import ArrayBuffers
+
+
+class MerchantStore:
+    """Column-oriented merchant table with id lookup and bulk gather
+
+    Every attribute is a plain NumPy array (ids and category labels are
+    fixed-width strings), so the whole store can be written to and
+    memory-mapped from .npy files. Ids are resolved by binary search over
+    a sorted copy of merchant_ids.
+
+    Merchants can be appended and column values overwritten at runtime;
+    appended ids are looked up in a small dict until it is merged into the
+    sorted index.
+    """
+
+    def __init__(self, merchant_ids, columns, categories, embeddings, sorted_ids=None, sorted_rows=None):
+        self.merchant_ids = merchant_ids
+        self.columns = columns
+        self.categories = categories
+        self.embeddings = embeddings
+        if sorted_ids is None:
+            sorted_rows = np.argsort(merchant_ids, kind='stable')
+            sorted_ids = merchant_ids[sorted_rows]
+            if len(sorted_ids) > 1 and (sorted_ids[1:] == sorted_ids[:-1]).any():
+                raise ValueError('merchant_id values must be unique')
+        # Swapped as one tuple so readers never pair ids and rows of different merges
+        self._sorted = (sorted_ids, sorted_rows)
+        self.appended_ids = {}
+        self._buffers = ArrayBuffers()
+        self._label_index = {}
+
+    @property
+    def sorted_ids(self):
+        return self._sorted[0]
+
+    @property
+    def sorted_rows(self):
+        return self._sorted[1]
+
+    def to_arrays(self):
+        """All store arrays keyed by name, for writing a snapshot"""
+        self.merge_appended_ids()
+        arrays = {
+            'merchant_ids': self.merchant_ids,
+            'sorted_ids': self.sorted_ids,
+            'sorted_rows': self.sorted_rows,
+            'embeddings': self.embeddings
+        }
+        for name, values in self.columns.items():
+            arrays[f'col.{name}'] = values
+        for name, labels in self.categories.items():
+            arrays[f'cat.{name}'] = labels
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild a store from to_arrays() output (arrays may be memory-mapped)"""
+        columns = {name[4:]: values for name, values in arrays.items() if name.startswith('col.')}
+        categories = {name[4:]: labels for name, labels in arrays.items() if name.startswith('cat.')}
+        return cls(arrays['merchant_ids'], columns, categories, arrays['embeddings'],
+                   sorted_ids=arrays['sorted_ids'], sorted_rows=arrays['sorted_rows'])
+
+    def __len__(self):
+        return len(self.merchant_ids)
+
+    def index_of(self, merchant_id):
+        """Row index of a merchant id, or None if unknown"""
+        if not isinstance(merchant_id, str):
+            return None
+        sorted_ids, sorted_rows = self._sorted
+        pos = int(np.searchsorted(sorted_ids, merchant_id))
+        if pos < len(sorted_ids) and sorted_ids[pos] == merchant_id:
+            return int(sorted_rows[pos])
+        return self.appended_ids.get(merchant_id)
+
+    def indices_of(self, merchant_ids):
+        """Vectorized id -> row index lookup; unknown ids map to -1"""
+        queries = np.asarray(merchant_ids, dtype=str)
+        sorted_ids, sorted_rows = self._sorted
+        if len(sorted_ids) == 0 or len(queries) == 0:
+            rows = np.full(len(queries), -1, dtype=np.int64)
+        else:
+            pos = np.minimum(np.searchsorted(sorted_ids, queries), len(sorted_ids) - 1)
+            rows = np.where(sorted_ids[pos] == queries, sorted_rows[pos], -1).astype(np.int64)
+        appended = self.appended_ids
+        if appended:
+            for i in np.flatnonzero(rows < 0).tolist():
+                rows[i] = appended.get(queries[i], -1)
+        return rows
+
+    def values(self, column, idx):
+        """Decoded values of a column at the given row index (or index array)"""
+        if column == 'merchant_id':
+            return self.merchant_ids[idx]
+        data = self.columns[column][idx]
+        if column in self.categories:
+            return self.categories[column][data]
+        return data
+
+    def gather(self, idx, fields):
+        """Bulk gather of decoded columns as plain Python lists
+
+        Missing or non-finite float values (NaN, infinity) come back as None,
+        so they serialize as JSON null.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        return {field: _plain_list(self.values(field, idx)) for field in fields}
+
+    def records(self, idx, fields):
+        """Rows at idx as a list of dicts keyed by field name"""
+        gathered = self.gather(idx, fields)
+        columns = [gathered[field] for field in fields]
+        return [dict(zip(fields, row)) for row in zip(*columns)]
+
+    def row(self, idx, fields):
+        """A single row as a dict of Python scalars"""
+        return self.records([idx], fields)[0]
+
+    def fraud_indices(self):
+        """Row indices of all merchants labelled as fraud"""
+        return np.flatnonzero(self.columns['is_fraud'] == 1)
+
+    def merge_appended_ids(self):
+        """Fold ids of appended merchants into the sorted id index"""
+        appended = self.appended_ids
+        if not appended:
+            return
+        new_ids = np.asarray(list(appended.keys()), dtype=str)
+        new_rows = np.fromiter(appended.values(), dtype=np.int64, count=len(new_ids))
+        order = np.argsort(new_ids)
+        new_ids, new_rows = new_ids[order], new_rows[order]
+
+        sorted_ids, sorted_rows = self._sorted
+        sorted_ids = sorted_ids.astype(np.promote_types(sorted_ids.dtype, new_ids.dtype), copy=False)
+        pos = np.searchsorted(sorted_ids, new_ids)
+        self._sorted = (np.insert(sorted_ids, pos, new_ids),
+                        np.insert(np.asarray(sorted_rows, dtype=np.int64), pos, new_rows))
+        self.appended_ids = {}
+
+    def _label_state(self, column):
+        """(length of the sorted label prefix, dict of the other labels) of a categorical column"""
+        state = self._label_index.get(column)
+        if state is None:
+            # Sorted label arrays (as written by ingest) are searched in place;
+            # otherwise, and for labels added later, a dict is used
+            known = self.categories[column]
+            if len(known) < 2 or (known[1:] > known[:-1]).all():
+                state = (len(known), {})
+            else:
+                state = (0, {label: code for code, label in enumerate(known.tolist())})
+            self._label_index[column] = state
+        return state
+
+    def code_of(self, column, label):
+        """Category code of a label in a categorical column, or None if it never occurs"""
+        n_sorted, added = self._label_state(column)
+        code = added.get(label)
+        if code is None and n_sorted:
+            prefix = self.categories[column][:n_sorted]
+            pos = int(np.searchsorted(prefix, label))
+            if pos < n_sorted and prefix[pos] == label:
+                code = pos
+        return code
+
+    def encode(self, column, labels):
+        """Category codes of labels in a categorical column, adding unseen labels"""
+        known = self.categories[column]
+        n_sorted, added = self._label_state(column)
+        prefix = known[:n_sorted]
+
+        codes = np.empty(len(labels), dtype=np.int32)
+        new_labels = []
+        for i, label in enumerate(labels):
+            label = '' if label is None else str(label)
+            code = added.get(label)
+            if code is None and n_sorted:
+                pos = int(np.searchsorted(prefix, label))
+                if pos < n_sorted and prefix[pos] == label:
+                    code = pos
+            if code is None:
+                code = len(known) + len(new_labels)
+                added[label] = code
+                new_labels.append(label)
+            codes[i] = code
+
+        if new_labels:
+            self.categories[column] = self._buffers.append(f'cat.{column}', known, np.asarray(new_labels, dtype=str))
+        return codes
+
+    def extend(self, other):
+        """Append the merchants of another store; returns their new row indices
+
+        Columns missing from `other` are filled with 0 (integers), NaN
+        (floats), NaT (dates) or '' (categories). Raises ValueError if an
+        id already exists.
+        """
+        new_ids = other.merchant_ids
+        if len(np.unique(new_ids)) != len(new_ids):
+            raise ValueError('Duplicate merchant_id values in request')
+        existing = new_ids[self.indices_of(new_ids) >= 0]
+        if len(existing):
+            raise ValueError(f"Merchant already exists: {existing[0]}")
+
+        start = len(self)
+        count = len(new_ids)
+        for name, values in self.columns.items():
+            if name in self.categories:
+                labels = other.values(name, np.arange(count)) if name in other.columns else [''] * count
+                values_new = self.encode(name, labels)
+            elif name in other.columns:
+                values_new = other.columns[name]
+            elif np.issubdtype(values.dtype, np.datetime64):
+                values_new = np.full(count, np.datetime64('NaT'), dtype=values.dtype)
+            elif np.issubdtype(values.dtype, np.floating):
+                values_new = np.full(count, np.nan, dtype=values.dtype)
+            else:
+                values_new = np.zeros(count, dtype=values.dtype)
+            self.columns[name] = self._buffers.append(f'col.{name}', values, values_new)
+
+        self.embeddings = self._buffers.append('embeddings', self.embeddings,
+                                               other.embeddings.astype(self.embeddings.dtype))
+        # Ids last: a merchant becomes visible once all of its columns exist
+        self.merchant_ids = self._buffers.append('merchant_ids', self.merchant_ids, new_ids)
+        appended = dict(self.appended_ids)
+        appended.update(zip(new_ids.tolist(), range(start, start + count)))
+        self.appended_ids = appended
+        if len(appended) > max(4096, len(self) // 100):
+            self.merge_appended_ids()
+        return np.arange(start, start + count)
+
+    def set_values(self, column, idx, values):
+        """Overwrite a numeric column at the given rows"""
+        data = self._buffers.writable(f'col.{column}', self.columns[column])
+        data[idx] = values
+        self.columns[column] = data
+
+    def set_embeddings(self, idx, values):
+        """Overwrite the embeddings of the given rows"""
+        data = self._buffers.writable('embeddings', self.embeddings)
+        data[idx] = values
+        self.embeddings = data
+
+
+def _plain_list(values):
+    """values as a Python list, with non-finite floats as None"""
+    if np.issubdtype(values.dtype, np.floating):
+        bad = ~np.isfinite(values)
+        if bad.any():
+            values = values.astype(object)
+            values[bad] = None
+    return values.tolist()
@@ -0,0 +1,252 @@
+import bisect
+import collections
+import itertools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Latency buckets in seconds (upper bounds; +Inf is implied)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative histogram per label combination, in Prometheus terms"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            # First bucket the value fits in; the last slot is +Inf
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def totals(self):
+        """{label values: (count, sum)} of every series"""
+        with self._lock:
+            return {key: (sum(counts), total) for key, (counts, total) in self._series.items()}
+
+    def render(self):
+        with self._lock:
+            series = {key: ([*counts], total) for key, (counts, total) in self._series.items()}
+        for label_values, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                yield f'{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, label_values)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.label_names, label_values)} {cumulative}'
+
+
+class Counter:
+    """Monotonic counter per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = collections.Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.label_names, label_values)} {_number(value)}'
+
+
+class Gauge:
+    """Gauge whose samples are read from a callback at scrape time
+
+    ``collect()`` returns a number, or a dict of {label values tuple: number}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, collect, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.collect = collect
+        self.label_names = tuple(label_names)
+
+    def render(self):
+        samples = self.collect()
+        if samples is None:
+            return
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        for label_values, value in sorted(samples.items()):
+            yield f'{self.name}{_labels(self.label_names, label_values)} {_number(value)}'
+
+
+class Registry:
+    """Metrics of one process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, collect, label_names=()):
+        return self.register(Gauge(name, help_text, collect, label_names))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = list(metric.render())
+            except Exception as e:
+                # A failing gauge callback must not break the whole scrape
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'ml_stage_duration_seconds', 'Time spent in an instrumented stage', ('stage',))
+
+
+@contextmanager
+def span(stage):
+    """Time a block and record it under ml_stage_duration_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage)
+
+
+def resident_memory_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def array_bytes(*arrays):
+    """Total size of numpy arrays (None entries are skipped)"""
+    return sum(int(values.nbytes) for values in arrays if values is not None)
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for slow requests
+
+    A background thread samples the stacks of the threads that are serving
+    requests every ``interval`` seconds. When a request takes longer than
+    ``slow_seconds`` its samples are written to ``output_dir`` in the folded
+    stack format (``frame;frame;frame count``) read by flamegraph.pl and
+    speedscope; faster requests are discarded.
+    """
+
+    def __init__(self, output_dir, slow_seconds, interval=0.005):
+        self.output_dir = output_dir
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sequence = itertools.count()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def start(self):
+        """Begin sampling the calling thread"""
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                self._thread = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+                self._thread.start()
+            self._active[threading.get_ident()] = collections.Counter()
+
+    def stop(self, label, elapsed):
+        """Stop sampling the calling thread; returns the written file if the request was slow"""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed < self.slow_seconds:
+            return None
+        name = ''.join(c if c.isalnum() else '_' for c in label).strip('_')
+        stamp = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(self._sequence)}'
+        path = os.path.join(self.output_dir, f'{stamp}-{name}.folded')
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
@@ -0,0 +1,417 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+# Walk and skip-gram defaults of the node2vec reference implementation
+WALK_LENGTH = 80
+NUM_WALKS = 10
+WINDOW = 10
+NEGATIVE = 5
+ALPHA = 0.025
+MIN_ALPHA = 0.0001
+
+# Walkers advanced together, and (center, context) pairs per SGD step
+WALK_BATCH = 65_536
+PAIR_BATCH = 8_192
+
+MAX_EXP = 6.0
+
+# Negative nodes shared by all pairs of one SGD step
+SHARED_NEGATIVES = 64
+
+# Negative-sampling candidates drawn from the whole graph when embedding new nodes
+NEGATIVE_POOL = 100_000
+
+# A rejected biased step is retried at most this many times before the
+# unbiased sample is taken
+MAX_REJECTIONS = 32
+
+
+class WalkGraph:
+    """Undirected weighted graph as CSR arrays, for random walks
+
+    Neighbors of each node are sorted, so "is b adjacent to a" is a binary
+    search over ``edge_keys`` (a * n_nodes + b for every adjacency entry).
+    Weighted neighbor sampling inverts ``cum_weights``, the running sum of
+    the adjacency weights. Self-loops are dropped; a repeated pair keeps its
+    last weight.
+    """
+
+    def __init__(self, n_nodes, indptr, neighbors, cum_weights, edge_keys):
+        self.n_nodes = n_nodes
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.cum_weights = cum_weights
+        self.edge_keys = edge_keys
+
+    @classmethod
+    def from_edges(cls, n_nodes, src, dst, weight=None):
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weight = np.ones(len(src)) if weight is None else np.asarray(weight, dtype=np.float64)
+        keep = src != dst
+        src, dst, weight = src[keep], dst[keep], weight[keep]
+        keys = np.minimum(src, dst) * n_nodes + np.maximum(src, dst)
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last
+        src, dst, weight = src[keep], dst[keep], weight[keep]
+
+        heads = np.concatenate([src, dst])
+        tails = np.concatenate([dst, src])
+        order = np.lexsort((tails, heads))
+        heads, tails = heads[order], tails[order]
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=n_nodes), out=indptr[1:])
+        cum_weights = np.cumsum(np.concatenate([weight, weight])[order])
+        return cls(n_nodes, indptr, tails.astype(np.int32), cum_weights, heads * n_nodes + tails)
+
+    def to_arrays(self):
+        return {'indptr': self.indptr, 'neighbors': self.neighbors,
+                'cum_weights': self.cum_weights, 'edge_keys': self.edge_keys}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(len(arrays['indptr']) - 1, arrays['indptr'], arrays['neighbors'],
+                   arrays['cum_weights'], arrays['edge_keys'])
+
+    def degree(self, nodes=None):
+        degree = np.diff(self.indptr)
+        return degree if nodes is None else degree[nodes]
+
+    def has_edge(self, a, b):
+        """Vectorized adjacency test for node pairs"""
+        keys = np.asarray(a, dtype=np.int64) * self.n_nodes + b
+        pos = np.searchsorted(self.edge_keys, keys)
+        found = pos < len(self.edge_keys)
+        found[found] = self.edge_keys[pos[found]] == keys[found]
+        return found
+
+    def sample_neighbors(self, nodes, rng):
+        """One weighted random neighbor per node (every node must have one)"""
+        low = self.indptr[nodes]
+        high = self.indptr[nodes + 1]
+        base = np.where(low > 0, self.cum_weights[np.maximum(low - 1, 0)], 0.0)
+        targets = base + rng.random(len(nodes)) * (self.cum_weights[high - 1] - base)
+        pos = np.clip(np.searchsorted(self.cum_weights, targets, side='right'), low, high - 1)
+        return self.neighbors[pos]
+
+
+def walk_step(graph, current, previous, rng, p=1.0, q=1.0):
+    """Next node of every walker (all must have neighbors)
+
+    The node2vec bias (1/p back to the previous node, 1 to its neighbors,
+    1/q further away) is applied by rejection sampling, so each step stays
+    a handful of vectorized passes whatever the degree.
+    """
+    nxt = graph.sample_neighbors(current, rng)
+    if p == 1 and q == 1:
+        return nxt
+    max_bias = max(1 / p, 1.0, 1 / q)
+    pending = np.flatnonzero(previous >= 0)
+    for _ in range(MAX_REJECTIONS):
+        if len(pending) == 0:
+            break
+        candidates = nxt[pending]
+        prev = previous[pending]
+        bias = np.where(candidates == prev, 1 / p, np.where(graph.has_edge(prev, candidates), 1.0, 1 / q))
+        rejected = rng.random(len(pending)) * max_bias >= bias
+        pending = pending[rejected]
+        if len(pending):
+            nxt[pending] = graph.sample_neighbors(current[pending], rng)
+    return nxt
+
+
+def random_walks(graph, starts, walk_length, rng, p=1.0, q=1.0):
+    """Walks from every start node as an int32 (len(starts), walk_length) array
+
+    Walks that reach a node without neighbors stop early and are padded
+    with -1.
+    """
+    walks = np.full((len(starts), walk_length), -1, dtype=np.int32)
+    walks[:, 0] = starts
+    alive = np.flatnonzero(graph.degree(starts) > 0)
+    current = np.asarray(starts, dtype=np.int64)[alive]
+    previous = np.full(len(alive), -1, dtype=np.int64)
+    for step in range(1, walk_length):
+        if len(alive) == 0:
+            break
+        nxt = walk_step(graph, current, previous, rng, p, q)
+        walks[alive, step] = nxt
+        moving = graph.degree(nxt) > 0
+        alive, previous, current = alive[moving], current[moving], nxt[moving].astype(np.int64)
+    return walks
+
+
+def write_walks(graph, path, starts, num_walks, walk_length, seed, p=1.0, q=1.0):
+    """Stream num_walks rounds of walks from starts to a raw int32 file; returns the walk count
+
+    Each round visits the start nodes in a new random order, like node2vec.
+    """
+    rng = np.random.default_rng(seed)
+    count = 0
+    with open(path, 'wb') as f:
+        for _ in range(num_walks):
+            order = rng.permutation(starts)
+            for begin in range(0, len(order), WALK_BATCH):
+                walks = random_walks(graph, order[begin:begin + WALK_BATCH], walk_length, rng, p, q)
+                walks.tofile(f)
+                count += len(walks)
+    return count
+
+
+def read_walks(path, walk_length, batch=WALK_BATCH):
+    """Walk batches from a file written by write_walks()"""
+    walks = np.memmap(path, dtype=np.int32, mode='r') if os.path.getsize(path) else np.empty(0, np.int32)
+    walks = walks.reshape(-1, walk_length)
+    for begin in range(0, len(walks), batch):
+        yield np.asarray(walks[begin:begin + batch])
+
+
+def context_pairs(walks, window, rng):
+    """(center, context) pairs of a walk batch, both directions
+
+    Like word2vec, every center uses a window shrunk uniformly at random,
+    which keeps a pair at distance d with probability (window - d + 1) / window.
+    """
+    centers, contexts = [], []
+    for distance in range(1, min(window, walks.shape[1] - 1) + 1):
+        a, b = walks[:, :-distance].ravel(), walks[:, distance:].ravel()
+        keep = (a >= 0) & (b >= 0) & (rng.random(len(a)) < (window - distance + 1) / window)
+        a, b = a[keep], b[keep]
+        centers.extend((a, b))
+        contexts.extend((b, a))
+    if not centers:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(centers).astype(np.int64), np.concatenate(contexts).astype(np.int64)
+
+
+def negative_table(counts, size=10_000_000):
+    """Node table for negative sampling from the unigram distribution raised to 3/4"""
+    weights = np.asarray(counts, dtype=np.float64) ** 0.75
+    if weights.sum() == 0:
+        return np.arange(len(counts))
+    size = min(size, max(len(counts) * 100, 1_000_000))
+    cumulative = np.cumsum(weights / weights.sum())
+    return np.minimum(np.searchsorted(cumulative, (np.arange(size) + 0.5) / size), len(counts) - 1)
+
+
+def scatter_add(target, rows, values):
+    """target[rows] += values with repeated rows summed (a faster np.add.at for 2-D rows)"""
+    if len(rows) == 0:
+        return
+    unique, inverse = np.unique(rows, return_inverse=True)
+    summed = csr_matrix((np.ones(len(rows), dtype=values.dtype), (inverse, np.arange(len(rows)))),
+                        shape=(len(unique), len(rows))) @ values
+    target[unique] += summed.astype(target.dtype)
+
+
+def sigmoid(x):
+    # Clipped like word2vec's MAX_EXP, which also keeps exp() finite
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -MAX_EXP, MAX_EXP)))
+
+
+def sgd_step(vectors, context, centers, contexts, negatives, alpha, negative=NEGATIVE, trainable=None):
+    """One skip-gram negative-sampling update over a batch of pairs
+
+    The batch shares one set of negative nodes. Each pair scores all of
+    them with weight negative / len(negatives), which keeps the expected
+    gradient of per-pair sampling while negatives are scored and updated
+    with two small matrix products. Rows of ``trainable`` (a boolean mask)
+    are the only ones written; None trains every row.
+    """
+    v = vectors[centers]
+    u = context[contexts]
+    u_neg = context[negatives]
+    g_pos = (alpha * (1.0 - sigmoid(np.einsum('ij,ij->i', v, u)))).astype(np.float32)
+    g_neg = (-alpha * negative / len(negatives) * sigmoid(v @ u_neg.T)).astype(np.float32)
+    grad_v = g_pos[:, None] * u + g_neg @ u_neg
+    grad_u = g_pos[:, None] * v
+    grad_neg = g_neg.T @ v
+
+    if trainable is not None:
+        keep = trainable[contexts]
+        contexts, grad_u = contexts[keep], grad_u[keep]
+        keep = trainable[negatives]
+        negatives, grad_neg = negatives[keep], grad_neg[keep]
+        keep = trainable[centers]
+        centers, grad_v = centers[keep], grad_v[keep]
+    scatter_add(context, np.concatenate([contexts, negatives]), np.concatenate([grad_u, grad_neg]))
+    scatter_add(vectors, centers, grad_v)
+
+
+def train_walks(vectors, context, walk_batches, total_walks, table, seed, window=WINDOW,
+                negative=NEGATIVE, alpha=ALPHA, min_alpha=MIN_ALPHA, trainable=None, pair_batch=PAIR_BATCH):
+    """Skip-gram with negative sampling over walk batches, learning rate decaying linearly
+
+    With a ``trainable`` mask, only pairs touching a trainable row are used.
+    """
+    rng = np.random.default_rng(seed)
+    done = 0
+    for walks in walk_batches:
+        centers, contexts = context_pairs(walks, window, rng)
+        if trainable is not None:
+            keep = trainable[centers] | trainable[contexts]
+            centers, contexts = centers[keep], contexts[keep]
+        order = rng.permutation(len(centers))
+        for begin in range(0, len(order), pair_batch):
+            pick = order[begin:begin + pair_batch]
+            progress = (done + len(walks) * begin / max(len(order), 1)) / max(total_walks, 1)
+            lr = max(min_alpha, alpha - (alpha - min_alpha) * progress)
+            negatives = table[rng.integers(0, len(table), SHARED_NEGATIVES)]
+            sgd_step(vectors, context, centers[pick], contexts[pick], negatives, lr, negative, trainable)
+        done += len(walks)
+
+
+def initial_vectors(n_nodes, dim, seed):
+    """word2vec initialization: input vectors uniform in +-0.5/dim, context vectors zero"""
+    rng = np.random.default_rng(seed)
+    vectors = ((rng.random((n_nodes, dim), dtype=np.float32) - 0.5) / dim).astype(np.float32)
+    return vectors, np.zeros((n_nodes, dim), dtype=np.float32)
+
+
+def _shard_task(task):
+    """Walk one shard of start nodes to disk, then train on it (runs in a worker)
+
+    All workers update the same memory-mapped matrices without locking
+    (Hogwild, as word2vec does with threads).
+    """
+    work_dir, shard, options = task
+    graph = WalkGraph.from_arrays({name: np.load(os.path.join(work_dir, f'graph.{name}.npy'), mmap_mode='r')
+                                   for name in ('indptr', 'neighbors', 'cum_weights', 'edge_keys')})
+    starts = np.load(os.path.join(work_dir, f'starts.{shard}.npy'))
+    path = os.path.join(work_dir, f'walks.{shard}.bin')
+    seed = options['seed']
+    count = write_walks(graph, path, starts, options['num_walks'], options['walk_length'], [seed, 1, shard],
+                        options['p'], options['q'])
+
+    vectors = np.load(os.path.join(work_dir, 'vectors.npy'), mmap_mode='r+')
+    context = np.load(os.path.join(work_dir, 'context.npy'), mmap_mode='r+')
+    table = np.load(os.path.join(work_dir, 'table.npy'), mmap_mode='r')
+    for epoch in range(options['epochs']):
+        train_walks(vectors, context, read_walks(path, options['walk_length']), count, table,
+                    [seed, 2, shard, epoch], options['window'], options['negative'],
+                    options['alpha'] * (1 - epoch / options['epochs']), options['min_alpha'])
+    vectors.flush()
+    context.flush()
+    return count
+
+
+def train_embeddings(graph, dim=16, walk_length=WALK_LENGTH, num_walks=NUM_WALKS, p=1.0, q=1.0,
+                     window=WINDOW, negative=NEGATIVE, epochs=1, alpha=ALPHA, min_alpha=MIN_ALPHA,
+                     seed=42, workers=None, work_dir=None):
+    """node2vec embeddings of every node of a WalkGraph: (vectors, context vectors)
+
+    Nodes are sharded over ``workers`` processes (None: every CPU); each
+    streams its walks to a file under work_dir (a temporary directory by
+    default) and trains on it. Nodes without neighbors keep their random
+    initial vector.
+
+    Only ``workers=1`` is reproducible: with more, the shards update the
+    shared vectors concurrently (Hogwild style), so the result depends on
+    the number of workers and on timing, not just on ``seed``.
+    """
+    workers = workers or os.cpu_count() or 1
+    own_dir = work_dir is None
+    work_dir = tempfile.mkdtemp(prefix='walks-') if own_dir else work_dir
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        for name, values in graph.to_arrays().items():
+            np.save(os.path.join(work_dir, f'graph.{name}.npy'), values)
+        vectors, context = initial_vectors(graph.n_nodes, dim, seed)
+        np.save(os.path.join(work_dir, 'vectors.npy'), vectors)
+        np.save(os.path.join(work_dir, 'context.npy'), context)
+        # Walk visits are roughly proportional to degree
+        np.save(os.path.join(work_dir, 'table.npy'), negative_table(graph.degree()))
+
+        walkers = np.flatnonzero(graph.degree() > 0)
+        shards = min(workers, max(len(walkers), 1))
+        for shard in range(shards):
+            np.save(os.path.join(work_dir, f'starts.{shard}.npy'), walkers[shard::shards])
+        options = {'seed': seed, 'num_walks': num_walks, 'walk_length': walk_length, 'p': p, 'q': q,
+                   'epochs': epochs, 'window': window, 'negative': negative, 'alpha': alpha,
+                   'min_alpha': min_alpha}
+        tasks = [(work_dir, shard, options) for shard in range(shards)]
+        if shards == 1:
+            walks = [_shard_task(tasks[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=shards) as pool:
+                walks = list(pool.map(_shard_task, tasks))
+        print(f"Trained embeddings on {sum(walks)} walks from {len(walkers)} nodes")
+
+        return (np.array(np.load(os.path.join(work_dir, 'vectors.npy'))),
+                np.array(np.load(os.path.join(work_dir, 'context.npy'))))
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def neighbor_mean(graph, vectors, nodes):
+    """Weight-averaged vectors of the neighbors of every node (all must have neighbors)"""
+    low, high = graph.indptr[nodes], graph.indptr[nodes + 1]
+    counts = high - low
+    owner = np.repeat(np.arange(len(nodes)), counts)
+    pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(low, counts)
+    weights = graph.cum_weights[pos] - np.where(pos > 0, graph.cum_weights[np.maximum(pos - 1, 0)], 0.0)
+    weights = csr_matrix((weights, (owner, np.arange(len(pos)))), shape=(len(nodes), len(pos)))
+    totals = np.asarray(weights.sum(axis=1))
+    return (weights @ vectors[graph.neighbors[pos]] / np.maximum(totals, 1e-12)).astype(np.float32)
+
+
+def embed_new_nodes(graph, vectors, context, nodes, walk_length=WALK_LENGTH, num_walks=NUM_WALKS,
+                    p=1.0, q=1.0, window=WINDOW, negative=NEGATIVE, epochs=1, alpha=ALPHA,
+                    min_alpha=MIN_ALPHA, seed=42):
+    """Embed nodes against frozen vectors of all other nodes; returns their new vectors
+
+    Walks start from the given nodes only, and only their vectors (and their
+    own context vectors) are trained, so existing embeddings and similarity
+    scores between them do not move. Without ``context`` vectors (when the
+    embeddings were loaded from the source data) there is nothing to train
+    against, and a node gets the weighted mean of its neighbors' vectors
+    instead. Nodes without neighbors keep their vector.
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    connected = nodes[graph.degree(nodes) > 0]
+    result = np.array(vectors[nodes], dtype=np.float32)
+    if len(connected) == 0:
+        return result
+    if context is None:
+        result[graph.degree(nodes) > 0] = neighbor_mean(graph, vectors, connected)
+        return result
+
+    # Train on private copies of the rows involved; nothing else is written.
+    # Negatives come from a sample of the whole graph (degree^3/4, as in
+    # training), added to the rows involved.
+    rng = np.random.default_rng([seed, 1])
+    walks = np.concatenate([random_walks(graph, connected, walk_length, rng, p, q) for _ in range(num_walks)])
+    weights = np.cumsum(graph.degree().astype(np.float64) ** 0.75)
+    pool = np.searchsorted(weights, rng.random(NEGATIVE_POOL) * weights[-1], side='right')
+    involved = np.unique(np.concatenate([walks[walks >= 0].astype(np.int64), nodes, pool]))
+    local_walks = np.where(walks >= 0, np.searchsorted(involved, np.maximum(walks, 0)), -1)
+    local_connected = np.searchsorted(involved, connected)
+
+    sub_vectors = np.array(vectors[involved], dtype=np.float32)
+    # Nodes added after the last training have no context vector yet
+    sub_context = np.zeros_like(sub_vectors)
+    known = involved < len(context)
+    sub_context[known] = context[involved[known]]
+    init, _ = initial_vectors(len(connected), vectors.shape[1], [seed, 0])
+    sub_vectors[local_connected] = init
+    sub_context[local_connected] = 0.0
+    trainable = np.zeros(len(involved), dtype=bool)
+    trainable[local_connected] = True
+
+    table = np.searchsorted(involved, pool)
+    # Updates within a pair batch are summed, so a batch should hold about one
+    # pair per trained node; larger batches overshoot when few nodes train
+    pair_batch = min(PAIR_BATCH, len(connected))
+    batches = [local_walks[begin:begin + WALK_BATCH] for begin in range(0, len(local_walks), WALK_BATCH)]
+    for epoch in range(epochs):
+        train_walks(sub_vectors, sub_context, batches, len(local_walks), table, [seed, 2, epoch],
+                    window, negative, alpha * (1 - epoch / epochs), min_alpha, trainable, pair_batch)
+    result[:] = sub_vectors[np.searchsorted(involved, nodes)]
+    return result
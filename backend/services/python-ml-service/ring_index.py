@@ -0,0 +1,247 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from array_buffers import ArrayBuffers
+
+
+class RingIndex:
+    """Merchant -> ring lookup, per-ring member arrays and cached ring payloads
+
+    Members of every ring are stored back to back in one index array
+    (``member_indices[offsets[r]:offsets[r + 1]]`` are the rows of ring r),
+    and ``ring_of`` maps a merchant row to its ring number (-1 for none).
+    Ring payloads are built on first use by ``payload_builder`` and kept:
+    the largest rings are pinned, everything else lives in a bounded LRU.
+
+    Rings are maintained incrementally: ``union`` merges rings joined by new
+    fraud-fraud connections and ``remove`` drops members and re-splits only
+    the rings they left. Rings changed since load keep their sorted members
+    in ``_changed``; rings emptied by a merge or split keep their number with
+    size 0. A ring's id is derived from its lowest member row, so it is the
+    same whether the ring was built at load or maintained incrementally.
+    """
+
+    def __init__(self, ring_ids, offsets, member_indices, n_rows, payload_builder,
+                 cache_size=512, pinned=10, ring_of=None):
+        self.ring_ids = list(ring_ids)
+        self.ring_numbers = {ring_id: no for no, ring_id in enumerate(self.ring_ids)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.member_indices = np.asarray(member_indices, dtype=np.int64)
+        self.sizes = np.diff(self.offsets)
+        self.live = len(self.ring_ids)
+
+        if ring_of is None:
+            ring_of = np.full(n_rows, -1, dtype=np.int32)
+            ring_numbers = np.repeat(np.arange(len(self.sizes), dtype=np.int32), self.sizes)
+            found = self.member_indices >= 0
+            ring_of[self.member_indices[found]] = ring_numbers[found]
+        self.ring_of = ring_of
+
+        self.payload_builder = payload_builder
+        self.cache_size = cache_size
+        self.pinned_rings = set(np.argsort(-self.sizes, kind='stable')[:pinned].tolist())
+        self._pinned = {}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate() so payloads built from older data are not cached
+        self._generation = 0
+        self._changed = {}
+        self._buffers = ArrayBuffers()
+
+    @staticmethod
+    def ring_id(members):
+        """Id of a ring from its sorted member rows"""
+        return f"ring_{int(members[0])}"
+
+    def __len__(self):
+        """Number of live rings (2+ members)"""
+        return self.live
+
+    def ring_of_row(self, row):
+        """Ring number of a merchant row, or None if it is in no ring"""
+        ring_no = int(self.ring_of[row])
+        return ring_no if ring_no >= 0 else None
+
+    def members(self, ring_no):
+        """Merchant row indices of a ring"""
+        changed = self._changed.get(ring_no)
+        if changed is not None:
+            return changed
+        return self.member_indices[self.offsets[ring_no]:self.offsets[ring_no + 1]]
+
+    def payload(self, ring_no):
+        """Cached ring payload, built on first request"""
+        with self._lock:
+            if ring_no in self._pinned:
+                return self._pinned[ring_no]
+            if ring_no in self._lru:
+                self._lru.move_to_end(ring_no)
+                return self._lru[ring_no]
+            generation = self._generation
+
+        payload = self.payload_builder(self.ring_ids[ring_no], self.members(ring_no))
+
+        with self._lock:
+            if generation != self._generation:
+                return payload
+            if ring_no in self.pinned_rings:
+                self._pinned[ring_no] = payload
+            else:
+                self._lru[ring_no] = payload
+                while len(self._lru) > self.cache_size:
+                    self._lru.popitem(last=False)
+        return payload
+
+    def cached_payloads(self):
+        """Number of cached ring payloads (pinned and LRU)"""
+        with self._lock:
+            return len(self._pinned) + len(self._lru)
+
+    def warm(self):
+        """Build the payloads of all pinned rings up front"""
+        for ring_no in self.pinned_rings:
+            self.payload(ring_no)
+
+    def invalidate(self, ring_nos):
+        """Drop the cached payloads of the given rings"""
+        with self._lock:
+            self._generation += 1
+            for ring_no in ring_nos:
+                self._pinned.pop(ring_no, None)
+                self._lru.pop(ring_no, None)
+
+    def to_arrays(self):
+        """(ring_ids, arrays) of the live rings, for writing a snapshot"""
+        if not self._changed:
+            return self.ring_ids, {'offsets': self.offsets, 'members': self.member_indices, 'of': self.ring_of}
+        live = np.flatnonzero(self.sizes > 0)
+        offsets = np.zeros(len(live) + 1, dtype=np.int64)
+        np.cumsum(self.sizes[live], out=offsets[1:])
+        members = [self.members(ring_no) for ring_no in live.tolist()]
+        compact = RingIndex([], offsets, np.concatenate(members) if members else np.empty(0, dtype=np.int64),
+                            len(self.ring_of), None)
+        return ([self.ring_ids[ring_no] for ring_no in live.tolist()],
+                {'offsets': compact.offsets, 'members': compact.member_indices, 'of': compact.ring_of})
+
+    def resize(self, n_rows):
+        """Extend ring_of to cover merchants appended to the store"""
+        if n_rows > len(self.ring_of):
+            self.ring_of = self._buffers.append('ring_of', self.ring_of,
+                                                np.full(n_rows - len(self.ring_of), -1, dtype=np.int32))
+
+    def _set_members(self, ring_no, members):
+        """Replace the members of an existing ring (empty members retire it)"""
+        self.ring_of = self._buffers.writable('ring_of', self.ring_of)
+        old_id = self.ring_ids[ring_no]
+        if self.ring_numbers.get(old_id) == ring_no:
+            del self.ring_numbers[old_id]
+        if len(members) and not self.sizes[ring_no]:
+            self.live += 1
+        elif not len(members) and self.sizes[ring_no]:
+            self.live -= 1
+
+        self._changed[ring_no] = members
+        self.sizes[ring_no] = len(members)
+        if len(members):
+            self.ring_ids[ring_no] = self.ring_id(members)
+            self.ring_numbers[self.ring_ids[ring_no]] = ring_no
+            self.ring_of[members] = ring_no
+
+    def _add_ring(self, members):
+        """Create a ring; returns its number"""
+        ring_no = len(self.ring_ids)
+        self.ring_ids.append(self.ring_id(members))
+        self.sizes = self._buffers.append('sizes', self.sizes, np.zeros(1, dtype=self.sizes.dtype))
+        self._set_members(ring_no, members)
+        return ring_no
+
+    def union(self, pairs):
+        """Merge the rings (or ring-less fraud rows) connected by fraud-fraud pairs
+
+        Union-find over ring numbers and loose rows, by size; each resulting
+        group is written once. Returns the numbers of all rings whose members
+        or internal edges changed.
+        """
+        parent = {}
+        weight = {}
+
+        def key(row):
+            ring_no = int(self.ring_of[row])
+            return ring_no if ring_no >= 0 else -row - 1
+
+        def find(item):
+            parent.setdefault(item, item)
+            while parent[item] != item:
+                parent[item] = parent[parent[item]]
+                item = parent[item]
+            return item
+
+        touched = set()
+        for u, v in pairs:
+            a, b = find(key(u)), find(key(v))
+            touched.update(k for k in (a, b) if k >= 0)
+            if a == b:
+                continue
+            for item in (a, b):
+                weight.setdefault(item, int(self.sizes[item]) if item >= 0 else 1)
+            if weight[a] < weight[b]:
+                a, b = b, a
+            parent[b] = a
+            weight[a] += weight[b]
+
+        groups = {}
+        for item in parent:
+            groups.setdefault(find(item), []).append(item)
+
+        changed = set(touched)
+        for items in groups.values():
+            if len(items) < 2:
+                continue
+            rings = [item for item in items if item >= 0]
+            loose = [-item - 1 for item in items if item < 0]
+            members = np.unique(np.concatenate(
+                [self.members(ring_no) for ring_no in rings] + [np.asarray(loose, dtype=np.int64)]))
+
+            # The largest ring absorbs the others
+            rings.sort(key=lambda ring_no: (-int(self.sizes[ring_no]), ring_no))
+            if rings:
+                target = rings[0]
+                self._set_members(target, members)
+            else:
+                target = self._add_ring(members)
+            for ring_no in rings[1:]:
+                self._set_members(ring_no, np.empty(0, dtype=np.int64))
+            changed.update(rings)
+            changed.add(target)
+
+        self.invalidate(changed)
+        return changed
+
+    def remove(self, rows, components):
+        """Take rows out of their rings and re-split only the rings they left
+
+        ``components(rows)`` returns (labels, n) for the subgraph induced by
+        rows (MerchantGraph.components). Pieces with fewer than 2 members stop
+        being rings. Returns the numbers of all rings that changed.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        self.ring_of = self._buffers.writable('ring_of', self.ring_of)
+        rings = self.ring_of[rows]
+        changed = set()
+        for ring_no in np.unique(rings[rings >= 0]).tolist():
+            remaining = np.setdiff1d(self.members(ring_no), rows[rings == ring_no])
+            labels, n_components = components(remaining)
+            pieces = [remaining[labels == label] for label in range(n_components)]
+            pieces = [piece for piece in pieces if len(piece) >= 2]
+
+            self.ring_of[np.setdiff1d(self.members(ring_no), np.concatenate(pieces) if pieces else [])] = -1
+            # The piece with the lowest row keeps the ring number
+            self._set_members(ring_no, pieces[0] if pieces else np.empty(0, dtype=np.int64))
+            changed.add(ring_no)
+            for piece in pieces[1:]:
+                changed.add(self._add_ring(piece))
+
+        self.invalidate(changed)
+        return changed
@@ -0,0 +1,254 @@
+import heapq
+
+import numpy as np
+
+from array_buffers import ArrayBuffers
+
+
+# Categorical member attributes summarized per ring, and how many of their
+# most common values are kept
+MIX_COLUMNS = ['city', 'merchant_tier', 'merchant_category']
+TOP_VALUES = 3
+
+
+class RingStats:
+    """Per-ring statistics as columnar arrays indexed by ring number
+
+    ``columns`` holds size, internal edge count, edge density, dominant edge
+    reason (code and edge count), summed total_txns_90d and mean
+    chargeback_rate of every ring; ``mix[column]`` holds the codes and
+    member counts of the TOP_VALUES most common values of each MIX_COLUMNS
+    attribute (-1 / 0 padded). Members are also ranked by centrality, their
+    summed edge weight inside the ring; ``display_order`` builds on it so
+    truncated views show the most central members first.
+
+    Everything is computed with group-bys over the member rows and their
+    adjacency entries, for all rings at load and for the rings that changed
+    after live updates (``update``).
+    """
+
+    def __init__(self, ring_index, store, graph):
+        self.ring_index = ring_index
+        self.store = store
+        self.graph = graph
+        self.columns = {}
+        self.mix = {}
+        self._buffers = ArrayBuffers()
+        self._central = {}
+
+        # All rings at once, straight from ring_of
+        ring_of = ring_index.ring_of
+        rows = np.flatnonzero(ring_of >= 0)
+        ring_nos = np.arange(len(ring_index.ring_ids))
+        columns, mix, central, offsets = self._compute(ring_nos, rows, ring_of[rows])
+        self.columns, self.mix = columns, mix
+        self.central_members = central
+        self.central_offsets = offsets
+
+    def _compute(self, ring_nos, rows, rings):
+        """Statistics of the rings ring_nos (ascending) from their member rows (ascending)
+
+        Returns (columns, mix, members by centrality, offsets) aligned with ring_nos.
+        """
+        n = len(ring_nos)
+        local = np.searchsorted(ring_nos, rings)
+        size = np.bincount(local, minlength=n)
+
+        # Adjacency entries inside a ring: each internal edge is seen from both ends
+        ring_of = self.ring_index.ring_of
+        owners, neighbors, edge_ids = self.graph.adjacency(rows)
+        internal = (ring_of[neighbors] == ring_of[owners]) & (owners != neighbors)
+        owners, edge_ids = owners[internal], edge_ids[internal]
+        owner_pos = np.searchsorted(rows, owners)
+        edge_ring = local[owner_pos]
+        edges = np.bincount(edge_ring, minlength=n) // 2
+        pairs = np.maximum(size * (size - 1) / 2, 1)
+
+        n_reasons = max(len(self.graph.reasons), 1)
+        reasons = np.bincount(edge_ring * n_reasons + self.graph.reason[edge_ids],
+                              minlength=n * n_reasons).reshape(n, n_reasons) // 2
+        values = self.store.columns
+        txns = np.nan_to_num(np.asarray(values['total_txns_90d'][rows], dtype=np.float64))
+        chargeback = np.asarray(values['chargeback_rate'][rows], dtype=np.float64)
+        known = ~np.isnan(chargeback)
+        rated = np.bincount(local[known], minlength=n)
+        columns = {
+            'size': size.astype(np.int64),
+            'edge_count': edges.astype(np.int64),
+            'density': (edges / pairs).astype(np.float64),
+            'reason': np.where(edges > 0, reasons.argmax(axis=1), -1).astype(np.int16),
+            'reason_edges': reasons.max(axis=1).astype(np.int64),
+            'total_txns_90d': np.bincount(local, weights=txns, minlength=n).astype(np.int64),
+            'mean_chargeback_rate': np.bincount(local[known], weights=chargeback[known], minlength=n)
+                                    / np.where(rated > 0, rated, 1)
+        }
+        columns['mean_chargeback_rate'][rated == 0] = np.nan
+
+        mix = {}
+        for column in MIX_COLUMNS:
+            if column in values:
+                mix[column] = self._top_values(local, np.asarray(values[column][rows], dtype=np.int64), n)
+
+        # Members by summed internal edge weight, then row
+        weight = np.bincount(owner_pos, weights=np.asarray(self.graph.weight[edge_ids], dtype=np.float64),
+                             minlength=len(rows))
+        order = np.lexsort((rows, -weight, local))
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(size, out=offsets[1:])
+        return columns, mix, rows[order], offsets
+
+    @staticmethod
+    def _top_values(local, codes, n):
+        """(codes, counts), each (n, TOP_VALUES): the most common codes per ring"""
+        width = int(codes.max(initial=0)) + 1
+        keys, counts = np.unique(local * width + codes, return_counts=True)
+        ring, code = keys // width, keys % width
+        order = np.lexsort((code, -counts, ring))
+        ring, code, counts = ring[order], code[order], counts[order]
+        starts = np.searchsorted(ring, np.arange(n))
+        rank = np.arange(len(ring)) - starts[ring]
+        top = rank < TOP_VALUES
+        top_codes = np.full((n, TOP_VALUES), -1, dtype=np.int32)
+        top_counts = np.zeros((n, TOP_VALUES), dtype=np.int64)
+        top_codes[ring[top], rank[top]] = code[top]
+        top_counts[ring[top], rank[top]] = counts[top]
+        return top_codes, top_counts
+
+    def update(self, ring_nos):
+        """Recompute the statistics of changed rings (new ring numbers included)"""
+        ring_nos = np.unique(np.asarray(list(ring_nos), dtype=np.int64))
+        if len(ring_nos) == 0:
+            return
+        n_rings = len(self.ring_index.ring_ids)
+        for name, values in list(self.columns.items()):
+            if len(values) < n_rings:
+                self.columns[name] = self._buffers.append(
+                    name, values, np.zeros(n_rings - len(values), dtype=values.dtype))
+        for column, (codes, counts) in list(self.mix.items()):
+            if len(codes) < n_rings:
+                grow = n_rings - len(codes)
+                self.mix[column] = (
+                    self._buffers.append(f'{column}.codes', codes, np.full((grow, TOP_VALUES), -1, dtype=codes.dtype)),
+                    self._buffers.append(f'{column}.counts', counts, np.zeros((grow, TOP_VALUES), dtype=counts.dtype)))
+
+        members = [self.ring_index.members(ring_no) for ring_no in ring_nos.tolist()]
+        rows = np.concatenate(members) if members else np.empty(0, dtype=np.int64)
+        order = np.argsort(rows, kind='stable')
+        rows = rows[order]
+        rings = np.repeat(ring_nos, [len(m) for m in members])[order]
+        columns, mix, central, offsets = self._compute(ring_nos, rows, rings)
+
+        for name, values in columns.items():
+            self.columns[name] = self._buffers.writable(name, self.columns[name])
+            self.columns[name][ring_nos] = values
+        for column, (codes, counts) in mix.items():
+            self.mix[column] = (self._buffers.writable(f'{column}.codes', self.mix[column][0]),
+                                self._buffers.writable(f'{column}.counts', self.mix[column][1]))
+            self.mix[column][0][ring_nos] = codes
+            self.mix[column][1][ring_nos] = counts
+        for i, ring_no in enumerate(ring_nos.tolist()):
+            self._central[ring_no] = central[offsets[i]:offsets[i + 1]]
+
+    def central(self, ring_no):
+        """Member rows of a ring, most central first"""
+        changed = self._central.get(ring_no)
+        if changed is not None:
+            return changed
+        if ring_no >= len(self.central_offsets) - 1:
+            return self.central_members[:0]
+        return self.central_members[self.central_offsets[ring_no]:self.central_offsets[ring_no + 1]]
+
+    def display_order(self, ring_no):
+        """Member rows for truncated views: connected, most central first
+
+        Starts from the most central member and repeatedly adds the most
+        central member adjacent to those already taken, so every prefix is
+        a connected piece of the ring around its most central members.
+        """
+        central = self.central(ring_no)
+        if len(central) <= 2:
+            return central
+        by_row = np.argsort(central, kind='stable')
+        owners, neighbors, _ = self.graph.adjacency(central)
+        internal = (self.ring_index.ring_of[neighbors] == ring_no) & (owners != neighbors)
+        # Adjacency in centrality ranks (position in central)
+        owner_rank = by_row[np.searchsorted(central[by_row], owners[internal])]
+        neighbor_rank = by_row[np.searchsorted(central[by_row], neighbors[internal])]
+        order = np.argsort(owner_rank, kind='stable')
+        neighbor_rank = neighbor_rank[order].tolist()
+        starts = np.searchsorted(owner_rank[order], np.arange(len(central) + 1)).tolist()
+
+        taken = np.zeros(len(central), dtype=bool)
+        ranks = []
+        heap = [0]
+        next_untaken = 0
+        while len(ranks) < len(central):
+            if not heap:
+                # Only if the ring is not connected (it always is after a full build)
+                while taken[next_untaken]:
+                    next_untaken += 1
+                heap = [next_untaken]
+            rank = heapq.heappop(heap)
+            if taken[rank]:
+                continue
+            taken[rank] = True
+            ranks.append(rank)
+            for neighbor in neighbor_rank[starts[rank]:starts[rank + 1]]:
+                if not taken[neighbor]:
+                    heapq.heappush(heap, neighbor)
+        return central[ranks]
+
+    def select(self, filters, sort, descending):
+        """Numbers of the live rings matching filters, ordered by the sort column
+
+        filters maps a column to a (low, high) range (None: unbounded) or,
+        for 'reason' and MIX_COLUMNS, to a code the dominant value must equal.
+        Ties are broken by ring size, then ring number.
+        """
+        columns = self.columns
+        keep = self.ring_index.sizes[:len(columns['size'])] > 0
+        for name, condition in filters.items():
+            if name in self.mix:
+                keep &= self.mix[name][0][:, 0] == condition
+            elif name == 'reason':
+                keep &= columns['reason'] == condition
+            else:
+                low, high = condition
+                values = columns[name]
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+        rings = np.flatnonzero(keep)
+
+        key = np.nan_to_num(np.asarray(columns[sort][rings], dtype=np.float64), nan=-np.inf)
+        size = columns['size'][rings]
+        if descending:
+            order = np.lexsort((rings, -size, -key))
+        else:
+            order = np.lexsort((rings, -size, key))
+        return rings[order]
+
+    def record(self, ring_no, reasons, top_members):
+        """Statistics of one ring as a JSON-ready dict (labels decoded)"""
+        columns = self.columns
+        edges = int(columns['edge_count'][ring_no])
+        reason = int(columns['reason'][ring_no])
+        chargeback = float(columns['mean_chargeback_rate'][ring_no])
+        record = {
+            'size': int(columns['size'][ring_no]),
+            'edge_count': edges,
+            'density': float(columns['density'][ring_no]),
+            'dominant_reason': reasons[reason] if reason >= 0 else None,
+            'dominant_reason_share': int(columns['reason_edges'][ring_no]) / edges if edges else 0.0,
+            'total_txns_90d': int(columns['total_txns_90d'][ring_no]),
+            'mean_chargeback_rate': None if np.isnan(chargeback) else chargeback,
+            'central_members': self.store.merchant_ids[self.central(ring_no)[:top_members]].tolist()
+        }
+        for column, (codes, counts) in self.mix.items():
+            labels = self.store.categories[column]
+            record[f'{column}_mix'] = [
+                {'value': str(labels[code]), 'count': int(count)}
+                for code, count in zip(codes[ring_no].tolist(), counts[ring_no].tolist()) if code >= 0
+            ]
+        return record
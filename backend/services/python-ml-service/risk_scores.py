@@ -0,0 +1,191 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+# Label propagation: a merchant's graph score is ALPHA times the
+# weight-averaged score of its neighbors plus (1 - ALPHA) times its own
+# fraud label (personalized PageRank restarting at fraud merchants)
+ALPHA = 0.85
+TOLERANCE = 1e-4
+MAX_ITERATIONS = 200
+
+# Feature score: each feature divided by its SCALE_PERCENTILE value (capped
+# at 1), then weighted
+FEATURE_WEIGHTS = {
+    'chargeback_rate': 0.3,
+    'refund_ratio': 0.2,
+    'shared_pan_count': 0.2,
+    'shared_device_count': 0.15,
+    'shared_ip_count': 0.15
+}
+SCALE_PERCENTILE = 95
+
+
+def feature_scales(columns):
+    """Per-feature scale of the feature score, from the loaded columns"""
+    scales = {}
+    for name in FEATURE_WEIGHTS:
+        if name in columns and len(columns[name]):
+            scale = float(np.nanpercentile(columns[name], SCALE_PERCENTILE))
+            scales[name] = scale if scale > 0 else 1.0
+    return scales
+
+
+def feature_scores(columns, scales, rows=None):
+    """Weighted feature score in [0, 1] of every merchant (or of rows)"""
+    total = None
+    weights = 0.0
+    for name, scale in scales.items():
+        values = columns[name] if rows is None else columns[name][rows]
+        score = np.clip(np.nan_to_num(np.asarray(values, dtype=np.float64)) / scale, 0.0, 1.0)
+        total = FEATURE_WEIGHTS[name] * score if total is None else total + FEATURE_WEIGHTS[name] * score
+        weights += FEATURE_WEIGHTS[name]
+    if total is None:
+        return np.zeros(len(columns['is_fraud']) if rows is None else len(rows))
+    return total / weights
+
+
+def blend(graph_scores, features, graph_weight):
+    """Risk score: graph and feature scores mixed by graph_weight"""
+    return graph_weight * np.nan_to_num(graph_scores) + (1 - graph_weight) * features
+
+
+def normalized_adjacency(graph):
+    """D^-1/2 W D^-1/2 over the merchants that have edges (W: edge weights, D: weighted degrees)
+
+    Returns (matrix, rows, sqrt of the weighted degrees): row i of the matrix
+    is merchant rows[i]. Self-loops are ignored. Built from the graph's CSR
+    arrays, so it needs no sort, and leaving out merchants without edges
+    (most of them in practice) keeps the solver's vectors small.
+    """
+    arrays = graph.to_arrays()
+    indptr, neighbors = arrays['indptr'], arrays['neighbors']
+    owners = np.repeat(np.arange(graph.n_nodes), np.diff(indptr))
+    data = np.asarray(arrays['weight'], dtype=np.float64)[arrays['edge_ids']]
+    data[neighbors == owners] = 0.0
+    degree = np.bincount(owners, weights=data, minlength=graph.n_nodes)
+    rows = np.flatnonzero(degree > 0)
+    sqrt_degree = np.sqrt(degree)
+
+    position = np.full(graph.n_nodes, -1, dtype=np.int64)
+    position[rows] = np.arange(len(rows))
+    keep = data > 0
+    owners, neighbors = owners[keep], neighbors[keep]
+    sub_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(position[owners], minlength=len(rows)), out=sub_indptr[1:])
+    data = data[keep] / (sqrt_degree[owners] * sqrt_degree[neighbors])
+    matrix = csr_matrix((data, position[neighbors], sub_indptr), shape=(len(rows), len(rows)))
+    return matrix, rows, sqrt_degree[rows]
+
+
+def graph_scores(graph, labels, alpha=ALPHA, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """Label-propagation score of every merchant; returns (scores, iterations)
+
+    Solves F = alpha * D^-1 W F + (1 - alpha) * y. With z = D^1/2 F the
+    system is symmetric positive definite, so it is solved by conjugate
+    gradients, which needs about a third of the iterations of plain
+    propagation. Stops once no residual, in score units, exceeds
+    tolerance * (1 - alpha). Merchants without edges score their own label.
+    """
+    matrix, rows, sqrt_degree = normalized_adjacency(graph)
+    labels = np.asarray(labels, dtype=np.float64)
+    scores = labels.copy()
+
+    # (I - alpha S) z = (1 - alpha) D^1/2 y, starting from F = y
+    z = sqrt_degree * labels[rows]
+    residual = (1 - alpha) * z - (z - alpha * (matrix @ z))
+    direction = residual.copy()
+    norm = residual @ residual
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        if np.abs(residual / sqrt_degree).max(initial=0.0) < tolerance * (1 - alpha):
+            break
+        product = direction - alpha * (matrix @ direction)
+        step = norm / (direction @ product)
+        z += step * direction
+        residual -= step * product
+        new_norm = residual @ residual
+        direction = residual + (new_norm / norm) * direction
+        norm = new_norm
+    scores[rows] = z / sqrt_degree
+    return scores, iterations
+
+
+def _lookup(rows, values, keys, fallback=None):
+    """values for keys found in the sorted rows, else fallback[keys] (or 0)"""
+    if fallback is None:
+        result = np.zeros(len(keys))
+    else:
+        result = np.nan_to_num(np.asarray(fallback[keys], dtype=np.float64))
+    pos = np.minimum(np.searchsorted(rows, keys), max(len(rows) - 1, 0))
+    found = (rows[pos] == keys) if len(rows) else np.zeros(len(keys), dtype=bool)
+    result[found] = values[pos[found]]
+    return result
+
+
+def _merge(rows, values, keys, new_values):
+    """Sorted (rows, values) with keys set to new_values (keys unique)"""
+    merged = np.union1d(rows, keys)
+    merged_values = np.empty(len(merged))
+    merged_values[np.searchsorted(merged, rows)] = values
+    merged_values[np.searchsorted(merged, keys)] = new_values
+    return merged, merged_values
+
+
+def _weighted_degree(graph, rows):
+    owners, neighbors, edge_ids = graph.adjacency(rows)
+    weight = np.where(owners == neighbors, 0.0, np.asarray(graph.weight[edge_ids], dtype=np.float64))
+    return np.bincount(np.searchsorted(rows, owners), weights=weight, minlength=len(rows))
+
+
+def propagate_changes(graph, scores, labels, rows, alpha=ALPHA, tolerance=TOLERANCE,
+                      max_rounds=MAX_ITERATIONS):
+    """Graph scores after the edges or labels of rows changed; returns (rows, scores) to write
+
+    Only the equations of the changed rows differ, so the scores are
+    repaired by pushing their residuals to neighbors until every residual
+    is below tolerance, touching only the part of the graph the change
+    reaches rather than iterating over all merchants.
+    """
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    done_rows, done_values = np.empty(0, dtype=np.int64), np.empty(0)
+    if len(rows) == 0:
+        return done_rows, done_values
+    labels = np.asarray(labels)
+
+    # Residual of every changed row: its equation's right-hand side minus its score
+    owners, neighbors, edge_ids = graph.adjacency(rows)
+    weight = np.where(owners == neighbors, 0.0, np.asarray(graph.weight[edge_ids], dtype=np.float64))
+    owner_pos = np.searchsorted(rows, owners)
+    degree = np.bincount(owner_pos, weights=weight, minlength=len(rows))
+    neighbor_sum = np.bincount(owner_pos, weights=weight * np.nan_to_num(scores[neighbors]), minlength=len(rows))
+    own_label = labels[rows].astype(np.float64)
+    rhs = np.where(degree > 0, alpha * neighbor_sum / np.where(degree > 0, degree, 1.0) + (1 - alpha) * own_label,
+                   own_label)
+    residual = rhs - np.nan_to_num(np.asarray(scores[rows], dtype=np.float64))
+    pending_rows, pending = rows, residual
+
+    for _ in range(max_rounds):
+        active = np.abs(pending) >= tolerance
+        if not active.any():
+            break
+        active_rows, delta = pending_rows[active], pending[active]
+        pending_rows, pending = pending_rows[~active], pending[~active]
+        done_rows, done_values = _merge(done_rows, done_values, active_rows,
+                                        _lookup(done_rows, done_values, active_rows, scores) + delta)
+
+        # Neighbor v of u gains alpha * w_uv / degree_v of u's residual
+        owners, neighbors, edge_ids = graph.adjacency(active_rows)
+        loop = owners == neighbors
+        owners, neighbors, edge_ids = owners[~loop], neighbors[~loop], edge_ids[~loop]
+        if len(neighbors) == 0:
+            continue
+        targets, inverse = np.unique(neighbors, return_inverse=True)
+        degree = _weighted_degree(graph, targets)
+        degree[degree == 0] = 1.0
+        gain = (alpha * np.asarray(graph.weight[edge_ids], dtype=np.float64) / degree[inverse]
+                * delta[np.searchsorted(active_rows, owners)])
+        gain = np.bincount(inverse, weights=gain, minlength=len(targets))
+        carried = _lookup(pending_rows, pending, targets)
+        pending_rows, pending = _merge(pending_rows, pending, targets, carried + gain)
+    return done_rows, done_values
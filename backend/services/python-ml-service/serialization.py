@@ -0,0 +1,123 @@
+import gzip
+import math
+
+import numpy as np
+from flask import g, has_app_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Content codings offered by compress(), preferred first on equal quality
+ENCODINGS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def fast_dumps(obj, default):
+    """obj as compact, key-sorted JSON bytes encoded by orjson, or None
+
+    NaN and infinity are written as null. Returns None when orjson is not
+    installed or cannot encode obj (e.g. integers beyond 64 bits or
+    non-string keys); callers then use json.dumps().
+    """
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_SORT_KEYS
+                            | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+    except TypeError:
+        return None
+
+
+def finite_floats(obj):
+    """obj with NaN and infinite floats in dicts, lists and tuples replaced by None"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: finite_floats(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [finite_floats(value) for value in obj]
+    return obj
+
+
+def use_fast_json():
+    """Have FastJSONProvider encode the current request's responses with orjson"""
+    g.fast_json = True
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that can encode responses with orjson
+
+    By default responses are byte-for-byte those of Flask's default provider
+    (sorted keys, compact separators, ASCII escapes, trailing newline).
+    Requests that opted in with use_fast_json() are encoded by orjson
+    instead: same keys and layout, but orjson's number formatting (e.g. 1e-5
+    for 1e-05) and UTF-8 text. NaN and infinity are written as null either way.
+    """
+
+    def dumps(self, obj, **kwargs):
+        """json.dumps() with NaN and infinity written as null"""
+        try:
+            return super().dumps(obj, allow_nan=False, **kwargs)
+        except ValueError:
+            return super().dumps(finite_floats(obj), **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not (has_app_context() and g.get('fast_json')) or not self.sort_keys \
+                or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = fast_dumps(obj, self.default)
+        if body is None:
+            return super().response(obj)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def negotiate_encoding(accept_encodings):
+    """The supported content coding the client accepts with the highest quality, or None"""
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, level=6):
+    """body compressed with a content coding from ENCODINGS"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return gzip.compress(body, compresslevel=level)
+
+
+def columnar_graph(store, graph, rows, fields, edge_ids):
+    """Nodes and edges in the columnar format, straight from the store and graph arrays
+
+    ``nodes`` maps each field to the values of all rows (parallel arrays);
+    ``edges`` holds parallel source, target, weight and reason arrays, where
+    source/target are positions in rows and reason indexes ``reasons``.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    by_row = np.argsort(rows, kind='stable')
+    sorted_rows = rows[by_row]
+
+    def position(ends):
+        return by_row[np.searchsorted(sorted_rows, ends)].tolist()
+
+    return {
+        'nodes': store.gather(rows, fields),
+        'edges': {
+            'source': position(graph.src[edge_ids]),
+            'target': position(graph.dst[edge_ids]),
+            'weight': graph.weight[edge_ids].tolist(),
+            'reason': graph.reason[edge_ids].tolist()
+        },
+        'reasons': graph.reasons.tolist()
+    }
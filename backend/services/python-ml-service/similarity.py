@@ -0,0 +1,284 @@
+import copy
+
+import numpy as np
+
+
+def normalize_rows(vectors):
+    """L2-normalize rows as contiguous float32; zero rows stay zero (like sklearn)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+def top_k(scores, k):
+    """Positions of the k largest scores, best first (argpartition + small sort)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_rows(scores, k, block=256):
+    """Column positions of the k largest scores in every row, best first
+
+    The k-th largest of the per-block row maxima is a lower bound on each
+    row's k-th largest score, so only the few entries above it are sorted.
+    """
+    n_rows, n_cols = scores.shape
+    n_blocks = n_cols // block
+    if n_blocks < k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(best, order, axis=1)
+
+    maxima = scores[:, :n_blocks * block].reshape(n_rows, n_blocks, block).max(axis=2)
+    threshold = np.partition(maxima, n_blocks - k, axis=1)[:, n_blocks - k]
+    row_ids, col_ids = np.nonzero(scores >= threshold[:, None])
+    order = np.lexsort((-scores[row_ids, col_ids], row_ids))
+    row_ids, col_ids = row_ids[order], col_ids[order]
+    rank = np.arange(len(row_ids)) - np.searchsorted(row_ids, np.arange(n_rows))[row_ids]
+    return col_ids[rank < k].reshape(n_rows, k)
+
+
+class FraudSimilarityIndex:
+    """Cosine-similarity index over the embeddings of fraud merchants
+
+    Vectors are normalized once, so cosine similarity is a single dot product.
+    ``mode='exact'`` scores every fraud merchant; ``mode='ivf'`` clusters the
+    vectors with spherical k-means and only scores the ``n_probe`` clusters
+    closest to the query. ``updated`` returns a copy with fraud merchants
+    added or removed, so searches in flight keep a consistent index.
+    """
+
+    def __init__(self, rows, embeddings, mode='exact', n_lists=None, n_probe=8, seed=42):
+        self.rows = np.sort(np.asarray(rows, dtype=np.int64))
+        self.vectors = normalize_rows(embeddings[self.rows])
+        self.mode = mode
+        self.n_probe = n_probe
+
+        self.centroids = None
+        if mode == 'ivf' and len(self.rows) > 0:
+            n_lists = n_lists or max(1, int(np.sqrt(len(self.rows))))
+            self._build_ivf(n_lists, np.random.default_rng(seed))
+        elif mode != 'exact':
+            self.mode = 'exact'
+
+    def __len__(self):
+        return len(self.rows)
+
+    def to_arrays(self):
+        """Index arrays keyed by name, for writing a snapshot"""
+        arrays = {'rows': self.rows, 'vectors': self.vectors}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, list_labels=self.list_labels,
+                          list_order=self.list_order, list_offsets=self.list_offsets)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, n_probe=8):
+        """Rebuild an index from to_arrays() output (arrays may be memory-mapped)"""
+        index = cls.__new__(cls)
+        index.rows = arrays['rows']
+        index.vectors = arrays['vectors']
+        index.n_probe = n_probe
+        index.centroids = arrays.get('centroids')
+        index.mode = 'ivf' if index.centroids is not None else 'exact'
+        if index.centroids is not None:
+            index.list_labels = arrays['list_labels']
+            index.list_order = arrays['list_order']
+            index.list_offsets = arrays['list_offsets']
+        return index
+
+    def position_of(self, row):
+        """Position of a merchant row in the index (rows are sorted), or None"""
+        pos = int(np.searchsorted(self.rows, row))
+        if pos < len(self.rows) and self.rows[pos] == row:
+            return pos
+        return None
+
+    def _assign(self, vectors, chunk_size=65536):
+        """Nearest centroid of each vector, computed in chunks"""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            block = vectors[start:start + chunk_size]
+            labels[start:start + chunk_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def _build_ivf(self, n_lists, rng, iterations=10, sample_per_list=256):
+        """Train spherical k-means on a sample and bucket every vector"""
+        n_lists = min(n_lists, len(self.vectors))
+        sample_size = min(len(self.vectors), n_lists * sample_per_list)
+        sample = self.vectors[rng.choice(len(self.vectors), size=sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = self.centroids[empty]
+            self.centroids = normalize_rows(sums)
+
+        self._set_lists(self._assign(self.vectors))
+
+    def _set_lists(self, labels):
+        """Bucket index positions by their cluster label"""
+        self.list_labels = labels
+        self.list_order = np.argsort(labels, kind='stable')
+        self.list_offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(self.centroids)), out=self.list_offsets[1:])
+
+    def updated(self, embeddings, add_rows=(), remove_rows=()):
+        """Copy of the index with merchant rows added and removed
+
+        IVF centroids are kept; added vectors go to their nearest cluster.
+        """
+        rows, vectors = self.rows, self.vectors
+        labels = self.list_labels if self.centroids is not None else None
+
+        remove_rows = np.asarray(remove_rows, dtype=np.int64)
+        if len(remove_rows):
+            keep = ~np.isin(rows, remove_rows)
+            rows, vectors = rows[keep], vectors[keep]
+            labels = labels[keep] if labels is not None else None
+
+        add_rows = np.setdiff1d(np.asarray(add_rows, dtype=np.int64), rows)
+        if len(add_rows):
+            new_vectors = normalize_rows(embeddings[add_rows])
+            pos = np.searchsorted(rows, add_rows)
+            rows = np.insert(rows, pos, add_rows)
+            vectors = np.insert(vectors, pos, new_vectors, axis=0)
+            if labels is not None:
+                labels = np.insert(labels, pos, self._assign(new_vectors))
+
+        index = copy.copy(self)
+        index.rows, index.vectors = rows, vectors
+        if labels is not None:
+            index._set_lists(labels)
+        return index
+
+    def _candidates(self, query, n_probe):
+        """Index positions in the n_probe clusters closest to the query"""
+        lists = top_k(self.centroids @ query, n_probe)
+        return np.concatenate([
+            self.list_order[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists
+        ])
+
+    def positions_of(self, rows):
+        """Index positions of those of the (ascending) merchant rows that are in the index"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self.rows) == 0:
+            return np.empty(0, dtype=np.int64)
+        if len(rows) * 16 > len(self.rows):
+            # Many rows: marking them is cheaper than a binary search each
+            last = int(self.rows[-1])
+            marked = np.zeros(last + 1, dtype=bool)
+            marked[rows[rows <= last]] = True
+            return np.flatnonzero(marked[self.rows])
+        pos = np.minimum(np.searchsorted(self.rows, rows), len(self.rows) - 1)
+        return pos[self.rows[pos] == rows]
+
+    def search(self, embedding, k=10, exclude_row=None, exact=False, candidates=None):
+        """Top-k fraud merchants by cosine similarity: (merchant rows, scores)
+
+        candidates (ascending merchant rows, e.g. from FraudFilterIndex)
+        restricts the search to those fraud merchants; only their vectors
+        are scored. With IVF, a block larger than the clusters a query
+        probes is intersected with the probed clusters instead, falling
+        back to scoring the block if that leaves fewer than k.
+        """
+        if len(self.rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = normalize_rows(np.asarray(embedding).reshape(1, -1))[0]
+        allowed = None if candidates is None else self.positions_of(candidates)
+        positions = allowed
+        if self.mode == 'ivf' and not exact:
+            probed_size = len(self.rows) * self.n_probe / len(self.centroids)
+            if allowed is None or len(allowed) > probed_size:
+                positions = self._candidates(query, self.n_probe)
+                if allowed is not None:
+                    mask = np.zeros(len(self.rows), dtype=bool)
+                    mask[allowed] = True
+                    positions = positions[mask[positions]]
+                    if len(positions) <= k:
+                        positions = allowed
+
+        if positions is None:
+            scores = self.vectors @ query
+        elif len(positions) * 8 > len(self.rows):
+            # A large block: one product over all vectors beats gathering it
+            scores = (self.vectors @ query)[positions]
+        else:
+            scores = self.vectors[positions] @ query
+
+        excluded = None if exclude_row is None else self.position_of(exclude_row)
+        if excluded is not None:
+            hit = excluded if positions is None else np.flatnonzero(positions == excluded)
+            if np.size(hit):
+                scores[hit] = -np.inf
+                k = min(k, len(scores) - 1)
+
+        best = top_k(scores, k)
+        found = best if positions is None else positions[best]
+        return self.rows[found], scores[best]
+
+    def search_batch(self, embeddings, k=10, exclude_rows=None, max_block_elements=1 << 24, candidates=None):
+        """Exact top-k for many queries, one matrix product per block of queries
+
+        Yields (start, rows, scores) per block, where rows and scores have shape
+        (block, k). Blocks are sized so a score block holds at most
+        max_block_elements floats; excluded or missing slots have score -inf.
+        candidates (ascending merchant rows) restricts every query to those
+        fraud merchants, scoring only their vectors.
+        """
+        queries = normalize_rows(embeddings)
+        if candidates is None:
+            index_rows, index_vectors = self.rows, self.vectors
+        else:
+            positions = self.positions_of(candidates)
+            index_rows, index_vectors = self.rows[positions], self.vectors[positions]
+        k = min(k, len(index_rows))
+        block = max(1, max_block_elements // max(1, len(index_rows)))
+
+        for start in range(0, len(queries), block):
+            if k == 0:
+                empty = (len(queries[start:start + block]), 0)
+                yield start, np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+                continue
+
+            scores = queries[start:start + block] @ index_vectors.T
+
+            if exclude_rows is not None:
+                excluded = np.asarray(exclude_rows[start:start + block], dtype=np.int64)
+                pos = np.minimum(np.searchsorted(index_rows, excluded), len(index_rows) - 1)
+                hit = np.flatnonzero(index_rows[pos] == excluded)
+                scores[hit, pos[hit]] = -np.inf
+
+            if k < scores.shape[1]:
+                best = top_k_rows(scores, k)
+            else:
+                best = np.argsort(-scores, axis=1, kind='stable')
+
+            yield start, index_rows[best], np.take_along_axis(scores, best, axis=1)
+
+    def recall(self, k=10, sample_size=200, seed=0):
+        """Mean recall@k of the configured search against exact search"""
+        if self.mode == 'exact' or len(self.rows) == 0:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(len(self.rows), size=min(sample_size, len(self.rows)), replace=False)
+        hits = 0
+        total = 0
+        for pos in queries.tolist():
+            row = int(self.rows[pos])
+            expected, _ = self.search(self.vectors[pos], k, exclude_row=row, exact=True)
+            found, _ = self.search(self.vectors[pos], k, exclude_row=row)
+            hits += len(np.intersect1d(expected, found))
+            total += len(expected)
+        return hits / total if total else 1.0
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+
+# Bump whenever the set, names or meaning of snapshot arrays change
+FORMAT_VERSION = 5
+
+MANIFEST = 'manifest.json'
+
+
+def csv_fingerprint(*paths):
+    """Source fingerprint for CSV inputs: size and modification time of each file"""
+    fingerprint = {}
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint[os.path.basename(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return fingerprint
+
+
+def db_fingerprint(conn):
+    """Source fingerprint for PostgreSQL: row counts, max ids and a label checksum"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*), MAX(merchant_id), COALESCE(SUM(is_fraud), 0), "
+            "COALESCE(SUM(hashtext(merchant_id || ':' || COALESCE(is_fraud, 0))::bigint), 0) "
+            "FROM merchants"
+        )
+        merchants, max_merchant_id, fraud_count, label_checksum = cur.fetchone()
+        cur.execute("SELECT COUNT(*), MAX(id) FROM merchant_edges")
+        edges, max_edge_id = cur.fetchone()
+    return {
+        'merchants': int(merchants),
+        'max_merchant_id': max_merchant_id,
+        'fraud_merchants': int(fraud_count),
+        'label_checksum': int(label_checksum),
+        'edges': int(edges),
+        'max_edge_id': max_edge_id
+    }
+
+
+def save(path, fingerprint, arrays, meta=None):
+    """Write arrays as .npy files plus a manifest, replacing any previous snapshot
+
+    path is a symlink to a directory named after it and the write time. The
+    snapshot is written to a new directory and the symlink is replaced
+    atomically, so path exists at all times and readers never see a
+    partially written snapshot.
+    """
+    path = os.path.abspath(path)
+    target = f"{path}.{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+
+    entries = {}
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        np.save(os.path.join(target, f'{name}.npy'), values, allow_pickle=False)
+        entries[name] = {'dtype': values.dtype.str, 'shape': list(values.shape)}
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'fingerprint': fingerprint,
+        'arrays': entries,
+        'meta': meta or {}
+    }
+    with open(os.path.join(target, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and previous is None:
+        # A snapshot directory written before path became a symlink
+        previous = f'{path}.old-{os.getpid()}'
+        os.rename(path, previous)
+    link = f'{path}.link-{os.getpid()}'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)
+    os.replace(link, path)
+    if previous is not None and previous != target:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def read_manifest(path):
+    """Manifest of the snapshot at path, or None if there is none"""
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load(path, fingerprint=None):
+    """Memory-map a snapshot if it matches the format version and source fingerprint
+
+    Returns (arrays, meta), or None when the snapshot is missing or stale.
+    With fingerprint=None the source is not checked (the caller trusts the
+    snapshot, e.g. server workers mapping what the master process prepared).
+    """
+    # Resolve the symlink once, so a concurrent save() cannot mix two snapshots
+    path = os.path.realpath(path)
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    if manifest.get('format_version') != FORMAT_VERSION:
+        print(f"Snapshot format {manifest.get('format_version')} != {FORMAT_VERSION}, ignoring")
+        return None
+    # Round-trip through JSON so both sides compare with the same types
+    if fingerprint is not None and manifest.get('fingerprint') != json.loads(json.dumps(fingerprint, default=str)):
+        print("Snapshot is stale (source fingerprint changed)")
+        return None
+
+    arrays = {}
+    for name, entry in manifest['arrays'].items():
+        values = np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+        if values.dtype.str != entry['dtype'] or list(values.shape) != entry['shape']:
+            print(f"Snapshot array {name} does not match its manifest, ignoring snapshot")
+            return None
+        arrays[name] = values
+    return arrays, manifest['meta']
@@ -0,0 +1,209 @@
+"""Live updates: incremental state vs full recomputation, journal replay and snapshots
+
+Runs on a small dataset from ML/datagen: python -m pytest tests
+"""
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(SERVICE_DIR)))
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'ML'))
+
+import risk_scores  # noqa: E402
+from fraud_filters import FraudFilterIndex  # noqa: E402
+from ring_stats import RingStats  # noqa: E402
+from similarity import FraudSimilarityIndex  # noqa: E402
+
+N_MERCHANTS = 5000
+UPDATE_ROUNDS = 30
+
+
+def service_instance(name, snapshot_dir):
+    """A separate copy of the app module, standing in for one server worker"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SERVICE_DIR, 'app.py'))
+    service = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(service)
+    service.SNAPSHOT_DIR = str(snapshot_dir)
+
+    def no_database():
+        raise ConnectionError('no database in tests')
+
+    service.get_db_connection = no_database
+    return service
+
+
+def ring_sets(service):
+    """Live rings as {ring_id: frozenset of member rows}"""
+    rings = service.ring_index
+    return {rings.ring_ids[r]: frozenset(rings.members(r).tolist())
+            for r in range(len(rings.ring_ids)) if rings.sizes[r] > 0}
+
+
+def random_updates(client, service, rng):
+    """New merchants, then random edge adds and label flips through the API"""
+    new = [{'merchant_id': f'NEW_{i}', 'is_fraud': i % 2, 'business_city': 'City_1',
+            'chargeback_rate': 0.1, 'embedding': rng.normal(size=16).tolist()} for i in range(20)]
+    response = client.post('/api/merchants', json={'merchants': new})
+    assert response.status_code == 200, response.get_json()
+
+    store = service.merchant_store
+    for _ in range(UPDATE_ROUNDS):
+        n = len(store)
+        fraud = store.fraud_indices()
+        if rng.random() < 0.5:
+            src = np.concatenate([rng.choice(fraud, 4), rng.integers(0, n, 4)])
+            dst = np.concatenate([rng.choice(fraud, 4), rng.integers(0, n, 4)])
+            edges = [{'merchant_a': str(store.merchant_ids[a]), 'merchant_b': str(store.merchant_ids[b]),
+                      'weight': int(rng.integers(1, 4)), 'reason': str(rng.choice(['PAN', 'IP', 'PHONE']))}
+                     for a, b in zip(src.tolist(), dst.tolist())]
+            response = client.post('/api/edges', json={'edges': edges})
+        else:
+            # Un-flag members of the largest ring now and then, to force splits
+            rings = service.ring_index
+            if rng.random() < 0.3:
+                rows = rng.choice(rings.members(int(np.argmax(rings.sizes))), 2)
+                flag = 0
+            else:
+                rows = rng.integers(0, n, 4)
+                flag = int(rng.integers(0, 2))
+            labels = [{'merchant_id': str(store.merchant_ids[row]), 'is_fraud': flag} for row in rows.tolist()]
+            response = client.post('/api/merchants/labels', json={'labels': labels})
+        assert response.status_code == 200, response.get_json()
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    from datagen.generator import generate
+
+    data_dir = tmp_path_factory.mktemp('data')
+    generate(str(data_dir), N_MERCHANTS, seed=7, workers=1, embedding_method='clustered')
+    return data_dir
+
+
+@pytest.fixture(scope='module')
+def workers(dataset):
+    """(writer, early reader): both map the same snapshot, then the writer takes updates"""
+    cwd = os.getcwd()
+    os.chdir(dataset)
+    try:
+        writer = service_instance('app_writer', dataset / 'snapshot')
+        writer.load_data()
+        reader = service_instance('app_reader', dataset / 'snapshot')
+        reader.load_shared_data()
+        assert reader.data_source == 'csv' and reader.data_ready
+
+        random_updates(writer.app.test_client(), writer, np.random.default_rng(0))
+        yield writer, reader
+    finally:
+        os.chdir(cwd)
+
+
+def assert_same_state(actual, expected):
+    """Merchant columns, graph, rings, ring statistics and indexes of two instances match"""
+    assert len(actual.merchant_store) == len(expected.merchant_store)
+    for name, values in expected.merchant_store.to_arrays().items():
+        np.testing.assert_array_equal(actual.merchant_store.to_arrays()[name], values, err_msg=name)
+    assert actual.graph.n_edges == expected.graph.n_edges
+    assert ring_sets(actual) == ring_sets(expected)
+    np.testing.assert_array_equal(actual.similarity_index.rows, expected.similarity_index.rows)
+    # Ring numbers differ once a snapshot drops emptied rings, so rings are matched by id
+    ring_ids = sorted(ring_sets(expected))
+    actual_nos = [actual.ring_index.ring_numbers[ring_id] for ring_id in ring_ids]
+    expected_nos = [expected.ring_index.ring_numbers[ring_id] for ring_id in ring_ids]
+    for name, values in expected.ring_stats.columns.items():
+        np.testing.assert_allclose(actual.ring_stats.columns[name][actual_nos], values[expected_nos], err_msg=name)
+
+
+def test_incremental_state_matches_full_recompute(workers):
+    writer, _ = workers
+    store, graph = writer.merchant_store, writer.graph
+
+    ring_ids, offsets, members = writer.find_fraud_rings()
+    fresh = {ring_id: frozenset(members[offsets[i]:offsets[i + 1]].tolist()) for i, ring_id in enumerate(ring_ids)}
+    assert ring_sets(writer) == fresh
+
+    # Ring statistics of every live ring, as computed from scratch
+    stats = RingStats(writer.ring_index, store, graph)
+    live = writer.ring_index.sizes > 0
+    for name, values in stats.columns.items():
+        np.testing.assert_allclose(writer.ring_stats.columns[name][live], values[live], err_msg=name)
+    for name, (codes, counts) in stats.mix.items():
+        np.testing.assert_array_equal(writer.ring_stats.mix[name][1][live], counts[live], err_msg=name)
+    for ring_no in np.flatnonzero(live).tolist():
+        assert set(writer.ring_stats.central(ring_no).tolist()) == set(stats.central(ring_no).tolist())
+
+    # Similarity and filter indexes follow the labels
+    fraud_rows = store.fraud_indices()
+    np.testing.assert_array_equal(writer.similarity_index.rows, fraud_rows)
+    exact = FraudSimilarityIndex(fraud_rows, store.embeddings)
+    for row in fraud_rows[:20].tolist():
+        assert (writer.similarity_index.search(store.embeddings[row], exclude_row=row, exact=True)[0].tolist()
+                == exact.search(store.embeddings[row], exclude_row=row)[0].tolist())
+    filters = {'city': store.code_of('city', 'Mumbai')}
+    expected = FraudFilterIndex(store, fraud_rows).candidates(filters)
+    np.testing.assert_array_equal(np.intersect1d(writer.fraud_filters.candidates(filters), fraud_rows), expected)
+
+    # Risk scores within the propagation tolerance of an exact solve
+    scores, _ = risk_scores.graph_scores(graph, store.columns['is_fraud'], writer.RISK_ALPHA,
+                                         tolerance=1e-9, max_iterations=1000)
+    np.testing.assert_allclose(store.columns['graph_risk'], scores, atol=5e-3)
+    blended = risk_scores.blend(scores, risk_scores.feature_scores(store.columns, writer.risk_scales),
+                                writer.RISK_GRAPH_WEIGHT)
+    np.testing.assert_allclose(store.columns['risk_score'], blended, atol=5e-3)
+
+
+def test_journal_replay_matches_writer(workers, dataset):
+    writer, reader = workers
+
+    # A worker that was running picks the updates up on its next request
+    assert reader.app.test_client().get('/api/rings').status_code == 200
+    assert_same_state(reader, writer)
+
+    # A worker started afterwards replays them on top of the snapshot
+    cwd = os.getcwd()
+    os.chdir(dataset)
+    try:
+        late = service_instance('app_late_reader', dataset / 'snapshot')
+        late.load_shared_data()
+    finally:
+        os.chdir(cwd)
+    assert_same_state(late, writer)
+
+    body = writer.app.test_client().get('/api/top-fraud-rings').get_data()
+    assert reader.app.test_client().get('/api/top-fraud-rings').get_data() == body
+    assert late.app.test_client().get('/api/top-fraud-rings').get_data() == body
+
+
+def test_snapshot_round_trip(workers, dataset, tmp_path):
+    writer, _ = workers
+    snapshot_dir, journal = writer.SNAPSHOT_DIR, writer.journal
+    try:
+        writer.SNAPSHOT_DIR = str(tmp_path / 'snapshot')
+        writer.save_snapshot(writer.data_fingerprint)
+    finally:
+        writer.SNAPSHOT_DIR, writer.journal = snapshot_dir, journal
+
+    # A start-up against unchanged source files maps the snapshot (a rebuild
+    # from the CSV files would miss the live updates)
+    restored = service_instance('app_restored', tmp_path / 'snapshot')
+    cwd = os.getcwd()
+    os.chdir(dataset)
+    try:
+        restored.load_data()
+    finally:
+        os.chdir(cwd)
+    assert_same_state(restored, writer)
+    for name, values in writer.graph.to_arrays().items():
+        np.testing.assert_array_equal(restored.graph.to_arrays()[name], values, err_msg=name)
+    for name, values in writer.similarity_index.to_arrays().items():
+        np.testing.assert_array_equal(restored.similarity_index.to_arrays()[name], values, err_msg=name)
+
+    client, restored_client = writer.app.test_client(), restored.app.test_client()
+    merchant_ids = writer.merchant_store.merchant_ids[writer.merchant_store.fraud_indices()[:10]].tolist()
+    for url in ['/api/top-fraud-rings', '/api/rings?limit=50'] + [f'/api/merchant/{m}' for m in merchant_ids]:
+        assert restored_client.get(url).get_data() == client.get(url).get_data(), url
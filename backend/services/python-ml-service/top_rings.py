@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TopRingsCache:
+    """Materialized /api/top-fraud-rings responses for one data version
+
+    Each ring's display slice (nodes in the order of ``ring_members``, by
+    default ring member order; edges ordered by the position of their later
+    endpoint) is built once, so any ``max_nodes`` / ``max_edges`` view is a
+    prefix of it. Encoded responses are gzip
+    compressed and cached per query parameters with a weak ETag.
+    Columnar views (parallel node arrays, edges by node position) are built
+    by ``columnar_builder`` from the same member order instead.
+
+    When rings change, ``invalidate`` drops only their slices and the cached
+    pages that show them or whose ring order moved.
+    """
+
+    def __init__(self, version, ring_index, slice_builder, encoder,
+                 max_nodes_cap=1000, slice_cache_size=256, response_cache_size=64, ring_members=None,
+                 columnar_builder=None):
+        self.version = version
+        self.ring_index = ring_index
+        self.ring_members = ring_members or ring_index.members
+        self.slice_builder = slice_builder
+        self.columnar_builder = columnar_builder
+        self.encoder = encoder
+        self.max_nodes_cap = max_nodes_cap
+        self.ring_order = self._order()
+        self.slice_cache_size = slice_cache_size
+        self.response_cache_size = response_cache_size
+        self._slices = OrderedDict()
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate() so entries built from older data are not cached
+        self._generation = 0
+
+    def cached_bytes(self):
+        """Total size of the cached gzip response bodies"""
+        with self._lock:
+            return sum(len(body) for _, body, _ in self._responses.values())
+
+    def _order(self):
+        """Live rings, largest first; ties keep ring order"""
+        sizes = self.ring_index.sizes
+        order = np.argsort(-sizes, kind='stable')
+        return order[sizes[order] > 0]
+
+    def invalidate(self, ring_nos):
+        """Forget cached data of changed rings and of pages they affect"""
+        changed = set(ring_nos)
+        if not changed:
+            return
+        ring_order = self._order()
+        with self._lock:
+            self.ring_order = ring_order
+            self._generation += 1
+            for ring_no in changed:
+                self._slices.pop(ring_no, None)
+            for key, (_, _, page) in list(self._responses.items()):
+                limit, offset = key[:2]
+                if changed.intersection(page) or page != tuple(ring_order[offset:offset + limit].tolist()):
+                    del self._responses[key]
+
+    def ring_slice(self, ring_no):
+        """(nodes, edges, edge_ranks) for a ring, capped at max_nodes_cap members"""
+        with self._lock:
+            if ring_no in self._slices:
+                self._slices.move_to_end(ring_no)
+                return self._slices[ring_no]
+            generation = self._generation
+
+        member_idx = self.ring_members(ring_no)[:self.max_nodes_cap]
+        nodes, edges, ranks = self.slice_builder(member_idx)
+        order = np.argsort(ranks, kind='stable')
+        ring_slice = (nodes, [edges[i] for i in order], np.asarray(ranks)[order])
+
+        with self._lock:
+            if generation != self._generation:
+                return ring_slice
+            self._slices[ring_no] = ring_slice
+            while len(self._slices) > self.slice_cache_size:
+                self._slices.popitem(last=False)
+        return ring_slice
+
+    def build(self, limit, offset, max_nodes, max_edges, page=None, columnar=False):
+        """Response payload for one page of rings"""
+        if page is None:
+            page = self.ring_order[offset:offset + limit].tolist()
+        return {
+            'success': True,
+            'rings': [self.ring_view(ring_no, max_nodes, max_edges, columnar) for ring_no in page]
+        }
+
+    def ring_view(self, ring_no, max_nodes, max_edges, columnar=False):
+        """The first max_nodes members of a ring's slice and up to max_edges edges between them"""
+        size = int(self.ring_index.sizes[ring_no])
+        if columnar:
+            member_idx = self.ring_members(ring_no)[:min(max_nodes, self.max_nodes_cap)]
+            view = {
+                'ring_id': self.ring_index.ring_ids[ring_no],
+                'size': size,
+                'displayed_size': len(member_idx),
+                'is_truncated': size > max_nodes
+            }
+            view.update(self.columnar_builder(member_idx, max_edges))
+            return view
+
+        nodes, edges, ranks = self.ring_slice(ring_no)
+        display_nodes = nodes[:max_nodes]
+        # Edges are sorted by rank, so those inside the displayed members form a prefix
+        edge_count = min(int(np.searchsorted(ranks, len(display_nodes))), max_edges)
+
+        return {
+            'ring_id': self.ring_index.ring_ids[ring_no],
+            'size': size,
+            'displayed_size': len(display_nodes),
+            'is_truncated': size > max_nodes,
+            'members': [node['merchant_id'] for node in display_nodes],
+            'nodes': display_nodes,
+            'edges': edges[:edge_count]
+        }
+
+    def response(self, limit=10, offset=0, max_nodes=100, max_edges=200, columnar=False):
+        """(etag, gzip body) for a page of rings, encoded once per parameter set"""
+        key = (limit, offset, max_nodes, max_edges, columnar)
+        with self._lock:
+            if key in self._responses:
+                self._responses.move_to_end(key)
+                return self._responses[key][:2]
+            generation = self._generation
+            page = tuple(self.ring_order[offset:offset + limit].tolist())
+
+        body = self.encoder(self.build(limit, offset, max_nodes, max_edges, page, columnar))
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        cached = (f'{self.version}-{digest}', gzip.compress(body, compresslevel=6), page)
+
+        with self._lock:
+            if generation != self._generation:
+                return cached[:2]
+            self._responses[key] = cached
+            while len(self._responses) > self.response_cache_size:
+                self._responses.popitem(last=False)
+        return cached[:2]
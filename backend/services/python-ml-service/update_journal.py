@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process only
+    fcntl = None
+
+
+class UpdateJournal:
+    """Append-only JSON-lines log of live updates, shared by server workers
+
+    Every worker maps the same snapshot and replays the journal entries it
+    has not applied yet, so an update received by one worker reaches all of
+    them. Writers hold an exclusive file lock while they validate and append.
+    The journal lives in the snapshot directory and is dropped with it when
+    the snapshot is rebuilt from the source.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def pending(self):
+        """True if the journal has entries this process has not read"""
+        try:
+            return os.stat(self.path).st_size > self.offset
+        except OSError:
+            return False
+
+    def read_new(self):
+        """Complete entries appended since the last call"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return []
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        return [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+
+    def append(self, entry):
+        """Append one entry (call inside locked(), after read_new())
+
+        The caller applies the entry itself, so it is not returned by a later
+        read_new() in this process.
+        """
+        with open(self.path, 'ab') as f:
+            start = f.tell()
+            f.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+            if start == self.offset:
+                self.offset = f.tell()
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock across threads and processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f'{self.path}.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,30 @@
+"""WSGI entry point for the production server (see gunicorn.conf.py)
+
+Each worker maps the snapshot prepared by the gunicorn master process, so the
+large read-only arrays are shared through the page cache instead of being
+loaded once per worker. The data is loaded in a background thread: the worker
+accepts connections right away and answers 503 (``/api/health``: "loading")
+until it is ready.
+"""
+import os
+import threading
+import traceback
+
+import app as service
+
+# Gunicorn's exit code for a worker that failed to boot (stops the master
+# instead of restarting the worker forever)
+WORKER_BOOT_ERROR = 3
+
+
+def load_in_background():
+    try:
+        service.load_shared_data()
+    except Exception:
+        traceback.print_exc()
+        os._exit(WORKER_BOOT_ERROR)
+
+
+threading.Thread(target=load_in_background, name='load-data', daemon=True).start()
+
+app = service.app